@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class DomainLimiter:
+    """Semáforo por dominio; se descarta cuando nadie lo usa."""
+    
+    def __init__(self, per_domain: int):
+        self.per_domain = per_domain
+        self._slots: Dict[str, Tuple[asyncio.Semaphore, int]] = {}
+    
+    @asynccontextmanager
+    async def slot(self, url: str):
+        domain = urlparse(url).netloc
+        semaphore, users = self._slots.get(domain, (None, 0))
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_domain)
+        self._slots[domain] = (semaphore, users + 1)
+        
+        try:
+            async with semaphore:
+                yield
+        finally:
+            semaphore, users = self._slots[domain]
+            if users == 1:
+                del self._slots[domain]
+            else:
+                self._slots[domain] = (semaphore, users - 1)
+    
+    @property
+    def active_domains(self) -> int:
+        return len(self._slots)
+
+
+async def run_batch(urls: Iterable[str],
+                    run: Callable[[str], Awaitable[Tuple[Dict[str, Any], int]]],
+                    concurrency: int = 10,
+                    per_domain: int = 2
+                    ) -> AsyncIterator[Tuple[int, str, Dict[str, Any], int]]:
+    """
+    Corre run(url) sobre todas las URLs con concurrencia acotada y va
+    entregando (index, url, body, status) en el orden en que terminan.
+    
+    Memoria constante: `concurrency` workers toman URLs del iterador a
+    medida que se liberan (no se crea una task por URL) y la cola de
+    salida está acotada, así un consumidor lento frena a los workers.
+    El cupo global entre batches lo toma run (ver run_scrape) una vez que
+    tiene el token de rate limit, no mientras lo espera.
+    """
+    source = iter(enumerate(urls))
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    domains = DomainLimiter(per_domain)
+    done = object()
+    
+    async def run_item(url) -> Tuple[Dict[str, Any], int]:
+        # Una entrada que no es string (JSON 5, null, un objeto) no tiene
+        # dominio: run la rechaza sin ocupar un slot
+        if not isinstance(url, str):
+            return await _run_one(run, url)
+        try:
+            async with domains.slot(url):
+                return await _run_one(run, url)
+        except Exception as e:
+            logger.error(f"Batch item {url} failed: {e}", exc_info=True)
+            return {"status": "error", "message": str(e), "url": url}, 500
+    
+    async def worker():
+        # Cada URL aislada: un error no termina el worker ni pierde las que siguen
+        for index, url in source:
+            body, status = await run_item(url)
+            await results.put((index, url, body, status))
+        # Cancelado no avisa: nadie está consumiendo
+        await results.put(done)
+    
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    finished = 0
+    
+    try:
+        while finished < len(workers):
+            item = await results.get()
+            if item is done:
+                finished += 1
+                continue
+            yield item
+    finally:
+        # El consumidor se fue (cliente desconectado) o terminó: liberar workers
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+async def _run_one(run, url: Any) -> Tuple[Dict[str, Any], int]:
+    try:
+        return await run(url)
+    except Exception as e:
+        logger.error(f"Batch item {url} failed: {e}", exc_info=True)
+        return {"status": "error", "message": str(e), "url": url}, 500
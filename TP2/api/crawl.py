@@ -0,0 +1,202 @@
+import math
+import asyncio
+import hashlib
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from api.batch import DomainLimiter
+from common.url_utils import normalize_url
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Conjunto aproximado de URLs ya vistas con memoria fija: nunca da falsos
+    negativos y los falsos positivos (una URL nueva que se saltea) quedan
+    por debajo de error_rate mientras no se superen `capacity` elementos.
+    """
+    
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    
+    def _positions(self, item: str):
+        # Doble hashing (Kirsch-Mitzenmacher): k posiciones con un solo digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+    
+    def add(self, item: str) -> bool:
+        """Agrega item; devuelve False si (probablemente) ya estaba."""
+        added = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                added = True
+        self.count += added
+        return added
+    
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position // 8] & (1 << (position % 8))
+            for position in self._positions(item)
+        )
+    
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._bits)
+
+
+# run(url) -> (body JSON, status HTTP), el mismo contrato que run_batch
+PageRunner = Callable[[str], Awaitable[Tuple[Dict[str, Any], int]]]
+
+# Campo interno del body con todos los links de la página; si falta se
+# usan los de scraping_data. Se quita antes de entregar la página.
+ALL_LINKS = '_all_links'
+
+
+class Crawler:
+    """
+    Crawl BFS a partir de una URL siguiendo los links que extrae el parser.
+    
+    - Frontier: asyncio.Queue de (url, depth); nunca tiene más de max_pages
+      URLs porque solo se encola lo que se va a visitar.
+    - Dedup: URLs normalizadas en un BloomFilter de tamaño fijo.
+    - Cortesía: por dominio como mucho per_domain scrapes a la vez; el
+      ritmo lo fija el RateLimiter que aplica run (run_scrape espera su token
+      y recién entonces toma el cupo global).
+    
+    crawl() es un async generator: entrega cada página apenas se scrapea.
+    """
+    
+    def __init__(self, run: PageRunner, max_depth: int = 2, max_pages: int = 100,
+                 same_domain: bool = True, concurrency: int = 5, per_domain: int = 2,
+                 seen_capacity: Optional[int] = None):
+        self.run = run
+        self.max_depth = max(0, max_depth)
+        self.max_pages = max(1, max_pages)
+        self.same_domain = same_domain
+        self.concurrency = max(1, concurrency)
+        self.domains = DomainLimiter(max(1, per_domain))
+        # Cada página aporta hasta ~100 links: dimensionar para eso
+        self.seen = BloomFilter(seen_capacity or self.max_pages * 100)
+        
+        self.scheduled = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.discovered = 0
+        self.duplicates = 0
+        self.off_domain = 0
+        self.over_limit = 0
+        self.invalid = 0
+    
+    async def crawl(self, start_url: str) -> AsyncIterator[Dict[str, Any]]:
+        start = normalize_url(start_url)
+        root_host = urlsplit(start).hostname
+        
+        frontier: asyncio.Queue = asyncio.Queue()
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+        done = object()
+        
+        self.seen.add(start)
+        self.scheduled = 1
+        frontier.put_nowait((start, 0))
+        
+        async def worker():
+            while True:
+                url, depth = await frontier.get()
+                try:
+                    body, status = await self._visit(url)
+                    links = body.pop(ALL_LINKS, None)
+                    if status == 200:
+                        self.succeeded += 1
+                        if depth < self.max_depth:
+                            try:
+                                if links is None:
+                                    links = body.get('scraping_data', {}).get('links', [])
+                                self._enqueue_links(links, depth + 1, root_host, frontier)
+                            except Exception as e:
+                                # La página ya se scrapeó: se entrega igual
+                                logger.error(f"Crawl links of {url} failed: {e}", exc_info=True)
+                    else:
+                        self.failed += 1
+                    await results.put({"url": url, "depth": depth, "status_code": status, "result": body})
+                finally:
+                    frontier.task_done()
+        
+        async def finish():
+            # Frontier vacío y sin páginas en curso: no puede aparecer nada nuevo
+            await frontier.join()
+            await results.put(done)
+        
+        tasks = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        tasks.append(asyncio.create_task(finish()))
+        
+        try:
+            while True:
+                item = await results.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _enqueue_links(self, links: List[str], depth: int, root_host: Optional[str],
+                       frontier: asyncio.Queue):
+        for link in links:
+            self.discovered += 1
+            
+            # Un link malformado ('http://[::1') se cuenta y se sigue con el resto
+            try:
+                url = normalize_url(link)
+                parts = urlsplit(url)
+            except (TypeError, ValueError, AttributeError):
+                self.invalid += 1
+                continue
+            if parts.scheme not in ('http', 'https'):
+                continue
+            if self.same_domain and parts.hostname != root_host:
+                self.off_domain += 1
+                continue
+            if not self.seen.add(url):
+                self.duplicates += 1
+                continue
+            if self.scheduled >= self.max_pages:
+                self.over_limit += 1
+                continue
+            
+            self.scheduled += 1
+            frontier.put_nowait((url, depth))
+    
+    async def _visit(self, url: str) -> Tuple[Dict[str, Any], int]:
+        async with self.domains.slot(url):
+            return await self._run_one(url)
+    
+    async def _run_one(self, url: str) -> Tuple[Dict[str, Any], int]:
+        try:
+            return await self.run(url)
+        except Exception as e:
+            logger.error(f"Crawl page {url} failed: {e}", exc_info=True)
+            return {"status": "error", "message": str(e), "url": url}, 500
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pages": self.succeeded + self.failed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "links_discovered": self.discovered,
+            "duplicates": self.duplicates,
+            "off_domain": self.off_domain,
+            "over_limit": self.over_limit,
+            "invalid_links": self.invalid,
+            "seen_filter_bytes": self.seen.memory_bytes
+        }
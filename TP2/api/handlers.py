@@ -1,15 +1,26 @@
+import json
+import time
 import asyncio
 import logging
 from datetime import datetime
 from aiohttp import web
-from typing import Dict, Any
+from contextlib import aclosing
+from typing import Dict, Any, AsyncIterator, List, Tuple, Optional, Callable
 
-from scraper.async_http import AsyncHTTPClient
-from scraper.html_parser import parse_html
-from scraper.metadata_extractor import MetadataExtractor, analyze_seo
+from scraper.async_http import (
+    AsyncHTTPClient, HTML_CONTENT_TYPES, ResponseTooLarge, UnsupportedContentType
+)
 from api.processing_client import ProcessingClient
-from common.cache import get_cache
+from api.jobs import JobState, QueueFull
+from api.batch import run_batch
+from api.crawl import ALL_LINKS, Crawler
+from common.cache import get_cache, CachedItem
+from common.singleflight import SingleFlight
+from common.url_utils import normalize_url
 from common.rate_limiter import get_rate_limiter
+from common.outbound import get_governor
+from common.timing_stats import get_timing_stats
+from common.protocol import create_page_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -22,87 +33,230 @@ class ScrapingHandler:
             app['processing_host'],
             app['processing_port']
         )
+        # Segundos que un scrape espera su token antes de responder 429
+        self.rate_limit_max_wait = app.get('rate_limit_max_wait', 0)
+        # Scrapes en vuelo por URL normalizada
+        self.inflight = SingleFlight()
+        # Revalidaciones lanzadas en background (referencias vivas)
+        self._background = set()
+        self.revalidation = {
+            "background": 0,
+            "conditional_requests": 0,
+            "not_modified": 0,
+            "modified": 0
+        }
+    
+    async def close(self, app: web.Application):
+        await self.processing_client.close()
     
     async def scrape(self, request: web.Request) -> web.Response:
         # Obtener parámetros
         url = request.query.get('url')
         force_refresh = request.query.get('refresh', '').lower() == 'true'
         
+        error = self._validate_url(url)
+        if error:
+            return web.json_response(error, status=400)
+        
+        result, status = await self.run_scrape(url, force_refresh)
+        return web.json_response(result, status=status)
+    
+    @staticmethod
+    def _validate_url(url: Optional[str]) -> Optional[Dict[str, Any]]:
         if not url:
-            return web.json_response(
-                {
-                    "status": "error",
-                    "message": "URL parameter required",
-                    "usage": "GET /scrape?url=https://example.com&refresh=true"
-                },
-                status=400
-            )
+            return {
+                "status": "error",
+                "message": "URL parameter required",
+                "usage": "GET /scrape?url=https://example.com&refresh=true"
+            }
         
         # Validar URL básica
         if not url.startswith(('http://', 'https://')):
-            return web.json_response(
-                {
-                    "status": "error",
-                    "message": "URL must start with http:// or https://"
-                },
-                status=400
-            )
+            return {
+                "status": "error",
+                "message": "URL must start with http:// or https://"
+            }
+        
+        return None
+    
+    async def run_scrape(self, url: str, force_refresh: bool = False,
+                         on_state: Optional[Callable[[str], None]] = None,
+                         wait_for_token: bool = False,
+                         slot: Optional[asyncio.Semaphore] = None,
+                         on_links: Optional[Callable[[List[str]], None]] = None
+                         ) -> Tuple[Dict[str, Any], int]:
+        """
+        Caché, rate limit, coalescing y pipeline: lo que comparten /scrape,
+        batch, crawl y la cola de /jobs. Devuelve (body JSON, status HTTP).
+        
+        Sin wait_for_token se espera el token del dominio hasta
+        --rate-max-wait y después 429 (un cliente esperando la respuesta).
+        Batch, crawl y jobs son colas: esperan lo necesario, así avanzan a
+        la tasa permitida en vez de fallar.
+        
+        slot (el cupo global de batch/crawl) se toma recién con el token en
+        mano: esperar el rate limit de un dominio no frena a los demás.
         
+        on_links recibe todos los links de la página (la respuesta lleva
+        solo los primeros 50). Un pedido que se suma a otro en vuelo recibe
+        los de la respuesta.
+        """
         logger.info(f"Scraping request received: {url}")
         
+        # Misma página, misma clave: caché y coalescing comparten la normalización
+        key = normalize_url(url)
+        
         # Verificar caché primero
-        cache = get_cache()
-        if not force_refresh:
-            cached = cache.get(url)
-            if cached:
+        cached = await get_cache().lookup_async(key)
+        if cached and not force_refresh:
+            if on_links:
+                on_links(cached.meta.get('links', self._response_links(cached.value)))
+            if cached.fresh:
                 logger.info(f"Cache HIT for {url}")
-                cached['from_cache'] = True
-                return web.json_response(cached)
+                return dict(cached.value, from_cache=True), 200
+            
+            # Vencida pero dentro de la ventana stale: responder ya y revalidar aparte
+            logger.info(f"Cache STALE for {url} ({cached.age:.0f}s), revalidating")
+            self._revalidate_in_background(url, key, cached)
+            return dict(cached.value, from_cache=True, stale=True), 200
         
-        # Verificar rate limiting
         limiter = get_rate_limiter()
-        if not limiter.can_request(url):
-            wait_time = limiter.wait_time(url)
-            logger.warning(f" Rate limit exceeded for {url}, wait {wait_time:.1f}s")
-            return web.json_response(
-                {
+        max_wait = None if wait_for_token else self.rate_limit_max_wait
+        
+        async def scrape() -> Tuple[Dict[str, Any], int]:
+            # Solo el primero espera el token: los pedidos iguales que llegan
+            # mientras tanto se suman a este mismo vuelo sin gastar rate limit
+            if not await limiter.acquire(url, max_wait=max_wait):
+                wait_time = limiter.wait_time(url)
+                logger.warning(f" Rate limit exceeded for {url}, wait {wait_time:.1f}s")
+                return {
                     "status": "error",
                     "message": f"Rate limit exceeded. Please wait {wait_time:.1f} seconds",
                     "wait_seconds": round(wait_time, 1)
-                },
-                status=429
-            )
+                }, 429
+            if slot is None:
+                return await self._scrape_pipeline(url, key, cached, on_state, on_links)
+            async with slot:
+                return await self._scrape_pipeline(url, key, cached, on_state, on_links)
+        
+        (result, status), shared = await self.inflight.do(key, scrape)
+        # Se sumó a un vuelo que no esperó lo suficiente: ahora espera este
+        while shared and status == 429 and wait_for_token:
+            (result, status), shared = await self.inflight.do(key, scrape)
         
-        # Registrar request
+        if shared and status == 200:
+            result = dict(result, coalesced=True)
+            if on_links:
+                on_links(self._response_links(result))
+        
+        return result, status
+    
+    def _revalidate_in_background(self, url: str, key: str, cached: CachedItem):
+        # Ya hay un scrape/revalidación en vuelo para esta URL
+        if self.inflight.in_flight(key):
+            return
+        
+        # Sin cupo de rate limit se sigue sirviendo la versión stale
+        limiter = get_rate_limiter()
+        if not limiter.can_request(url):
+            return
         limiter.record_request(url)
         
+        self.revalidation["background"] += 1
+        task = asyncio.create_task(
+            self.inflight.do(key, lambda: self._scrape_pipeline(url, key, cached))
+        )
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+    
+    @staticmethod
+    def _response_links(body: Dict[str, Any]) -> List[str]:
+        return body.get('scraping_data', {}).get('links', [])
+    
+    @staticmethod
+    def _conditional_headers(previous: Optional[CachedItem]) -> Dict[str, str]:
+        if previous is None:
+            return {}
+        
+        headers = {}
+        if previous.meta.get('etag'):
+            headers['If-None-Match'] = previous.meta['etag']
+        if previous.meta.get('last_modified'):
+            headers['If-Modified-Since'] = previous.meta['last_modified']
+        return headers
+    
+    async def _reuse_previous(self, url: str, key: str, previous: CachedItem,
+                        http_meta: Dict[str, Any], start_time: datetime,
+                        on_links: Optional[Callable[[List[str]], None]] = None) -> Dict[str, Any]:
+        """304: la página no cambió, el parsing y el procesamiento anteriores siguen valiendo."""
+        total_time = (datetime.utcnow() - start_time).total_seconds()
+        response = dict(
+            previous.value,
+            timestamp=start_time.isoformat() + "Z",
+            processing_time_seconds=round(total_time, 2),
+            from_cache=False
+        )
+        
+        # El origen puede mandar validadores nuevos junto con el 304
+        meta = dict(previous.meta)
+        for field in ('etag', 'last_modified'):
+            if http_meta.get(field):
+                meta[field] = http_meta[field]
+        
+        await get_cache().set_async(key, response, meta)
+        if on_links:
+            on_links(meta.get('links', self._response_links(response)))
+        logger.info(f"Not modified: {url}, reusing previous parse")
+        return dict(response, revalidated=True)
+    
+    async def _scrape_pipeline(self, url: str, key: str, previous: Optional[CachedItem] = None,
+                               on_state: Optional[Callable[[str], None]] = None,
+                               on_links: Optional[Callable[[List[str]], None]] = None
+                               ) -> Tuple[Dict[str, Any], int]:
+        """
+        Fetch + parsing + procesamiento remoto. Devuelve (body JSON, status HTTP).
+        Con una entrada previa el GET es condicional; si el origen responde
+        304 se reutiliza el resultado anterior.
+        """
         start_time = datetime.utcnow()
+        conditional_headers = self._conditional_headers(previous)
         
         try:
             # ============ FASE 1: SCRAPING LOCAL (Asyncio) ============
             logger.info(f"Starting scraping: {url}")
             
-            async with AsyncHTTPClient(timeout=30) as client:
-                html, status_code, http_meta = await client.fetch(url)
+            # Body en streaming con tope: la memoria por scrape queda acotada
+            async with AsyncHTTPClient(
+                timeout=30,
+                session=self.app['http_session'],
+                max_bytes=self.app['max_page_bytes'],
+                content_types=HTML_CONTENT_TYPES
+            ) as client:
+                html, status_code, http_meta = await client.fetch(url, headers=conditional_headers)
+            
+            if conditional_headers:
+                self.revalidation["conditional_requests"] += 1
+                if status_code == 304:
+                    self.revalidation["not_modified"] += 1
+                    return await self._reuse_previous(url, key, previous, http_meta, start_time, on_links), 200
+                self.revalidation["modified"] += 1
             
             logger.info(f"Fetched {url}: {status_code}, {len(html)} bytes")
             
-            # Parsing HTML
-            scraping_data = parse_html(html, url)
+            # Parsing HTML + metadata + SEO fuera del event loop
+            scraping_data, metadata, seo_analysis = await self.app['parse_executor'].parse(html, url)
             logger.info(f"Parsed HTML: {scraping_data['title']}")
             
-            # Metadata extendida
-            metadata = MetadataExtractor.extract_all(scraping_data, url, html)
-            
-            # Análisis SEO
-            seo_analysis = analyze_seo(scraping_data)
-            
             # ============ FASE 2: PROCESAMIENTO REMOTO (Servidor B) ============
+            if on_state:
+                on_state(JobState.PROCESSING)
             logger.info(f"Requesting processing from Server B: {url}")
             
+            # El B analiza performance sobre esta misma descarga en vez de repetirla
             processing_data = await self.processing_client.request_processing(
                 url,
-                scraping_data
+                scraping_data,
+                page=create_page_snapshot(html, status_code, http_meta)
             )
             
             logger.info(f"Processing completed for {url}")
@@ -148,44 +302,280 @@ class ScrapingHandler:
                 "from_cache": False
             }
             
-            # Guardar en caché
-            cache.set(url, response)
+            # Guardar en caché, con los validadores para el próximo GET condicional
+            # y la lista completa de links (para crawl, que sigue todos)
+            await get_cache().set_async(key, response, {
+                'etag': http_meta.get('etag'),
+                'last_modified': http_meta.get('last_modified'),
+                'links': scraping_data['links']
+            })
+            if on_links:
+                on_links(scraping_data['links'])
             
             logger.info(f"Complete response ready for {url}")
-            return web.json_response(response)
+            return response, 200
         
         except asyncio.TimeoutError:
             logger.error(f"⏱ Timeout scraping {url}")
-            return web.json_response(
-                {
-                    "status": "error",
-                    "message": "Timeout while fetching URL",
-                    "url": url
-                },
-                status=504
-            )
+            return {
+                "status": "error",
+                "message": "Timeout while fetching URL",
+                "url": url
+            }, 504
+        
+        except ResponseTooLarge as e:
+            return {
+                "status": "error",
+                "message": str(e),
+                "url": url,
+                "max_bytes": self.app['max_page_bytes']
+            }, 413
+        
+        except UnsupportedContentType as e:
+            return {
+                "status": "error",
+                "message": str(e),
+                "url": url
+            }, 415
         
         except ConnectionError as e:
             logger.error(f"Connection error: {e}")
-            return web.json_response(
-                {
-                    "status": "error",
-                    "message": f"Failed to connect: {str(e)}",
-                    "url": url
-                },
-                status=502
-            )
+            return {
+                "status": "error",
+                "message": f"Failed to connect: {str(e)}",
+                "url": url
+            }, 502
         
         except Exception as e:
             logger.error(f"Error scraping {url}: {e}", exc_info=True)
+            return {
+                "status": "error",
+                "message": str(e),
+                "url": url
+            }, 500
+    
+    async def scrape_batch(self, request: web.Request) -> web.StreamResponse:
+        """
+        POST /scrape/batch: body JSON {"urls": [...], "refresh", "concurrency",
+        "per_domain"} o texto plano con una URL por línea. Cada resultado se
+        escribe como una línea NDJSON apenas termina; la última línea es el resumen.
+        """
+        try:
+            if request.content_type == 'application/json':
+                params = await request.json()
+            else:
+                params = {"urls": (await request.text()).split()}
+                params.update(request.query)
+        except ValueError:
+            return web.json_response({"status": "error", "message": "Invalid JSON body"}, status=400)
+        
+        urls = params.get('urls')
+        max_urls = self.app['batch_max_urls']
+        if not isinstance(urls, list) or not urls:
             return web.json_response(
                 {
                     "status": "error",
-                    "message": str(e),
-                    "url": url
+                    "message": "urls must be a non-empty list",
+                    "usage": 'POST /scrape/batch {"urls": ["https://example.com", ...]}'
                 },
-                status=500
+                status=400
             )
+        if len(urls) > max_urls:
+            return web.json_response(
+                {"status": "error", "message": f"Too many URLs ({len(urls)} > {max_urls})"},
+                status=413
+            )
+        
+        refresh = str(params.get('refresh', '')).lower() == 'true'
+        try:
+            concurrency = min(int(params.get('concurrency', self.app['batch_concurrency'])),
+                              self.app['batch_concurrency'])
+            per_domain = min(int(params.get('per_domain', self.app['batch_per_domain'])),
+                             self.app['batch_per_domain'])
+        except (TypeError, ValueError):
+            return web.json_response(
+                {"status": "error", "message": "concurrency and per_domain must be integers"},
+                status=400
+            )
+        
+        async def run(url: str):
+            error = self._validate_url(url if isinstance(url, str) else None)
+            if error:
+                return error, 400
+            return await self.run_scrape(url, refresh, wait_for_token=True,
+                                         slot=self.app['batch_slots'])
+        
+        logger.info(f"Batch of {len(urls)} URLs (concurrency {concurrency}, per domain {per_domain})")
+        start = time.perf_counter()
+        counts = {"succeeded": 0}
+        
+        async def lines():
+            async with aclosing(run_batch(
+                urls, run,
+                concurrency=max(1, concurrency),
+                per_domain=max(1, per_domain)
+            )) as results:
+                async for index, url, body, status in results:
+                    counts["succeeded"] += status == 200
+                    yield {"index": index, "url": url, "status_code": status, "result": body}
+        
+        def summary():
+            return {
+                "done": True,
+                "total": len(urls),
+                "succeeded": counts["succeeded"],
+                "failed": len(urls) - counts["succeeded"],
+                "elapsed_seconds": round(time.perf_counter() - start, 2)
+            }
+        
+        return await self._stream_ndjson(request, lines(), summary)
+    
+    async def crawl(self, request: web.Request) -> web.StreamResponse:
+        """
+        GET /crawl?url=...&depth=N&max_pages=M&same_domain=true: sigue los
+        links de la página inicial y devuelve cada página como una línea
+        NDJSON apenas se scrapea; la última línea es el resumen.
+        """
+        url = request.query.get('url')
+        error = self._validate_url(url)
+        if error:
+            error["usage"] = "/crawl?url=https://example.com&depth=2&max_pages=50"
+            return web.json_response(error, status=400)
+        
+        try:
+            depth = min(int(request.query.get('depth', 1)), self.app['crawl_max_depth'])
+            max_pages = min(int(request.query.get('max_pages', 50)), self.app['crawl_max_pages'])
+        except ValueError:
+            return web.json_response(
+                {"status": "error", "message": "depth and max_pages must be integers"},
+                status=400
+            )
+        
+        same_domain = request.query.get('same_domain', 'true').lower() != 'false'
+        refresh = request.query.get('refresh', '').lower() == 'true'
+        
+        async def run_page(page: str):
+            found = []
+            body, status = await self.run_scrape(page, refresh, wait_for_token=True,
+                                                 slot=self.app['batch_slots'],
+                                                 on_links=found.append)
+            # El crawler sigue todos los links, no solo los 50 de la respuesta
+            if found:
+                body = dict(body, **{ALL_LINKS: found[-1]})
+            return body, status
+        
+        crawler = Crawler(
+            run_page,
+            max_depth=depth,
+            max_pages=max_pages,
+            same_domain=same_domain,
+            concurrency=self.app['crawl_concurrency'],
+            per_domain=self.app['batch_per_domain']
+        )
+        
+        logger.info(f"Crawl of {url} (depth {depth}, max {max_pages} pages)")
+        start = time.perf_counter()
+        
+        async def lines():
+            async with aclosing(crawler.crawl(url)) as pages:
+                async for page in pages:
+                    yield page
+        
+        def summary():
+            return dict(
+                crawler.stats(),
+                done=True,
+                elapsed_seconds=round(time.perf_counter() - start, 2)
+            )
+        
+        return await self._stream_ndjson(request, lines(), summary)
+    
+    @staticmethod
+    async def _stream_ndjson(request: web.Request, lines: AsyncIterator[Dict[str, Any]],
+                             summary: Callable[[], Dict[str, Any]]) -> web.StreamResponse:
+        """Escribe cada dict como una línea JSON a medida que llega y cierra con summary()."""
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        
+        # aclosing: si el cliente corta, el generador cancela sus workers
+        async with aclosing(lines) as items:
+            async for line in items:
+                await response.write(json.dumps(line).encode() + b'\n')
+        
+        await response.write(json.dumps(summary()).encode() + b'\n')
+        await response.write_eof()
+        return response
+    
+    async def create_job(self, request: web.Request) -> web.Response:
+        """POST /jobs: encola el scrape y devuelve el task_id sin esperar."""
+        params = dict(request.query)
+        if request.can_read_body and request.content_type == 'application/json':
+            try:
+                params.update(await request.json())
+            except ValueError:
+                return web.json_response(
+                    {"status": "error", "message": "Invalid JSON body"},
+                    status=400
+                )
+        
+        url = params.get('url')
+        refresh = str(params.get('refresh', '')).lower() == 'true'
+        
+        error = self._validate_url(url)
+        if error:
+            error["usage"] = 'POST /jobs {"url": "https://example.com"}'
+            return web.json_response(error, status=400)
+        
+        try:
+            job = self.app['jobs'].submit(url, refresh)
+        except QueueFull as e:
+            return web.json_response({"status": "error", "message": str(e)}, status=503)
+        
+        logger.info(f"Job {job.id} queued for {url}")
+        return web.json_response(
+            {
+                "task_id": job.id,
+                "status": job.state,
+                "status_url": f"/status/{job.id}",
+                "result_url": f"/result/{job.id}"
+            },
+            status=202
+        )
+    
+    def _get_job(self, request: web.Request):
+        job = self.app['jobs'].get(request.match_info['task_id'])
+        if job is None:
+            raise web.HTTPNotFound(
+                text='{"status": "error", "message": "Unknown task_id"}',
+                content_type='application/json'
+            )
+        return job
+    
+    async def job_status(self, request: web.Request) -> web.Response:
+        return web.json_response(self._get_job(request).to_dict())
+    
+    async def job_result(self, request: web.Request) -> web.Response:
+        job = self._get_job(request)
+        
+        if not job.finished:
+            # Todavía no hay resultado: mismo formato que /status
+            return web.json_response(job.to_dict(), status=202)
+        
+        if job.result_evicted:
+            # Se descartó por el presupuesto de memoria: hay que volver a pedirlo
+            return web.json_response(
+                dict(job.to_dict(), message="Result no longer stored, submit the job again"),
+                status=410
+            )
+        
+        return web.json_response(
+            {
+                "task_id": job.id,
+                "status": job.state,
+                "result": job.result
+            },
+            status=job.http_status
+        )
     
     async def health(self, request: web.Request) -> web.Response:
         # Verificar servidor de procesamiento
@@ -233,6 +623,43 @@ class ScrapingHandler:
                 "/stats": {
                     "method": "GET",
                     "description": "Cache and rate limiting statistics"
+                },
+                "/scrape/batch": {
+                    "method": "POST",
+                    "parameters": {
+                        "urls": "List of URLs (JSON body) or one URL per line (text body)",
+                        "refresh": "Force refresh cache (optional, true/false)",
+                        "concurrency": "Parallel scrapes for this batch (optional)",
+                        "per_domain": "Parallel scrapes per domain (optional)"
+                    },
+                    "description": "Scrapes many URLs and streams each result as NDJSON"
+                },
+                "/crawl": {
+                    "method": "GET",
+                    "parameters": {
+                        "url": "Start URL (required)",
+                        "depth": "Link depth to follow (optional, default 1)",
+                        "max_pages": "Maximum pages to scrape (optional, default 50)",
+                        "same_domain": "Only follow links on the start host (optional, default true)",
+                        "refresh": "Force refresh cache (optional, true/false)"
+                    },
+                    "description": "Crawls a site and streams each page as NDJSON"
+                },
+                "/jobs": {
+                    "method": "POST",
+                    "parameters": {
+                        "url": "URL to scrape (required, JSON body or query)",
+                        "refresh": "Force refresh cache (optional, true/false)"
+                    },
+                    "description": "Queues a scrape and returns a task_id immediately"
+                },
+                "/status/{task_id}": {
+                    "method": "GET",
+                    "description": "Job state: pending, scraping, processing, completed or failed"
+                },
+                "/result/{task_id}": {
+                    "method": "GET",
+                    "description": "Job result (202 while the job is still running)"
                 }
             },
             "features": [
@@ -244,13 +671,13 @@ class ScrapingHandler:
                 "Performance analysis",
                 "Image processing and thumbnails",
                 "Rate limiting (10 req/min per domain)",
-                "Smart caching (1 hour TTL)"
+                "Bounded LRU caching (1 hour TTL by default)"
             ],
             "processing_server": {
                 "host": self.app['processing_host'],
                 "port": self.app['processing_port']
             },
-            "cache": cache.stats(),
+            "cache": await cache.stats_async(),
             "rate_limiter": limiter.stats()
         }
         
@@ -261,8 +688,14 @@ class ScrapingHandler:
         limiter = get_rate_limiter()
         
         stats_data = {
-            "cache": cache.stats(),
+            "cache": await cache.stats_async(),
             "rate_limiter": limiter.stats(),
+            "outbound": get_governor().stats(),
+            "network_timing": get_timing_stats().stats(),
+            "parse_executor": self.app['parse_executor'].stats(),
+            "coalescing": self.inflight.stats(),
+            "revalidation": self.revalidation,
+            "jobs": self.app['jobs'].stats(),
             "timestamp": datetime.utcnow().isoformat() + "Z"
         }
         
@@ -0,0 +1,243 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from common.cache import estimate_size
+
+logger = logging.getLogger(__name__)
+
+
+class JobState:
+    PENDING = 'pending'
+    SCRAPING = 'scraping'
+    PROCESSING = 'processing'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    
+    FINISHED = (COMPLETED, FAILED)
+
+
+class Job:
+
+    def __init__(self, url: str, refresh: bool = False):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.refresh = refresh
+        self.state = JobState.PENDING
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.http_status: Optional[int] = None
+        self.error: Optional[str] = None
+        # Bytes aproximados del resultado; 0 si se descartó por presupuesto
+        self.result_size = 0
+        self.result_evicted = False
+    
+    @property
+    def finished(self) -> bool:
+        return self.state in JobState.FINISHED
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task_id": self.id,
+            "url": self.url,
+            "status": self.state,
+            "created_at": _iso(self.created_at),
+            "started_at": _iso(self.started_at),
+            "finished_at": _iso(self.finished_at),
+            "error": self.error,
+            "result_evicted": self.result_evicted
+        }
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)) + "Z"
+
+
+# run(url, refresh, on_state) -> (body JSON, status HTTP)
+JobRunner = Callable[[str, bool, Callable[[str], None]], Awaitable[Tuple[Dict[str, Any], int]]]
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobManager:
+    """
+    Cola de trabajos acotada: POST /jobs encola y responde al instante,
+    N workers asyncio ejecutan el pipeline de scraping en background.
+    
+    Los trabajos terminados se conservan result_ttl segundos para
+    consultar /status y /result. Los resultados (con screenshots y
+    thumbnails en base64) suman como mucho max_result_bytes: pasado el
+    presupuesto se descarta el resultado más viejo y su /status queda
+    con result_evicted. Los vencidos se barren al leer y periódicamente.
+    """
+    
+    def __init__(self, runner: JobRunner, workers: int = 4, queue_size: int = 100,
+                 result_ttl: int = 3600, max_jobs: int = 10000,
+                 max_result_bytes: int = 64 * 1024 * 1024, sweep_interval: float = 60):
+        self.runner = runner
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.result_ttl = result_ttl
+        self.max_jobs = max_jobs
+        self.max_result_bytes = max_result_bytes
+        self.sweep_interval = sweep_interval
+        
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._sweeper: Optional[asyncio.Task] = None
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.result_bytes = 0
+        
+        # Métricas
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.evicted_results = 0
+    
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+        self._sweeper = asyncio.create_task(self._sweep())
+        logger.info(f"Job queue: {self.workers} workers, capacity {self.queue_size}")
+    
+    async def stop(self):
+        tasks = self._workers + ([self._sweeper] if self._sweeper else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._sweeper = None
+    
+    async def _sweep(self):
+        # Sin trabajos nuevos submit() no poda: los vencidos se liberan igual
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self._prune()
+    
+    def submit(self, url: str, refresh: bool = False) -> Job:
+        self._prune()
+        
+        job = Job(url, refresh)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull(f"Job queue is full ({self.queue_size} pending)")
+        
+        self._jobs[job.id] = job
+        self.submitted += 1
+        return job
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        self._prune()
+        return self._jobs.get(job_id)
+    
+    async def _worker(self, number: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+    
+    async def _run(self, job: Job):
+        job.state = JobState.SCRAPING
+        job.started_at = time.time()
+        
+        def on_state(state: str):
+            job.state = state
+        
+        try:
+            body, status = await self.runner(job.url, job.refresh, on_state)
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}", exc_info=True)
+            body, status = {"status": "error", "message": str(e)}, 500
+        
+        job.http_status = status
+        job.finished_at = time.time()
+        self._store_result(job, body)
+        
+        if status == 200:
+            job.state = JobState.COMPLETED
+            self.completed += 1
+        else:
+            job.state = JobState.FAILED
+            job.error = body.get('message')
+            self.failed += 1
+    
+    def _store_result(self, job: Job, body: Dict[str, Any]):
+        size = estimate_size(body)
+        if size > self.max_result_bytes:
+            # Ni solo entra en el presupuesto: queda el estado, no el resultado
+            logger.warning(f"Job {job.id}: result too large to keep ({size} bytes)")
+            job.result_evicted = True
+            self.evicted_results += 1
+            return
+        
+        job.result = body
+        job.result_size = size
+        self.result_bytes += size
+        
+        # Descartar resultados de los terminados más viejos hasta entrar
+        for other in self._jobs.values():
+            if self.result_bytes <= self.max_result_bytes:
+                break
+            if other is not job and other.result_size:
+                self._drop_result(other)
+                other.result_evicted = True
+                self.evicted_results += 1
+    
+    def _drop_result(self, job: Job):
+        self.result_bytes -= job.result_size
+        job.result = None
+        job.result_size = 0
+    
+    def _forget(self, job_id: str):
+        self._drop_result(self._jobs.pop(job_id))
+    
+    def _prune(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            self._forget(job_id)
+        
+        # Tope duro: descartar los terminados más viejos
+        if len(self._jobs) >= self.max_jobs:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.finished]:
+                self._forget(job_id)
+                if len(self._jobs) < self.max_jobs:
+                    break
+    
+    def stats(self) -> Dict[str, Any]:
+        states = {}
+        for job in self._jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "result_bytes": self.result_bytes,
+            "max_result_bytes": self.max_result_bytes,
+            "evicted_results": self.evicted_results,
+            "jobs_by_state": states
+        }
@@ -0,0 +1,85 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any, Tuple
+
+from scraper.html_parser import parse_html
+from scraper.metadata_extractor import MetadataExtractor, analyze_seo
+
+logger = logging.getLogger(__name__)
+
+
+def parse_document(html: str, url: str) -> Tuple[Dict, Dict, Dict]:
+    """Parsing + metadata + SEO: todo el trabajo CPU-bound de un scrape."""
+    scraping_data = parse_html(html, url)
+    metadata = MetadataExtractor.extract_all(scraping_data, url, html)
+    seo_analysis = analyze_seo(scraping_data)
+    return scraping_data, metadata, seo_analysis
+
+
+class ParseExecutor:
+    """
+    Ejecuta el parsing fuera del event loop de aiohttp.
+    
+    Con 'process' (default) BeautifulSoup no compite por el GIL con el loop;
+    'thread' evita copiar el HTML entre procesos en páginas chicas.
+    """
+    
+    KINDS = ('process', 'thread')
+    
+    def __init__(self, kind: str = 'process', workers: int = 4):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown parse executor: {kind}")
+        
+        self.kind = kind
+        self.workers = max(1, workers)
+        
+        if kind == 'process':
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='parse')
+        
+        # Métricas
+        self.pending = 0
+        self.max_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_time = 0.0
+        
+        logger.info(f"Parse executor: {kind} x {self.workers}")
+    
+    async def parse(self, html: str, url: str) -> Tuple[Dict, Dict, Dict]:
+        loop = asyncio.get_running_loop()
+        
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        start = time.perf_counter()
+        
+        try:
+            result = await loop.run_in_executor(self.executor, parse_document, html, url)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            self.total_time += time.perf_counter() - start
+    
+    def stats(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "pending": self.pending,
+            # Lo que excede a los workers está esperando en la cola
+            "queue_depth": max(0, self.pending - self.workers),
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_time_ms": round(self.total_time / finished * 1000, 2) if finished else 0
+        }
+    
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
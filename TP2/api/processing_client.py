@@ -1,40 +1,286 @@
+import time
 import asyncio
 import logging
 from typing import Dict, Any, Optional
-from common.protocol import Protocol, MessageType, create_request
+from common.protocol import Protocol, MessageType, create_request, next_request_id
+from common.serialization import Serializer, SerializationFormat, Base64Helper, prepare_for_json
 
 logger = logging.getLogger(__name__)
 
 
-class ProcessingClient:
+class MultiplexedConnection:
+    """
+    Conexión TCP de larga vida con el servidor de procesamiento.
+    
+    Varios requests viajan a la vez por el mismo socket; cada uno lleva un
+    "id" y una task lectora entrega cada respuesta al future que la espera,
+    sin importar el orden en que lleguen.
+    
+    Un servidor viejo (sin HELLO) responde un solo mensaje y cierra: en ese
+    caso cada request abre su propia conexión, como hacía el cliente original.
+    """
+    
+    def __init__(self, host: str, port: int, connect_timeout: float = 10,
+                 codecs: Optional[list] = None):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        # Codecs ofrecidos al servidor en el HELLO (pickle nunca por defecto)
+        self.codecs = codecs or [
+            codec for codec in Serializer.available_formats()
+            if codec != SerializationFormat.PICKLE
+        ]
+        # Resultado de la negociación: None = JSON legacy sin adjuntos
+        self.codec: Optional[SerializationFormat] = None
+        # El servidor no negoció: una conexión por request
+        self.legacy = False
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        # Futures de la conexión actual; al reconectar se usa un dict nuevo
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._legacy_in_flight = 0
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+    
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+    
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending) + self._legacy_in_flight
+    
+    @property
+    def supports_attachments(self) -> bool:
+        return self.codec is not None
+    
+    async def _open(self):
+        return await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port),
+            timeout=self.connect_timeout
+        )
+    
+    async def ensure_connected(self):
+        if self.connected or self.legacy:
+            return
+        
+        async with self._connect_lock:
+            if self.connected or self.legacy:
+                return
+            
+            reader, writer = await self._open()
+            if not await self._handshake(reader, writer):
+                # El servidor viejo ya cerró (o va a cerrar) esta conexión
+                writer.close()
+                self.legacy = True
+                return
+            
+            self._reader, self._writer = reader, writer
+            self._pending = {}
+            self._reader_task = asyncio.create_task(self._read_loop(reader, writer, self._pending))
+            logger.debug(f"Connected to processing server {self.host}:{self.port}")
+    
+    async def _handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """Negocia codec y adjuntos binarios; False si el servidor no entiende HELLO."""
+        self.codec = None
+        hello = {
+            'type': MessageType.HELLO,
+            'codecs': [codec.value for codec in self.codecs]
+        }
+        await Protocol.send_message_async(writer, hello)
+        response = await asyncio.wait_for(
+            Protocol.receive_message_async(reader),
+            timeout=self.connect_timeout
+        )
+        
+        if response.get('success'):
+            self.codec = SerializationFormat(response['result']['codec'])
+            logger.debug(f"Negotiated codec {self.codec.value} with {self.host}:{self.port}")
+            return True
+        
+        logger.info(f"Processing server does not support codec negotiation, "
+                    f"using one JSON connection per request")
+        return False
+    
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                         pending: Dict[int, asyncio.Future]):
+        # Todo lo que toca la limpieza es de esta conexión: si mientras tanto
+        # se reconectó, la conexión nueva y sus requests no se tocan
+        error: Exception = ConnectionError("Processing server closed the connection")
+        try:
+            while True:
+                response = await Protocol.receive_message_async(
+                    reader,
+                    allow_pickle=self.codec == SerializationFormat.PICKLE
+                )
+                future = pending.pop(response.get('id'), None)
+                if future and not future.done():
+                    future.set_result(response)
+                elif future is None:
+                    logger.debug(f"Discarding late response id={response.get('id')}")
+        except asyncio.CancelledError:
+            error = ConnectionError("Connection closed")
+            raise
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception as e:
+            error = ConnectionError(str(e))
+        finally:
+            self._fail_pending(pending, error)
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+                self._reader = None
+    
+    @staticmethod
+    def _fail_pending(pending: Dict[int, asyncio.Future], error: Exception):
+        futures = list(pending.values())
+        pending.clear()
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+    
+    def _close_writer(self):
+        if self._writer:
+            self._writer.close()
+        self._writer = None
+        self._reader = None
+    
+    async def request(self, message: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        await self.ensure_connected()
+        if self.legacy:
+            return await self._request_legacy(message, timeout)
+        
+        request_id = next_request_id()
+        message = dict(message, id=request_id)
+        future = asyncio.get_running_loop().create_future()
+        pending: Dict[int, asyncio.Future] = {}
+        
+        try:
+            async with self._write_lock:
+                if not self.connected:
+                    raise ConnectionError("Connection to processing server lost")
+                # El future queda en el dict de la conexión por la que sale
+                pending = self._pending
+                pending[request_id] = future
+                await Protocol.send_message_async(self._writer, message, codec=self.codec)
+            return await asyncio.wait_for(future, timeout=timeout)
+        finally:
+            pending.pop(request_id, None)
+    
+    async def _request_legacy(self, message: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        self._legacy_in_flight += 1
+        writer = None
+        try:
+            reader, writer = await self._open()
+            await Protocol.send_message_async(writer, message)
+            return await asyncio.wait_for(Protocol.receive_message_async(reader), timeout=timeout)
+        finally:
+            self._legacy_in_flight -= 1
+            if writer is not None:
+                writer.close()
+    
+    async def close(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._reader_task = None
+        self._close_writer()
 
-    def __init__(self, host: str, port: int, timeout: int = 60):  # ← AUMENTADO a 60s
+
+class ProcessingClient:
+    
+    # Deadline por subtarea (segundos), algo por encima del timeout del servidor
+    TASK_DEADLINES = {
+        'screenshot': 20,
+        'performance': 15,
+        'images': 25
+    }
+    
+    def __init__(self, host: str, port: int, timeout: int = 60, pool_size: int = 2):  # ← AUMENTADO a 60s
         self.host = host
         self.port = port
         self.timeout = timeout
-        logger.info(f"Processing client configured: {host}:{port}")
+        # Pocas conexiones persistentes compartidas por todos los scrapes
+        self._connections = [MultiplexedConnection(host, port) for _ in range(max(1, pool_size))]
+        logger.info(f"Processing client configured: {host}:{port} ({len(self._connections)} connections)")
+    
+    def _pick_connection(self) -> MultiplexedConnection:
+        # La conexión con menos requests en vuelo
+        return min(self._connections, key=lambda conn: conn.in_flight)
     
-    async def request_processing(self, url: str, scraping_data: Dict) -> Dict[str, Any]:
+    async def _request(self, message: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        conn = self._pick_connection()
+        await conn.ensure_connected()
+        
+        if isinstance(message.get('data'), dict):
+            if conn.supports_attachments:
+                # Con frames binarios el servidor puede devolver PNG crudos (sin base64)
+                message['data']['binary_output'] = True
+            else:
+                # El body del snapshot son bytes: sin adjuntos el servidor vuelve a descargar
+                message['data'].pop('page', None)
+        
+        return await conn.request(message, timeout)
+    
+    async def close(self):
+        for conn in self._connections:
+            await conn.close()
+    
+    async def request_processing(self, url: str, scraping_data: Dict,
+                                 page: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        page: snapshot de la página ya descargada (create_page_snapshot); el
+        análisis de performance la usa en lugar de pedir el HTML otra vez.
+        """
         logger.info(f"Requesting processing for {url}")
         
         tasks = {
             'screenshot': self._request_screenshot(url),
-            'performance': self._request_performance(url),
+            'performance': self._request_performance(url, page),
             'images': self._request_images(url, scraping_data.get('image_urls', []))
         }
         
-        results = {}
-        for task_name, task in tasks.items():
-            try:
-                results[task_name] = await task
-            except Exception as e:
-                logger.error(f"Error in {task_name}: {e}")
-                results[task_name] = {
-                    'error': str(e),
-                    'success': False
-                }
+        # Las tres tareas corren a la vez: la latencia es la de la más lenta
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        outcomes = await asyncio.gather(*(
+            self._run_with_deadline(task_name, task, timings)
+            for task_name, task in tasks.items()
+        ))
+        results = dict(zip(tasks.keys(), outcomes))
         
-        return self._consolidate_results(results)
+        consolidated = self._consolidate_results(results)
+        consolidated['timings_ms'] = {
+            **timings,
+            'total': round((time.perf_counter() - start) * 1000, 2)
+        }
+        return consolidated
+    
+    async def _run_with_deadline(self, task_name: str, task, timings: Dict[str, float]) -> Dict[str, Any]:
+        """Espera una subtarea con su deadline; un fallo no afecta a las demás."""
+        deadline = self.TASK_DEADLINES.get(task_name, self.timeout)
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(task, timeout=deadline)
+        except asyncio.TimeoutError:
+            logger.error(f"Deadline exceeded in {task_name} ({deadline}s)")
+            return {
+                'error': f'Deadline exceeded after {deadline}s',
+                'success': False
+            }
+        except Exception as e:
+            logger.error(f"Error in {task_name}: {e}")
+            return {
+                'error': str(e),
+                'success': False
+            }
+        finally:
+            timings[task_name] = round((time.perf_counter() - start) * 1000, 2)
     
     async def _request_screenshot(self, url: str) -> Dict[str, Any]:
         return await self._send_task('screenshot_request', url, {
@@ -43,10 +289,11 @@ class ProcessingClient:
             'height': 1080
         })
     
-    async def _request_performance(self, url: str) -> Dict[str, Any]:
-        return await self._send_task('performance_request', url, {
-            'timeout': 15  # ← AUMENTADO
-        })
+    async def _request_performance(self, url: str, page: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = {'timeout': 15}  # ← AUMENTADO
+        if page:
+            data['page'] = page
+        return await self._send_task('performance_request', url, data)
     
     async def _request_images(self, url: str, image_urls: list) -> Dict[str, Any]:
         if not image_urls:
@@ -59,38 +306,23 @@ class ProcessingClient:
     
     async def _send_task(self, task_type: str, url: str, data: Dict) -> Dict[str, Any]:
         try:
-            reader, writer = await asyncio.wait_for(
-                asyncio.open_connection(self.host, self.port),
-                timeout=self.timeout
-            )
+            request = create_request(task_type, url, **data)
+            logger.debug(f"Sending {task_type} request for {url}")
             
-            try:
-                request = create_request(task_type, url, **data)
-                await Protocol.send_message_async(writer, request)
-                
-                logger.debug(f"Sent {task_type} request for {url}")
-                
-                response = await asyncio.wait_for(
-                    Protocol.receive_message_async(reader),
-                    timeout=self.timeout  # ← Usar timeout aumentado
-                )
-                
-                logger.debug(f"Received {task_type} response: {response}")
-                
-                if response.get('success'):
-                    return {
-                        'success': True,
-                        'result': response.get('result', {})
-                    }
-                else:
-                    return {
-                        'success': False,
-                        'error': response.get('error', 'Unknown error')
-                    }
+            response = await self._request(request, timeout=self.timeout)
             
-            finally:
-                writer.close()
-                await writer.wait_closed()
+            logger.debug(f"Received {task_type} response: {response}")
+            
+            if response.get('success'):
+                return {
+                    'success': True,
+                    'result': response.get('result', {})
+                }
+            else:
+                return {
+                    'success': False,
+                    'error': response.get('error', 'Unknown error')
+                }
         
         except asyncio.TimeoutError:
             logger.error(f"Timeout on {task_type} for {url}")
@@ -118,7 +350,11 @@ class ProcessingClient:
         
         screenshot_result = results.get('screenshot', {})
         if screenshot_result.get('success'):
-            consolidated['screenshot'] = screenshot_result.get('result')
+            screenshot = screenshot_result.get('result')
+            # La respuesta HTTP es JSON: base64 recién acá, en el borde
+            if isinstance(screenshot, bytes):
+                screenshot = Base64Helper.encode_image(screenshot)
+            consolidated['screenshot'] = screenshot
         else:
             consolidated['screenshot'] = None
             if screenshot_result.get('error'):
@@ -139,8 +375,18 @@ class ProcessingClient:
         images_result = results.get('images', {})
         if images_result.get('success'):
             result_data = images_result.get('result', [])
+            if isinstance(result_data, dict):
+                # Pipeline paralelo: thumbnails + cuántas llegaron antes del deadline
+                consolidated['images_summary'] = {
+                    key: result_data.get(key)
+                    for key in ('requested', 'completed', 'failed', 'partial', 'elapsed_ms')
+                }
+                result_data = result_data.get('thumbnails', [])
             if isinstance(result_data, list):
-                consolidated['thumbnails'] = result_data
+                consolidated['thumbnails'] = [
+                    prepare_for_json(item) if isinstance(item, dict) else item
+                    for item in result_data
+                ]
             else:
                 consolidated['thumbnails'] = []
         else:
@@ -152,25 +398,8 @@ class ProcessingClient:
     
     async def ping(self) -> bool:
         try:
-            reader, writer = await asyncio.wait_for(
-                asyncio.open_connection(self.host, self.port),
-                timeout=5
-            )
-            
-            try:
-                ping_msg = {'type': MessageType.PING}
-                await Protocol.send_message_async(writer, ping_msg)
-                
-                response = await asyncio.wait_for(
-                    Protocol.receive_message_async(reader),
-                    timeout=5
-                )
-                
-                return response.get('success', False)
-            
-            finally:
-                writer.close()
-                await writer.wait_closed()
+            response = await self._request({'type': MessageType.PING}, timeout=5)
+            return response.get('success', False)
         
         except Exception as e:
             logger.warning(f"Processing server ping failed: {e}")
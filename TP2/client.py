@@ -55,6 +55,49 @@ def scrape_url(server_url: str, target_url: str):
         print(f"Error: {e}")
 
 
+def scrape_batch(server_url: str, urls_file: str, save: str = None):
+    with open(urls_file, encoding='utf-8') as f:
+        urls = [line.strip() for line in f if line.strip()]
+    
+    print_header(f"BATCH: {len(urls)} URLs")
+    print(f" Enviando request a: {server_url}/scrape/batch")
+    
+    output = open(save, 'w', encoding='utf-8') if save else None
+    try:
+        # Los resultados llegan como NDJSON a medida que terminan
+        with requests.post(f"{server_url}/scrape/batch", json={'urls': urls},
+                           stream=True, timeout=60) as response:
+            if response.status_code != 200:
+                print(f"Error: {response.status_code}")
+                print(response.text)
+                return
+            
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                item = json.loads(line)
+                if output:
+                    output.write(line.decode('utf-8') + '\n')
+                
+                if item.get('done'):
+                    print(f"\n Total: {item['total']}, OK: {item['succeeded']}, "
+                          f"fallidas: {item['failed']} en {item['elapsed_seconds']}s")
+                else:
+                    mark = '✓' if item['status_code'] == 200 else '✗'
+                    print(f"  {mark} [{item['status_code']}] {item['url']}")
+    
+    except requests.Timeout:
+        print("⏱️ Timeout - El servidor dejó de enviar resultados por más de 60 segundos")
+    
+    except requests.ConnectionError:
+        print(f" Error de conexión - ¿Está el servidor corriendo en {server_url}?")
+    
+    finally:
+        if output:
+            output.close()
+            print(f"\n Resultados guardados en: {save}")
+
+
 def display_results(data: dict):
     
     # Información básica
@@ -122,8 +165,16 @@ def display_results(data: dict):
         if perf:
             print(f"⚡ Performance:")
             print(f"  Tiempo de carga: {perf.get('load_time_ms', 0)}ms")
+            print(f"  Critical path: {perf.get('critical_path_ms', 0)}ms")
+            timing = perf.get('network_timing') or {}
+            if timing:
+                print(f"  Red: DNS {timing.get('dns_ms', 0)}ms, conexión+TLS {timing.get('connect_ms', 0)}ms, "
+                      f"TTFB {timing.get('ttfb_ms', 0)}ms, descarga {timing.get('download_ms', 0)}ms")
             print(f"  Tamaño total: {perf.get('total_size_kb', 0)} KB")
             print(f"  Requests: {perf.get('num_requests', 0)}")
+            for kind, entry in perf.get('breakdown', {}).items():
+                if entry.get('requests'):
+                    print(f"    {kind}: {entry['requests']} requests, {entry['kb']} KB")
         elif 'performance_error' in processing:
             print(f"⚡ Performance: Error - {processing['performance_error']}")
         
@@ -139,8 +190,22 @@ def display_results(data: dict):
         thumbnails = processing.get('thumbnails', [])
         if thumbnails:
             print(f"  Thumbnails: {len(thumbnails)} generados")
+            for thumb in thumbnails:
+                analytics = thumb.get('analytics')
+                if analytics:
+                    palette = ' '.join(color['hex'] for color in analytics['palette'])
+                    print(f"    brillo {analytics['brightness']['mean']}, "
+                          f"contraste {analytics['brightness']['contrast']}, "
+                          f"nitidez {analytics['sharpness']}, paleta {palette}")
         elif 'images_error' in processing:
             print(f"  Thumbnails: Error - {processing['images_error']}")
+        
+        # Latencia por subtarea
+        timings = processing.get('timings_ms', {})
+        if timings:
+            print(f"\n⏱️  Latencias:")
+            for task_name, ms in timings.items():
+                print(f"  {task_name}: {ms}ms")
     
     # Redes sociales
     social = scraping.get('social_links', {})
@@ -231,6 +296,11 @@ def main():
         '--url',
         help='URL a scrapear'
     )
+    parser.add_argument(
+        '--batch',
+        metavar='FILE',
+        help='Archivo con una URL por línea para scrapear en batch'
+    )
     parser.add_argument(
         '--health',
         action='store_true',
@@ -259,10 +329,16 @@ def main():
         get_info(args.server)
         return
     
+    # Batch
+    if args.batch:
+        scrape_batch(args.server, args.batch, args.save)
+        return
+    
     # Scraping
     if not args.url:
         print("Error: Se requiere --url para hacer scraping")
         print("Uso: python client.py --url https://example.com")
+        print("     python client.py --batch urls.txt --save results.ndjson")
         print("     python client.py --health")
         print("     python client.py --info")
         return 1
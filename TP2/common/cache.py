@@ -1,82 +1,554 @@
 
 import time
-from typing import Any, Dict, Optional
+import json
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, NamedTuple, Optional
 import hashlib
 
+logger = logging.getLogger(__name__)
 
-class SimpleCache:
+
+def estimate_size(value: Any) -> int:
+    """
+    Tamaño aproximado en bytes de una respuesta (dicts/listas/strings).
+    Cuenta el contenido, no el overhead de los objetos de Python: alcanza
+    para que un screenshot en base64 pese lo que realmente pesa.
+    """
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items()) + 8
+    if isinstance(value, (list, tuple, set)):
+        return sum(estimate_size(item) for item in value) + 8
+    return 8
+
+
+class CachedItem(NamedTuple):
+    value: Any
+    meta: Dict[str, Any]
+    age: float
+    fresh: bool
+
+
+class CacheBackend:
+    """
+    Interfaz común de los caches de respuestas.
     
-    def __init__(self, ttl_seconds: int = 3600):
-        self._cache: Dict[str, tuple] = {}  # key -> (value, timestamp)
-        self.ttl = ttl_seconds
-        self.hits = 0
-        self.misses = 0
+    Semántica de TTL compartida: una entrada vale ttl segundos desde que se
+    guardó (leerla no la renueva) y una expirada cuenta como miss.
+    
+    Con stale_ttl > 0 la entrada se conserva stale_ttl segundos más:
+    get() ya no la devuelve, pero lookup() sí (fresh=False), para servirla
+    mientras se revalida. meta guarda datos para revalidar (ETag, etc).
+    
+    Desde el event loop se usan las variantes *_async: un backend que toca
+    disco las corre fuera del loop; el de memoria las resuelve en el lugar.
+    """
+    
+    name = 'base'
+    
+    def get(self, url: str) -> Optional[Any]:
+        item = self._lookup(url)
+        if item is None or not item.fresh:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return item.value
+    
+    def lookup(self, url: str) -> Optional[CachedItem]:
+        """Como get(), pero también devuelve entradas vencidas dentro de stale_ttl."""
+        item = self._lookup(url)
+        if item is None:
+            self.misses += 1
+        elif item.fresh:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return item
+    
+    def _lookup(self, url: str) -> Optional[CachedItem]:
+        raise NotImplementedError
+    
+    def set(self, url: str, value: Any, meta: Optional[Dict[str, Any]] = None):
+        raise NotImplementedError
+    
+    def remove(self, url: str) -> bool:
+        raise NotImplementedError
+    
+    def clear(self):
+        raise NotImplementedError
+    
+    def clean_expired(self) -> int:
+        raise NotImplementedError
+    
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        raise NotImplementedError
+    
+    def close(self):
+        pass
     
     def _generate_key(self, url: str) -> str:
         return hashlib.md5(url.encode()).hexdigest()
     
-    def get(self, url: str) -> Optional[Any]:
+    async def lookup_async(self, url: str) -> Optional[CachedItem]:
+        return self.lookup(url)
+    
+    async def set_async(self, url: str, value: Any, meta: Optional[Dict[str, Any]] = None):
+        self.set(url, value, meta)
+    
+    async def clean_expired_async(self) -> int:
+        return self.clean_expired()
+    
+    async def stats_async(self, top: int = 10) -> Dict[str, Any]:
+        return self.stats(top)
+    
+    async def run_sweeper(self, interval: float = 60):
+        """Barrido periódico de expiradas (correr como task del event loop)."""
+        while True:
+            await asyncio.sleep(interval)
+            removed = await self.clean_expired_async()
+            if removed:
+                logger.info(f"Cache: {removed} expired entries removed")
+
+
+class _Entry:
+    __slots__ = ('url', 'value', 'meta', 'timestamp', 'size', 'hits')
+    
+    def __init__(self, url: str, value: Any, size: int, meta: Dict[str, Any]):
+        self.url = url
+        self.value = value
+        self.meta = meta
+        self.timestamp = time.time()
+        self.size = size
+        self.hits = 0
+
+
+class LRUCache(CacheBackend):
+    """
+    Caché con TTL y presupuesto acotado (entradas y bytes).
+    
+    Al pasarse de cualquiera de los dos límites se desaloja la entrada
+    usada hace más tiempo. Las expiradas se limpian al leerlas y en un
+    barrido periódico (run_sweeper).
+    """
+    
+    name = 'memory'
+    
+    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 1000,
+                 max_bytes: int = 256 * 1024 * 1024, stale_ttl: int = 0):
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()  # key -> entry, de más viejo a más reciente
+        self.ttl = ttl_seconds
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+    
+    def _lookup(self, url: str) -> Optional[CachedItem]:
         key = self._generate_key(url)
+        entry = self._cache.get(key)
         
-        if key not in self._cache:
-            self.misses += 1
+        if entry is None:
             return None
         
-        value, timestamp = self._cache[key]
-        
-        # Verificar si expiró
-        if time.time() - timestamp > self.ttl:
-            del self._cache[key]
-            self.misses += 1
+        # Verificar si expiró (incluida la ventana stale)
+        age = time.time() - entry.timestamp
+        if age > self.ttl + self.stale_ttl:
+            self._delete(key)
+            self.expirations += 1
             return None
         
-        self.hits += 1
-        return value
+        self._cache.move_to_end(key)
+        entry.hits += 1
+        return CachedItem(entry.value, entry.meta, age, age <= self.ttl)
     
-    def set(self, url: str, value: Any):
+    def set(self, url: str, value: Any, meta: Optional[Dict[str, Any]] = None):
         key = self._generate_key(url)
-        self._cache[key] = (value, time.time())
+        meta = meta or {}
+        # meta también ocupa memoria (crawl guarda ahí todos los links)
+        size = estimate_size(value) + (estimate_size(meta) if meta else 0)
+        
+        if key in self._cache:
+            self._delete(key)
+        
+        # Una entrada que no entra en todo el presupuesto no se guarda
+        if size > self.max_bytes:
+            self.rejected += 1
+            logger.warning(f"Cache: entry for {url} too large ({size} bytes)")
+            return
+        
+        self._cache[key] = _Entry(url, value, size, meta)
+        self.bytes += size
+        self._evict()
+    
+    def _evict(self):
+        while self._cache and (len(self._cache) > self.max_entries or self.bytes > self.max_bytes):
+            _, entry = self._cache.popitem(last=False)
+            self.bytes -= entry.size
+            self.evictions += 1
+    
+    def _delete(self, key: str):
+        entry = self._cache.pop(key)
+        self.bytes -= entry.size
     
     def clear(self):
         self._cache.clear()
+        self.bytes = 0
         self.hits = 0
+        self.stale_hits = 0
         self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
     
     def remove(self, url: str) -> bool:
         key = self._generate_key(url)
         if key in self._cache:
-            del self._cache[key]
+            self._delete(key)
             return True
         return False
     
     def clean_expired(self):
         now = time.time()
         expired_keys = [
-            key for key, (_, timestamp) in self._cache.items()
-            if now - timestamp > self.ttl
+            key for key, entry in self._cache.items()
+            if now - entry.timestamp > self.ttl + self.stale_ttl
         ]
         
         for key in expired_keys:
-            del self._cache[key]
+            self._delete(key)
         
+        self.expirations += len(expired_keys)
         return len(expired_keys)
     
-    def stats(self) -> Dict[str, Any]:
+    def stats(self, top: int = 10) -> Dict[str, Any]:
         total = self.hits + self.misses
         hit_rate = (self.hits / total * 100) if total > 0 else 0
+        now = time.time()
+        
+        largest = sorted(self._cache.values(), key=lambda e: e.size, reverse=True)[:top]
         
         return {
+            "backend": self.name,
             "size": len(self._cache),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "avg_entry_bytes": self.bytes // len(self._cache) if self._cache else 0,
             "hits": self.hits,
+            "stale_hits": self.stale_hits,
             "misses": self.misses,
             "hit_rate": round(hit_rate, 2),
-            "ttl_seconds": self.ttl
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rejected": self.rejected,
+            "ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+            "largest_entries": [
+                {
+                    "url": entry.url,
+                    "bytes": entry.size,
+                    "hits": entry.hits,
+                    "age_seconds": round(now - entry.timestamp, 1)
+                }
+                for entry in largest
+            ]
         }
 
 
+class SQLiteCache(CacheBackend):
+    """
+    Caché compartido entre procesos sobre un archivo SQLite (modo WAL).
+    
+    Varias instancias de server_scraping.py apuntando al mismo archivo ven
+    las mismas entradas. Mismos límites y TTL que LRUCache; el LRU se
+    aproxima con la columna last_access. hits/misses son de este proceso;
+    size/bytes son del archivo compartido.
+    
+    Todo acceso a SQLite puede bloquearse hasta `timeout` segundos esperando
+    el lock de escritura de otro proceso: las variantes *_async corren en un
+    thread propio (uno solo, las operaciones quedan en orden) y el event
+    loop nunca espera al archivo. La conexión se abre en el primer uso.
+    """
+    
+    name = 'sqlite'
+    
+    def __init__(self, path: str, ttl_seconds: int = 3600, max_entries: int = 1000,
+                 max_bytes: int = 256 * 1024 * 1024, stale_ttl: int = 0, timeout: float = 5):
+        self.path = path
+        self.timeout = timeout
+        self.ttl = ttl_seconds
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+        
+        self._conn: Optional[sqlite3.Connection] = None
+        # Las llamadas sincrónicas (tests, scripts) y el thread del executor
+        # comparten la conexión: una operación a la vez
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-cache')
+    
+    @property
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+    
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit: cada escritura es su propia transacción corta
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                value BLOB NOT NULL,
+                timestamp REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                meta TEXT NOT NULL DEFAULT '{}'
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        
+        # Archivos creados antes de guardar meta
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+        if 'meta' not in columns:
+            conn.execute("ALTER TABLE entries ADD COLUMN meta TEXT NOT NULL DEFAULT '{}'")
+        return conn
+    
+    async def _in_thread(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, method, *args)
+    
+    async def lookup_async(self, url: str) -> Optional[CachedItem]:
+        return await self._in_thread(self.lookup, url)
+    
+    async def set_async(self, url: str, value: Any, meta: Optional[Dict[str, Any]] = None):
+        # json.dumps de la respuesta entera también sale del loop
+        await self._in_thread(self.set, url, value, meta)
+    
+    async def clean_expired_async(self) -> int:
+        return await self._in_thread(self.clean_expired)
+    
+    async def stats_async(self, top: int = 10) -> Dict[str, Any]:
+        return await self._in_thread(self.stats, top)
+    
+    def lookup(self, url: str) -> Optional[CachedItem]:
+        with self._lock:
+            return super().lookup(url)
+    
+    def get(self, url: str) -> Optional[Any]:
+        with self._lock:
+            return super().get(url)
+    
+    def _lookup(self, url: str) -> Optional[CachedItem]:
+        key = self._generate_key(url)
+        row = self._db.execute(
+            "SELECT value, timestamp, meta FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        
+        if row is None:
+            return None
+        
+        value, timestamp, meta = row
+        now = time.time()
+        age = now - timestamp
+        
+        # Verificar si expiró (incluida la ventana stale)
+        if age > self.ttl + self.stale_ttl:
+            self._db.execute("DELETE FROM entries WHERE key = ? AND timestamp = ?", (key, timestamp))
+            self.expirations += 1
+            return None
+        
+        self._db.execute(
+            "UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key)
+        )
+        return CachedItem(json.loads(value), json.loads(meta), age, age <= self.ttl)
+    
+    def set(self, url: str, value: Any, meta: Optional[Dict[str, Any]] = None):
+        key = self._generate_key(url)
+        data = json.dumps(value).encode()
+        meta_json = json.dumps(meta or {})
+        size = len(data) + len(meta_json)
+        
+        # Una entrada que no entra en todo el presupuesto no se guarda
+        if size > self.max_bytes:
+            self.rejected += 1
+            logger.warning(f"Cache: entry for {url} too large ({size} bytes)")
+            return
+        
+        now = time.time()
+        with self._lock, self._transaction():
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, url, value, timestamp, last_access, size, meta) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, data, now, now, size, meta_json)
+            )
+            self._evict()
+    
+    def _evict(self):
+        count, total = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        
+        victims = []
+        for key, size in self._db.execute(
+            "SELECT key, size FROM entries ORDER BY last_access, rowid"
+        ):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        
+        self._db.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self.evictions += len(victims)
+    
+    def _transaction(self):
+        return _SQLiteTransaction(self._db)
+    
+    def remove(self, url: str) -> bool:
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM entries WHERE key = ?", (self._generate_key(url),))
+        return cursor.rowcount > 0
+    
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+    
+    def clean_expired(self) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM entries WHERE ? - timestamp > ?", (time.time(), self.ttl + self.stale_ttl)
+            )
+        self.expirations += cursor.rowcount
+        return cursor.rowcount
+    
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total > 0 else 0
+        now = time.time()
+        
+        with self._lock:
+            count, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+            largest = self._db.execute(
+                "SELECT url, size, hits, timestamp FROM entries ORDER BY size DESC LIMIT ?", (top,)
+            ).fetchall()
+        
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "size": count,
+            "bytes": size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "avg_entry_bytes": size // count if count else 0,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round(hit_rate, 2),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rejected": self.rejected,
+            "ttl_seconds": self.ttl,
+            "stale_ttl_seconds": self.stale_ttl,
+            "largest_entries": [
+                {
+                    "url": url,
+                    "bytes": entry_size,
+                    "hits": hits,
+                    "age_seconds": round(now - timestamp, 1)
+                }
+                for url, entry_size, hits, timestamp in largest
+            ]
+        }
+    
+    def close(self):
+        # Esperar lo que ya está en el thread antes de cerrar la conexión
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class _SQLiteTransaction:
+    """BEGIN IMMEDIATE: toma el lock de escritura antes de leer para evictar."""
+    
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+    
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+CACHE_BACKENDS = ('memory', 'sqlite')
+
+# Compatibilidad: el caché original era SimpleCache
+SimpleCache = LRUCache
+
+
 # Instancia global del caché
-_global_cache = SimpleCache(ttl_seconds=3600)
+_global_cache: CacheBackend = LRUCache(ttl_seconds=3600)
+
+
+def get_cache() -> CacheBackend:
+    return _global_cache
+
+
+def create_cache(backend: str = 'memory', ttl_seconds: int = 3600, max_entries: int = 1000,
+                 max_bytes: int = 256 * 1024 * 1024, path: Optional[str] = None,
+                 stale_ttl: int = 0) -> CacheBackend:
+    if backend == 'memory':
+        return LRUCache(ttl_seconds, max_entries, max_bytes, stale_ttl)
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError("The sqlite cache backend needs a path")
+        return SQLiteCache(path, ttl_seconds, max_entries, max_bytes, stale_ttl)
+    raise ValueError(f"Unknown cache backend: {backend}")
 
 
-def get_cache() -> SimpleCache:
-    return _global_cache
\ No newline at end of file
+def configure_cache(ttl_seconds: int = 3600, max_entries: int = 1000,
+                    max_bytes: int = 256 * 1024 * 1024, backend: str = 'memory',
+                    path: Optional[str] = None, stale_ttl: int = 0) -> CacheBackend:
+    """Reemplaza la instancia global con el backend y los límites dados."""
+    global _global_cache
+    _global_cache.close()
+    _global_cache = create_cache(backend, ttl_seconds, max_entries, max_bytes, path, stale_ttl)
+    return _global_cache
@@ -0,0 +1,264 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+# Respuestas con las que el origen pide bajar el ritmo
+BACKOFF_STATUSES = (429, 503)
+
+
+class _Host:
+    __slots__ = ('limit', 'active', 'waiters', 'latency', 'min_latency',
+                 'requests', 'errors', 'slow', 'max_active')
+    
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.latency: Optional[float] = None      # EWMA
+        self.min_latency: Optional[float] = None
+        self.requests = 0
+        self.errors = 0
+        self.slow = 0
+        self.max_active = 0
+
+
+class Outcome:
+    """Resultado de un request; lo completa quien usa el slot."""
+    
+    __slots__ = ('latency', 'status', 'error')
+    
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.status: Optional[int] = None
+        self.error = False
+
+
+class OutboundGovernor:
+    """
+    Límite de requests salientes para todo el proceso: un tope global y uno
+    por host que se adapta (AIMD) según lo que responde cada origen.
+    
+    - Éxito con latencia normal: el límite del host sube 1/limit (suma ~1
+      por "ronda" completa de requests), hasta max_per_host.
+    - Error, timeout, 429 o 503: el límite se divide por 2.
+    - Latencia > slow_factor x la mínima vista: baja un 10% (el origen se
+      está saturando antes de empezar a fallar).
+    
+    La latencia que cuenta es hasta los headers, no la descarga del body:
+    no depende del tamaño de la respuesta.
+    """
+    
+    SLOW_FACTOR = 3.0
+    EWMA_ALPHA = 0.2
+    
+    def __init__(self, global_limit: int = 100, per_host: int = 4, max_per_host: int = 10,
+                 min_per_host: int = 1, max_hosts: int = 10000):
+        self.global_limit = global_limit
+        self.per_host = per_host
+        self.max_per_host = max(per_host, max_per_host)
+        self.min_per_host = max(1, min_per_host)
+        self.max_hosts = max_hosts
+        
+        # Mismo mecanismo de cupo que los hosts, con límite fijo (sin atarse a un loop)
+        self._global = _Host(float(global_limit))
+        self._hosts: "OrderedDict[str, _Host]" = OrderedDict()
+        
+        # Métricas
+        self.active = 0
+        self.max_active = 0
+        self.total_requests = 0
+        self.increases = 0
+        self.decreases = 0
+    
+    @staticmethod
+    def host_of(url: str) -> str:
+        parsed = urlparse(url)
+        return (parsed.netloc or url).lower()
+    
+    def _host(self, host: str) -> _Host:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host(float(self.per_host))
+            self._evict(keep=host)
+        else:
+            self._hosts.move_to_end(host)
+        return state
+    
+    def _evict(self, keep: str):
+        # Solo se olvidan hosts sin requests en curso ni en espera
+        if len(self._hosts) <= self.max_hosts:
+            return
+        for host in list(self._hosts):
+            state = self._hosts[host]
+            if host != keep and not state.active and not state.waiters:
+                del self._hosts[host]
+                if len(self._hosts) <= self.max_hosts:
+                    break
+    
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """
+        async with governor.slot(url) as outcome:
+            ...request...
+            outcome.status = response.status
+        
+        outcome.latency (o, si no se completa, la duración del bloque), el
+        status y las excepciones de red ajustan el límite del host.
+        """
+        host = self.host_of(url)
+        state = self._host(host)
+        
+        # Primero el cupo del host: un host lento no retiene slots globales
+        await self._acquire(state)
+        try:
+            await self._acquire(self._global)
+            try:
+                self.active += 1
+                self.total_requests += 1
+                self.max_active = max(self.max_active, self.active)
+                
+                outcome = Outcome()
+                start = time.perf_counter()
+                cancelled = False
+                try:
+                    yield outcome
+                except asyncio.CancelledError:
+                    # Lo cortó quien pidió, no el origen: no cuenta para el límite
+                    cancelled = True
+                    raise
+                except ValueError:
+                    # URL inválida, body muy grande, Content-Type: no es culpa del origen
+                    raise
+                except Exception:
+                    outcome.error = True
+                    raise
+                finally:
+                    self.active -= 1
+                    if outcome.latency is None:
+                        outcome.latency = time.perf_counter() - start
+                    if not cancelled:
+                        self._adjust(host, state, outcome)
+            finally:
+                self._release(self._global)
+        finally:
+            self._release(state)
+    
+    async def _acquire(self, state: _Host):
+        if state.active < int(state.limit) and not state.waiters:
+            state.active += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            state.waiters.append(waiter)
+            try:
+                # _release/_wake_up ya cuentan el slot como tomado
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # El slot llegó justo al cancelar: devolverlo
+                    self._release(state)
+                else:
+                    state.waiters.remove(waiter)
+                raise
+        state.max_active = max(state.max_active, state.active)
+    
+    def _release(self, state: _Host):
+        state.active -= 1
+        self._wake_up(state)
+    
+    def _wake_up(self, state: _Host):
+        while state.waiters and state.active < int(state.limit):
+            waiter = state.waiters.popleft()
+            if not waiter.done():
+                state.active += 1
+                waiter.set_result(None)
+    
+    def _adjust(self, host: str, state: _Host, outcome: Outcome):
+        state.requests += 1
+        latency = outcome.latency
+        
+        if outcome.error or outcome.status in BACKOFF_STATUSES:
+            state.errors += 1
+            self._set_limit(host, state, state.limit / 2)
+            return
+        
+        state.latency = latency if state.latency is None else (
+            self.EWMA_ALPHA * latency + (1 - self.EWMA_ALPHA) * state.latency
+        )
+        if state.min_latency is None or latency < state.min_latency:
+            state.min_latency = latency
+        
+        if latency > self.SLOW_FACTOR * state.min_latency and latency > 0.1:
+            state.slow += 1
+            self._set_limit(host, state, state.limit * 0.9)
+        else:
+            self._set_limit(host, state, state.limit + 1 / state.limit)
+    
+    def _set_limit(self, host: str, state: _Host, limit: float):
+        limit = min(float(self.max_per_host), max(float(self.min_per_host), limit))
+        if int(limit) > int(state.limit):
+            self.increases += 1
+        elif int(limit) < int(state.limit):
+            self.decreases += 1
+            logger.info(f"Outbound limit for {host} lowered to {int(limit)}")
+        state.limit = limit
+        self._wake_up(state)
+    
+    def limit_for(self, url: str) -> int:
+        state = self._hosts.get(self.host_of(url))
+        return int(state.limit) if state else self.per_host
+    
+    def stats(self, top: int = 20) -> Dict[str, Any]:
+        busiest = sorted(
+            self._hosts.items(),
+            key=lambda item: (item[1].active + len(item[1].waiters), item[1].requests),
+            reverse=True
+        )[:top]
+        return {
+            "global_limit": self.global_limit,
+            "per_host_start": self.per_host,
+            "per_host_range": [self.min_per_host, self.max_per_host],
+            "active": self.active,
+            "max_active": self.max_active,
+            "waiting_host": sum(len(state.waiters) for state in self._hosts.values()),
+            "waiting_global": len(self._global.waiters),
+            "requests": self.total_requests,
+            "limit_increases": self.increases,
+            "limit_decreases": self.decreases,
+            "hosts": len(self._hosts),
+            "busiest_hosts": {
+                host: {
+                    "limit": int(state.limit),
+                    "active": state.active,
+                    "waiting": len(state.waiters),
+                    "max_active": state.max_active,
+                    "requests": state.requests,
+                    "errors": state.errors,
+                    "slow": state.slow,
+                    "latency_ms": round(state.latency * 1000, 1) if state.latency is not None else None
+                }
+                for host, state in busiest
+            }
+        }
+
+
+# Instancia global: la comparten todos los clientes HTTP del proceso
+_global_governor = OutboundGovernor()
+
+
+def get_governor() -> OutboundGovernor:
+    return _global_governor
+
+
+def configure_governor(global_limit: int = 100, per_host: int = 4,
+                       max_per_host: int = 10) -> OutboundGovernor:
+    """Reemplaza la instancia global con los límites dados."""
+    global _global_governor
+    _global_governor = OutboundGovernor(global_limit, per_host, max_per_host)
+    return _global_governor
@@ -1,14 +1,42 @@
 import json
+import zlib
 import struct
 import socket
 import asyncio
-from typing import Dict, Any, Optional
+import itertools
+from typing import Dict, Any, Optional, List, Tuple
+
+from common.serialization import Serializer, SerializationFormat
 
 
 class Protocol:
     HEADER_SIZE = 4  # 4 bytes para longitud del mensaje (uint32)
     MAX_MESSAGE_SIZE = 10 * 1024 * 1024  # 10 MB máximo
     
+    # ==================== FRAME BINARIO (v2) ====================
+    #
+    # | magic (1) | version (1) | codec (1) | flags (1) | payload (4) | adjuntos (4) |
+    # | payload serializado con el codec | [len (4) | bytes] * N adjuntos        |
+    #
+    # El primer byte de un frame legacy (longitud uint32 < 10 MB) es siempre
+    # 0x00, así que el magic distingue ambos formatos sin ambigüedad.
+    FRAME_MAGIC = 0xB2
+    FRAME_VERSION = 2
+    FRAME_HEADER = struct.Struct('!BBBBII')
+    MAX_ATTACHMENTS_SIZE = 32 * 1024 * 1024  # 32 MB de adjuntos binarios
+    
+    FLAG_ZLIB = 0x01  # payload comprimido con zlib
+    COMPRESS_THRESHOLD = 64 * 1024
+    
+    CODEC_IDS = {
+        SerializationFormat.JSON: 1,
+        SerializationFormat.PICKLE: 2,
+        SerializationFormat.MSGPACK: 3,
+    }
+    CODECS_BY_ID = {codec_id: codec for codec, codec_id in CODEC_IDS.items()}
+    
+    ATTACHMENT_KEY = "__attachment__"
+    
     @staticmethod
     def encode_message(data: Dict[str, Any]) -> bytes:
         json_data = json.dumps(data, ensure_ascii=False).encode('utf-8')
@@ -22,10 +50,13 @@ class Protocol:
         return header + json_data
     
     @staticmethod
-    def decode_message(data: bytes) -> Dict[str, Any]:
+    def decode_message(data: bytes, allow_pickle: bool = False) -> Dict[str, Any]:
         if len(data) < Protocol.HEADER_SIZE:
             raise ValueError(f"Mensaje incompleto: {len(data)} bytes")
         
+        if data[0] == Protocol.FRAME_MAGIC:
+            return Protocol._decode_frame_bytes(data, allow_pickle)
+        
         # Extraer longitud del header
         length = struct.unpack('!I', data[:Protocol.HEADER_SIZE])[0]
         
@@ -43,18 +74,159 @@ class Protocol:
         json_data = data[Protocol.HEADER_SIZE:Protocol.HEADER_SIZE + length]
         return json.loads(json_data.decode('utf-8'))
     
+    # ==================== FRAMES BINARIOS ====================
+    
+    @staticmethod
+    def encode_frame(data: Dict[str, Any], codec: SerializationFormat = SerializationFormat.MSGPACK,
+                     compress: bool = False) -> bytes:
+        return b''.join(Protocol._frame_parts(data, codec, compress))
+    
+    @staticmethod
+    def _frame_parts(data: Dict[str, Any], codec: SerializationFormat, compress: bool) -> List[bytes]:
+        """Arma el frame como lista de buffers para escribirlos sin concatenar."""
+        attachments: List[bytes] = []
+        payload = Serializer.serialize(Protocol._extract_attachments(data, attachments), codec)
+        
+        flags = 0
+        if compress and len(payload) >= Protocol.COMPRESS_THRESHOLD:
+            payload = zlib.compress(payload, 6)
+            flags |= Protocol.FLAG_ZLIB
+        
+        if len(payload) > Protocol.MAX_MESSAGE_SIZE:
+            raise ValueError(f"Mensaje demasiado grande: {len(payload)} bytes")
+        
+        attachments_size = sum(4 + len(a) for a in attachments)
+        if attachments_size > Protocol.MAX_ATTACHMENTS_SIZE:
+            raise ValueError(f"Adjuntos demasiado grandes: {attachments_size} bytes")
+        
+        parts = [
+            Protocol.FRAME_HEADER.pack(
+                Protocol.FRAME_MAGIC,
+                Protocol.FRAME_VERSION,
+                Protocol.CODEC_IDS[codec],
+                flags,
+                len(payload),
+                attachments_size
+            ),
+            payload
+        ]
+        for attachment in attachments:
+            parts.append(struct.pack('!I', len(attachment)))
+            parts.append(attachment)
+        
+        return parts
+    
+    @staticmethod
+    def _parse_frame_header(header: bytes, allow_pickle: bool) -> Tuple[SerializationFormat, int, int, int]:
+        magic, version, codec_id, flags, payload_len, attachments_len = Protocol.FRAME_HEADER.unpack(header)
+        
+        if version != Protocol.FRAME_VERSION:
+            raise ValueError(f"Versión de frame no soportada: {version}")
+        
+        codec = Protocol.CODECS_BY_ID.get(codec_id)
+        if codec is None:
+            raise ValueError(f"Codec desconocido: {codec_id}")
+        if codec == SerializationFormat.PICKLE and not allow_pickle:
+            raise ValueError("Codec pickle no negociado para esta conexión")
+        
+        if payload_len > Protocol.MAX_MESSAGE_SIZE:
+            raise ValueError(f"Mensaje demasiado grande: {payload_len} bytes")
+        if attachments_len > Protocol.MAX_ATTACHMENTS_SIZE:
+            raise ValueError(f"Adjuntos demasiado grandes: {attachments_len} bytes")
+        
+        return codec, flags, payload_len, attachments_len
+    
+    @staticmethod
+    def _decode_frame_body(codec: SerializationFormat, flags: int, payload: bytes,
+                           attachments_data: bytes) -> Dict[str, Any]:
+        if flags & Protocol.FLAG_ZLIB:
+            # Acotar lo descomprimido: el límite aplica al payload real
+            decompressor = zlib.decompressobj()
+            payload = decompressor.decompress(payload, Protocol.MAX_MESSAGE_SIZE + 1)
+            if len(payload) > Protocol.MAX_MESSAGE_SIZE or decompressor.unconsumed_tail:
+                raise ValueError("Mensaje demasiado grande tras descomprimir")
+        
+        attachments = []
+        view = memoryview(attachments_data)
+        offset = 0
+        while offset < len(view):
+            (length,) = struct.unpack_from('!I', view, offset)
+            offset += 4
+            attachments.append(bytes(view[offset:offset + length]))
+            offset += length
+        
+        return Protocol._restore_attachments(Serializer.deserialize(payload, codec), attachments)
+    
+    @staticmethod
+    def _decode_frame_bytes(data: bytes, allow_pickle: bool) -> Dict[str, Any]:
+        header_size = Protocol.FRAME_HEADER.size
+        if len(data) < header_size:
+            raise ValueError(f"Mensaje incompleto: {len(data)} bytes")
+        
+        codec, flags, payload_len, attachments_len = Protocol._parse_frame_header(
+            data[:header_size], allow_pickle
+        )
+        
+        expected_total = header_size + payload_len + attachments_len
+        if len(data) < expected_total:
+            raise ValueError(
+                f"Mensaje incompleto: esperado {expected_total}, recibido {len(data)}"
+            )
+        
+        payload_end = header_size + payload_len
+        return Protocol._decode_frame_body(
+            codec, flags, data[header_size:payload_end], data[payload_end:expected_total]
+        )
+    
+    @staticmethod
+    def _extract_attachments(value: Any, attachments: List[bytes]) -> Any:
+        """Saca los bytes (PNG, etc.) del payload para enviarlos crudos, sin base64."""
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            attachments.append(bytes(value) if not isinstance(value, bytes) else value)
+            return {Protocol.ATTACHMENT_KEY: len(attachments) - 1}
+        if isinstance(value, dict):
+            return {k: Protocol._extract_attachments(v, attachments) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [Protocol._extract_attachments(v, attachments) for v in value]
+        return value
+    
+    @staticmethod
+    def _restore_attachments(value: Any, attachments: List[bytes]) -> Any:
+        if not attachments:
+            return value
+        if isinstance(value, dict):
+            if len(value) == 1 and Protocol.ATTACHMENT_KEY in value:
+                return attachments[value[Protocol.ATTACHMENT_KEY]]
+            return {k: Protocol._restore_attachments(v, attachments) for k, v in value.items()}
+        if isinstance(value, list):
+            return [Protocol._restore_attachments(v, attachments) for v in value]
+        return value
+    
     # ==================== MÉTODOS ASÍNCRONOS ====================
     
     @staticmethod
-    async def send_message_async(writer: asyncio.StreamWriter, data: Dict[str, Any]) -> None:
-        message = Protocol.encode_message(data)
-        writer.write(message)
+    async def send_message_async(writer: asyncio.StreamWriter, data: Dict[str, Any],
+                                 codec: Optional[SerializationFormat] = None,
+                                 compress: bool = False) -> None:
+        if codec is None:
+            writer.write(Protocol.encode_message(data))
+        else:
+            writer.writelines(Protocol._frame_parts(data, codec, compress))
         await writer.drain()
     
     @staticmethod
-    async def receive_message_async(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    async def receive_message_async(reader: asyncio.StreamReader,
+                                    allow_pickle: bool = False) -> Dict[str, Any]:
         # Leer header
         header = await reader.readexactly(Protocol.HEADER_SIZE)
+        
+        if header[0] == Protocol.FRAME_MAGIC:
+            header += await reader.readexactly(Protocol.FRAME_HEADER.size - Protocol.HEADER_SIZE)
+            codec, flags, payload_len, attachments_len = Protocol._parse_frame_header(header, allow_pickle)
+            payload = await reader.readexactly(payload_len)
+            attachments_data = await reader.readexactly(attachments_len) if attachments_len else b''
+            return Protocol._decode_frame_body(codec, flags, payload, attachments_data)
+        
         length = struct.unpack('!I', header)[0]
         
         if length > Protocol.MAX_MESSAGE_SIZE:
@@ -67,14 +239,27 @@ class Protocol:
     # ==================== MÉTODOS SÍNCRONOS ====================
     
     @staticmethod
-    def send_message_sync(sock: socket.socket, data: Dict[str, Any]) -> None:
-        message = Protocol.encode_message(data)
-        sock.sendall(message)
+    def send_message_sync(sock: socket.socket, data: Dict[str, Any],
+                          codec: Optional[SerializationFormat] = None,
+                          compress: bool = False) -> None:
+        if codec is None:
+            sock.sendall(Protocol.encode_message(data))
+        else:
+            for part in Protocol._frame_parts(data, codec, compress):
+                sock.sendall(part)
     
     @staticmethod
-    def receive_message_sync(sock: socket.socket) -> Dict[str, Any]:
+    def receive_message_sync(sock: socket.socket, allow_pickle: bool = False) -> Dict[str, Any]:
         # Leer header
         header = Protocol._recv_exact(sock, Protocol.HEADER_SIZE)
+        
+        if header[0] == Protocol.FRAME_MAGIC:
+            header += Protocol._recv_exact(sock, Protocol.FRAME_HEADER.size - Protocol.HEADER_SIZE)
+            codec, flags, payload_len, attachments_len = Protocol._parse_frame_header(header, allow_pickle)
+            payload = Protocol._recv_exact(sock, payload_len)
+            attachments_data = Protocol._recv_exact(sock, attachments_len) if attachments_len else b''
+            return Protocol._decode_frame_body(codec, flags, payload, attachments_data)
+        
         length = struct.unpack('!I', header)[0]
         
         if length > Protocol.MAX_MESSAGE_SIZE:
@@ -86,16 +271,18 @@ class Protocol:
     
     @staticmethod
     def _recv_exact(sock: socket.socket, num_bytes: int) -> bytes:
-        data = b''
-        while len(data) < num_bytes:
-            chunk = sock.recv(min(4096, num_bytes - len(data)))
-            if not chunk:
+        buffer = bytearray(num_bytes)
+        view = memoryview(buffer)
+        received = 0
+        while received < num_bytes:
+            count = sock.recv_into(view[received:], min(65536, num_bytes - received))
+            if not count:
                 raise ConnectionError("Conexión cerrada por el peer")
-            data += chunk
-        return data
+            received += count
+        return bytes(buffer)
 
 
-class MessageType:    
+class MessageType:
     # Requests
     SCRAPE_REQUEST = "scrape_request"
     SCREENSHOT_REQUEST = "screenshot_request"
@@ -110,6 +297,24 @@ class MessageType:
     PING = "ping"
     PONG = "pong"
     SHUTDOWN = "shutdown"
+    HELLO = "hello"  # Negociación de codec al conectar
+
+
+def negotiate_codec(offered: List[str], supported: List[SerializationFormat]) -> SerializationFormat:
+    """Elige el primer codec que ambos lados soportan (preferencia del servidor)."""
+    offered = set(offered or [])
+    for codec in supported:
+        if codec.value in offered:
+            return codec
+    return SerializationFormat.JSON
+
+
+# Ids de request para multiplexar varias tareas sobre una misma conexión
+_request_ids = itertools.count(1)
+
+
+def next_request_id() -> int:
+    return next(_request_ids)
 
 
 def create_request(msg_type: str, url: str, **kwargs) -> Dict[str, Any]:
@@ -120,7 +325,8 @@ def create_request(msg_type: str, url: str, **kwargs) -> Dict[str, Any]:
     }
 
 
-def create_response(success: bool, result: Any = None, error: str = None) -> Dict[str, Any]:
+def create_response(success: bool, result: Any = None, error: str = None,
+                    request_id: Optional[int] = None) -> Dict[str, Any]:
     response = {
         "type": MessageType.SUCCESS_RESPONSE if success else MessageType.ERROR_RESPONSE,
         "success": success
@@ -131,4 +337,50 @@ def create_response(success: bool, result: Any = None, error: str = None) -> Dic
     else:
         response["error"] = error or "Unknown error"
     
-    return response
\ No newline at end of file
+    # Solo se agrega si el request lo traía (clientes viejos no lo usan)
+    if request_id is not None:
+        response["id"] = request_id
+    
+    return response
+
+
+# Nivel bajo a propósito: comprime un HTML típico ~5x en pocos ms sin frenar el loop
+PAGE_COMPRESS_LEVEL = 1
+
+
+def create_page_snapshot(html: str, status_code: int, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Página que el servidor A ya descargó (body, headers y tiempos), para que
+    el B trabaje sobre ella en vez de volver a pedirla al origen.
+    
+    El body viaja comprimido con zlib y como bytes: en un frame v2 es un
+    adjunto binario; JSON legacy no puede llevarlo.
+    """
+    body = html.encode('utf-8')
+    return {
+        "body": zlib.compress(body, PAGE_COMPRESS_LEVEL),
+        "encoding": "zlib",
+        "size": len(body),
+        "bytes_read": metadata.get('bytes_read', len(body)),
+        "status_code": status_code,
+        "final_url": metadata.get('final_url'),
+        "content_type": metadata.get('content_type'),
+        "redirect_count": metadata.get('redirect_count', 0),
+        "headers": metadata.get('headers') or {},
+        "timing": metadata.get('timing') or {}
+    }
+
+
+def open_page_snapshot(snapshot: Dict[str, Any]) -> str:
+    """HTML de un snapshot; lo descomprimido queda acotado como cualquier adjunto."""
+    body = snapshot.get('body')
+    if not isinstance(body, bytes):
+        raise ValueError("Snapshot de página sin body binario")
+    
+    if snapshot.get('encoding') == 'zlib':
+        decompressor = zlib.decompressobj()
+        body = decompressor.decompress(body, Protocol.MAX_ATTACHMENTS_SIZE + 1)
+        if len(body) > Protocol.MAX_ATTACHMENTS_SIZE or decompressor.unconsumed_tail:
+            raise ValueError("Snapshot de página demasiado grande tras descomprimir")
+    
+    return body.decode('utf-8', errors='replace')
@@ -1,77 +1,152 @@
 import time
+import asyncio
 from urllib.parse import urlparse
-from typing import Dict
-from collections import deque
+from typing import Dict, List, Optional, Tuple
 
 
-class RateLimiter:    
-    def __init__(self, max_requests: int = 10, window_seconds: int = 60):
+class RateLimiter:
+    """
+    Token bucket por dominio: max_requests de ráfaga y reposición continua
+    a max_requests / window_seconds por segundo.
+    
+    Cada dominio ocupa un bucket de tamaño fijo [tokens, último refill]. Un
+    bucket que volvió a estar lleno equivale a no tenerlo, así que los
+    dominios inactivos se descartan.
+    
+    acquire() espera su turno en vez de fallar: reserva el token aunque el
+    bucket quede en negativo y duerme lo que falta, así los que esperan se
+    atienden en orden y el throughput queda justo en la tasa permitida.
+    """
+    
+    def __init__(self, max_requests: int = 10, window_seconds: int = 60,
+                 overrides: Optional[Dict[str, Tuple[int, float]]] = None,
+                 idle_seconds: Optional[float] = None):
         self.max_requests = max_requests
         self.window = window_seconds
-        self._requests: Dict[str, deque] = {}  # domain -> timestamps
+        # dominio -> (max_requests, window_seconds)
+        self.overrides: Dict[str, Tuple[int, float]] = {
+            domain.lower(): limit for domain, limit in (overrides or {}).items()
+        }
+        # Cada cuánto barrer buckets llenos (default: una ventana)
+        self.idle_seconds = idle_seconds if idle_seconds is not None else window_seconds
+        self._buckets: Dict[str, List[float]] = {}  # domain -> [tokens, updated_at]
+        self._last_sweep = time.monotonic()
+        
+        # Métricas
+        self.granted = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.rejected = 0
+        self.evicted = 0
     
     def _get_domain(self, url: str) -> str:
         parsed = urlparse(url)
-        return parsed.netloc or url
+        return (parsed.netloc or url).lower()
     
-    def can_request(self, url: str) -> bool:
-        domain = self._get_domain(url)
-        now = time.time()
-        
-        # Inicializar si no existe
-        if domain not in self._requests:
-            self._requests[domain] = deque()
-        
-        # Limpiar requests viejos
-        requests = self._requests[domain]
-        while requests and requests[0] < now - self.window:
-            requests.popleft()
+    def limit_for(self, domain: str) -> Tuple[int, float]:
+        return self.overrides.get(domain, (self.max_requests, self.window))
+    
+    def set_limit(self, domain: str, max_requests: int, window_seconds: float):
+        domain = domain.lower()
+        self.overrides[domain] = (max_requests, window_seconds)
+        self._buckets.pop(domain, None)
+    
+    def _refilled(self, domain: str, now: float) -> float:
+        tokens, updated_at = self._buckets[domain]
+        capacity, window = self.limit_for(domain)
+        return min(float(capacity), tokens + (now - updated_at) * capacity / window)
+    
+    def _bucket(self, domain: str) -> List[float]:
+        """Bucket del dominio con los tokens repuestos hasta ahora."""
+        now = time.monotonic()
+        if now - self._last_sweep >= self.idle_seconds:
+            self._evict_idle(now)
         
-        # Verificar límite
-        return len(requests) < self.max_requests
+        bucket = self._buckets.get(domain)
+        if bucket is None:
+            bucket = self._buckets[domain] = [float(self.limit_for(domain)[0]), now]
+        else:
+            bucket[0] = self._refilled(domain, now)
+            bucket[1] = now
+        return bucket
+    
+    def _evict_idle(self, now: float):
+        self._last_sweep = now
+        for domain in list(self._buckets):
+            if self._refilled(domain, now) >= self.limit_for(domain)[0]:
+                del self._buckets[domain]
+                self.evicted += 1
+    
+    def _deficit_wait(self, domain: str, tokens: float) -> float:
+        capacity, window = self.limit_for(domain)
+        return max(0.0, (1 - tokens) * window / capacity)
+    
+    def can_request(self, url: str) -> bool:
+        return self._bucket(self._get_domain(url))[0] >= 1
     
     def record_request(self, url: str):
-        domain = self._get_domain(url)
-        now = time.time()
-        
-        if domain not in self._requests:
-            self._requests[domain] = deque()
-        
-        self._requests[domain].append(now)
+        self._bucket(self._get_domain(url))[0] -= 1
+        self.granted += 1
     
     def wait_time(self, url: str) -> float:
-        if self.can_request(url):
-            return 0.0
-        
         domain = self._get_domain(url)
-        requests = self._requests[domain]
+        return self._deficit_wait(domain, self._bucket(domain)[0])
+    
+    async def acquire(self, url: str, max_wait: Optional[float] = None) -> bool:
+        """
+        Toma un token para el dominio de url, esperando si hace falta.
+        Devuelve False sin consumir nada si la espera superaría max_wait
+        (None = esperar lo necesario, 0 = no esperar).
+        """
+        domain = self._get_domain(url)
+        bucket = self._bucket(domain)
+        wait = self._deficit_wait(domain, bucket[0])
         
-        if not requests:
-            return 0.0
+        if max_wait is not None and wait > max_wait:
+            self.rejected += 1
+            return False
         
-        # Tiempo hasta que expire el request más viejo
-        oldest = requests[0]
-        now = time.time()
-        wait = self.window - (now - oldest)
+        # Reservar ya: el próximo que llegue calcula su espera detrás de esta
+        bucket[0] -= 1
+        self.granted += 1
         
-        return max(0.0, wait)
+        if wait > 0:
+            self.waited += 1
+            self.total_wait += wait
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Devolver la reserva para no frenar a los que vienen atrás
+                self._bucket(domain)[0] += 1
+                self.granted -= 1
+                raise
+        return True
     
     def reset(self, url: str = None):
         if url is None:
-            self._requests.clear()
+            self._buckets.clear()
         else:
-            domain = self._get_domain(url)
-            if domain in self._requests:
-                self._requests[domain].clear()
+            self._buckets.pop(self._get_domain(url), None)
     
     def stats(self) -> Dict[str, any]:
+        now = time.monotonic()
         return {
-            "domains": len(self._requests),
+            "algorithm": "token_bucket",
+            "domains": len(self._buckets),
             "max_requests": self.max_requests,
             "window_seconds": self.window,
-            "requests_by_domain": {
-                domain: len(requests)
-                for domain, requests in self._requests.items()
+            "overrides": {
+                domain: {"max_requests": limit[0], "window_seconds": limit[1]}
+                for domain, limit in self.overrides.items()
+            },
+            "granted": self.granted,
+            "waited": self.waited,
+            "avg_wait_seconds": round(self.total_wait / self.waited, 3) if self.waited else 0,
+            "rejected": self.rejected,
+            "evicted_domains": self.evicted,
+            "tokens_by_domain": {
+                domain: round(self._refilled(domain, now), 2)
+                for domain in self._buckets
             }
         }
 
@@ -81,4 +156,22 @@ _global_limiter = RateLimiter(max_requests=10, window_seconds=60)
 
 
 def get_rate_limiter() -> RateLimiter:
-    return _global_limiter
\ No newline at end of file
+    return _global_limiter
+
+
+def configure_rate_limiter(max_requests: int = 10, window_seconds: int = 60,
+                           overrides: Optional[Dict[str, Tuple[int, float]]] = None) -> RateLimiter:
+    """Reemplaza la instancia global con los límites dados."""
+    global _global_limiter
+    _global_limiter = RateLimiter(max_requests, window_seconds, overrides)
+    return _global_limiter
+
+
+def parse_override(spec: str) -> Tuple[str, Tuple[int, float]]:
+    """'example.com=30/60' -> ('example.com', (30, 60.0))"""
+    try:
+        domain, limit = spec.split('=', 1)
+        max_requests, window = limit.split('/', 1)
+        return domain.strip().lower(), (int(max_requests), float(window))
+    except ValueError:
+        raise ValueError(f"Invalid rate limit override '{spec}', expected DOMAIN=REQUESTS/SECONDS")
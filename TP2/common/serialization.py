@@ -1,13 +1,19 @@
 import json
 import pickle
 import base64
-from typing import Any, Dict
+from typing import Any, Dict, List
 from enum import Enum
 
+try:
+    import msgpack
+except ImportError:  # Dependencia opcional: sin msgpack se negocia JSON
+    msgpack = None
+
 
 class SerializationFormat(Enum):
     JSON = "json"
     PICKLE = "pickle"
+    MSGPACK = "msgpack"
 
 
 class Serializer:    
@@ -17,6 +23,8 @@ class Serializer:
             return Serializer._serialize_json(data)
         elif format == SerializationFormat.PICKLE:
             return Serializer._serialize_pickle(data)
+        elif format == SerializationFormat.MSGPACK:
+            return Serializer._serialize_msgpack(data)
         else:
             raise ValueError(f"Formato no soportado: {format}")
     
@@ -26,9 +34,18 @@ class Serializer:
             return Serializer._deserialize_json(data)
         elif format == SerializationFormat.PICKLE:
             return Serializer._deserialize_pickle(data)
+        elif format == SerializationFormat.MSGPACK:
+            return Serializer._deserialize_msgpack(data)
         else:
             raise ValueError(f"Formato no soportado: {format}")
     
+    @staticmethod
+    def available_formats() -> List[SerializationFormat]:
+        formats = [SerializationFormat.JSON, SerializationFormat.PICKLE]
+        if msgpack is not None:
+            formats.insert(0, SerializationFormat.MSGPACK)
+        return formats
+    
     @staticmethod
     def _serialize_json(data: Any) -> bytes:
         return json.dumps(data, ensure_ascii=False).encode('utf-8')
@@ -44,6 +61,18 @@ class Serializer:
     @staticmethod
     def _deserialize_pickle(data: bytes) -> Any:
         return pickle.loads(data)
+    
+    @staticmethod
+    def _serialize_msgpack(data: Any) -> bytes:
+        if msgpack is None:
+            raise ValueError("Formato no soportado: msgpack no está instalado")
+        return msgpack.packb(data, use_bin_type=True)
+    
+    @staticmethod
+    def _deserialize_msgpack(data: bytes) -> Any:
+        if msgpack is None:
+            raise ValueError("Formato no soportado: msgpack no está instalado")
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
 
 
 class Base64Helper:    
@@ -0,0 +1,68 @@
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalescing de requests concurrentes: mientras hay trabajo en vuelo
+    para una clave, los pedidos con la misma clave esperan ese mismo
+    resultado en lugar de repetirlo.
+    
+    El trabajo corre en su propia task: si el cliente que lo inició
+    se desconecta, los demás siguen esperando el resultado.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        
+        # Métricas
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+    
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+    
+    async def do(self, key: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Ejecuta work() una sola vez por clave en vuelo.
+        Devuelve (resultado, shared): shared=True si se reutilizó un trabajo ajeno.
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        
+        if shared:
+            self.coalesced += 1
+            self._waiters[key] += 1
+            self.max_waiters = max(self.max_waiters, self._waiters[key])
+            logger.info(f"Coalescing request for {key} ({self._waiters[key]} waiting)")
+        else:
+            self.leaders += 1
+            task = asyncio.create_task(work())
+            self._calls[key] = task
+            self._waiters[key] = 1
+            task.add_done_callback(lambda _: self._forget(key, task))
+        
+        # shield: cancelar a un waiter no cancela el trabajo compartido
+        return await asyncio.shield(task), shared
+    
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "waiting": sum(self._waiters.values()),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total * 100, 2) if total else 0,
+            "max_waiters": self.max_waiters
+        }
@@ -0,0 +1,95 @@
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List
+
+# Fases que se agregan (las de RequestTiming.summary)
+PHASES = ('queued_ms', 'dns_ms', 'connect_ms', 'ttfb_ms', 'download_ms', 'total_ms')
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _DomainTiming:
+    __slots__ = ('requests', 'reused', 'sums', 'maxes', 'recent_ttfb', 'recent_total')
+    
+    def __init__(self, sample_size: int):
+        self.requests = 0
+        self.reused = 0
+        self.sums = dict.fromkeys(PHASES, 0.0)
+        self.maxes = dict.fromkeys(PHASES, 0.0)
+        # Solo TTFB y total guardan muestras: son los de los percentiles del SLO
+        self.recent_ttfb: Deque[float] = deque(maxlen=sample_size)
+        self.recent_total: Deque[float] = deque(maxlen=sample_size)
+
+
+class TimingStats:
+    """
+    Tiempos de red por dominio: promedio y máximo de cada fase, p50/p95 de
+    TTFB y total sobre los últimos sample_size requests, y qué fracción
+    reutilizó una conexión abierta.
+    
+    Memoria acotada: como mucho max_domains dominios (se olvida el usado
+    hace más tiempo).
+    """
+    
+    def __init__(self, max_domains: int = 1000, sample_size: int = 100):
+        self.max_domains = max_domains
+        self.sample_size = sample_size
+        self._domains: "OrderedDict[str, _DomainTiming]" = OrderedDict()
+        self.requests = 0
+    
+    def record(self, host: str, timing: Dict[str, Any]):
+        state = self._domains.get(host)
+        if state is None:
+            state = self._domains[host] = _DomainTiming(self.sample_size)
+            if len(self._domains) > self.max_domains:
+                self._domains.popitem(last=False)
+        else:
+            self._domains.move_to_end(host)
+        
+        self.requests += 1
+        state.requests += 1
+        state.reused += bool(timing.get('reused_connection'))
+        for phase in PHASES:
+            value = timing.get(phase) or 0.0
+            state.sums[phase] += value
+            state.maxes[phase] = max(state.maxes[phase], value)
+        state.recent_ttfb.append(timing.get('ttfb_ms') or 0.0)
+        state.recent_total.append(timing.get('total_ms') or 0.0)
+    
+    def domain_stats(self, host: str) -> Dict[str, Any]:
+        state = self._domains[host]
+        return {
+            "requests": state.requests,
+            "reused_pct": round(state.reused / state.requests * 100, 1),
+            "avg_ms": {
+                phase[:-3]: round(state.sums[phase] / state.requests, 2) for phase in PHASES
+            },
+            "max_ms": {phase[:-3]: state.maxes[phase] for phase in PHASES},
+            "ttfb_p50_ms": _percentile(state.recent_ttfb, 50),
+            "ttfb_p95_ms": _percentile(state.recent_ttfb, 95),
+            "total_p50_ms": _percentile(state.recent_total, 50),
+            "total_p95_ms": _percentile(state.recent_total, 95)
+        }
+    
+    def stats(self, top: int = 20) -> Dict[str, Any]:
+        busiest = sorted(self._domains, key=lambda host: self._domains[host].requests, reverse=True)[:top]
+        return {
+            "requests": self.requests,
+            "domains": len(self._domains),
+            "by_domain": {host: self.domain_stats(host) for host in busiest}
+        }
+    
+    def reset(self):
+        self._domains.clear()
+        self.requests = 0
+
+
+# Instancia global: la alimentan todos los clientes HTTP del proceso
+_global_timing_stats = TimingStats()
+
+
+def get_timing_stats() -> TimingStats:
+    return _global_timing_stats
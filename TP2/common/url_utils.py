@@ -0,0 +1,34 @@
+
+from urllib.parse import urlsplit, urlunsplit
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Forma canónica de una URL para usarla como clave:
+    esquema y host en minúsculas, sin puerto por defecto, sin fragmento
+    y con "/" como path mínimo. La query se conserva tal cual.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    
+    if ':' in host:
+        # IPv6
+        host = f'[{host}]'
+    
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    
+    netloc = host
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = f'{host}:{port}'
+    if parts.username:
+        userinfo = parts.username + (f':{parts.password}' if parts.password else '')
+        netloc = f'{userinfo}@{netloc}'
+    
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
@@ -0,0 +1,247 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+BROWSERS = ('chrome', 'firefox')
+DEFAULT_MAX_PAGES = 50
+# Tiempo extra sobre el deadline antes de dar por colgado al navegador
+HANG_GRACE = 5
+
+
+def launch_headless_browser(browser: str = 'chrome', width: int = 1920, height: int = 1080):
+    """WebDriver headless de Selenium; ImportError/WebDriverException si no hay navegador."""
+    from selenium import webdriver
+    
+    if browser == 'firefox':
+        options = webdriver.FirefoxOptions()
+        options.add_argument('-headless')
+        driver = webdriver.Firefox(options=options)
+        driver.set_window_size(width, height)
+        return driver
+    
+    options = webdriver.ChromeOptions()
+    for arg in ('--headless=new', '--no-sandbox', '--disable-dev-shm-usage', '--disable-gpu',
+                '--hide-scrollbars', '--mute-audio', f'--window-size={width},{height}'):
+        options.add_argument(arg)
+    return webdriver.Chrome(options=options)
+
+
+class _Browser:
+    __slots__ = ('driver', 'pages', 'size', 'broken')
+    
+    def __init__(self, driver, size):
+        self.driver = driver
+        self.pages = 0
+        self.size = size
+        self.broken = False
+    
+    def render(self, url: str, width: int, height: int, deadline: float) -> bytes:
+        from selenium.common.exceptions import TimeoutException
+        
+        driver = self.driver
+        if self.size != (width, height):
+            driver.set_window_size(width, height)
+            self.size = (width, height)
+        
+        driver.set_page_load_timeout(max(1, deadline))
+        try:
+            driver.get(url)
+        except TimeoutException:
+            # Lo que alcanzó a pintarse: cortar la carga y capturar igual
+            logger.warning(f"⏱️  Render de {url} cortado a los {deadline:.1f}s")
+            driver.execute_script('window.stop();')
+        
+        png = driver.get_screenshot_as_png()
+        self.pages += 1
+        # La pestaña se reutiliza: vaciarla para no arrastrar el JS de esta página
+        driver.get('about:blank')
+        return png
+    
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.debug(f"Error cerrando navegador: {e}")
+
+
+class BrowserPool:
+    """
+    Navegadores headless lanzados de antemano para screenshots reales.
+    
+    - Cada navegador tiene una sola pestaña que se reutiliza entre renders.
+    - Tras max_pages renders (o si falla) se cierra y se lanza otro en
+      segundo plano: la memoria de Chrome no crece sin límite.
+    - render() tiene deadline: a tiempo la carga se corta y se captura lo
+      pintado; si el navegador ni responde, se mata y se reemplaza.
+    - Selenium es bloqueante: cada render corre en un thread propio; el
+      event loop nunca espera al navegador.
+    
+    Sin Selenium o sin navegador instalado start() devuelve 0, available
+    queda en False y el servidor sigue con el placeholder de PIL.
+    """
+    
+    def __init__(self, size: int = 2, browser: str = 'chrome', max_pages: int = DEFAULT_MAX_PAGES,
+                 width: int = 1920, height: int = 1080,
+                 launcher: Optional[Callable[[int, int], Any]] = None):
+        if browser not in BROWSERS:
+            raise ValueError(f"Unknown browser: {browser}")
+        self.size = max(1, size)
+        self.browser = browser
+        self.max_pages = max(1, max_pages)
+        self.width = width
+        self.height = height
+        self._launcher = launcher or (lambda w, h: launch_headless_browser(browser, w, h))
+        
+        self._idle: "queue.Queue[_Browser]" = queue.Queue()
+        self._all: List[_Browser] = []
+        self._lock = threading.Lock()
+        # Renders: un thread por navegador. Lanzar/cerrar va aparte para que
+        # los renders que esperan navegador no demoren al reemplazo
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='browser')
+        self._maintenance = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='browser-launch')
+        self.closed = False
+        
+        # Métricas
+        self.launched = 0
+        self.launch_failures = 0
+        self.renders = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.total_render_time = 0.0
+    
+    @property
+    def available(self) -> bool:
+        # Mientras se recicla un navegador los renders esperan al reemplazo
+        return not self.closed and self.launched > 0
+    
+    def start(self) -> int:
+        """Lanza los navegadores en paralelo (bloqueante); devuelve cuántos quedaron listos."""
+        futures = [self._maintenance.submit(self._launch) for _ in range(self.size)]
+        ready = sum(1 for future in futures if future.result())
+        if ready:
+            logger.info(f"🌐 {ready} navegadores {self.browser} listos para screenshots")
+        else:
+            logger.warning(f"⚠️  Sin navegador {self.browser}: screenshots con placeholder")
+        return ready
+    
+    def _launch(self) -> bool:
+        try:
+            browser = _Browser(self._launcher(self.width, self.height), (self.width, self.height))
+        except Exception as e:
+            # ImportError (sin Selenium) o WebDriverException (sin navegador/driver)
+            self.launch_failures += 1
+            logger.warning(f"No se pudo lanzar {self.browser}: {e}")
+            return False
+        
+        with self._lock:
+            if self.closed:
+                browser.quit()
+                return False
+            self._all.append(browser)
+            self.launched += 1
+        self._idle.put(browser)
+        return True
+    
+    def _retire(self, browser: _Browser):
+        """Cierra un navegador gastado o roto y lanza su reemplazo."""
+        with self._lock:
+            if browser in self._all:
+                self._all.remove(browser)
+        browser.quit()
+        self.recycled += 1
+        if not self.closed:
+            self._launch()
+    
+    def _release(self, browser: _Browser):
+        if self.closed:
+            browser.quit()
+        elif browser.broken or browser.pages >= self.max_pages:
+            self._maintenance.submit(self._retire, browser)
+        else:
+            self._idle.put(browser)
+    
+    def _render_blocking(self, url: str, width: int, height: int, deadline: float,
+                         holder: Dict[str, _Browser]) -> Optional[bytes]:
+        waiting_since = time.perf_counter()
+        try:
+            browser = self._idle.get(timeout=deadline)
+        except queue.Empty:
+            return None
+        
+        # El deadline es de todo el pedido: la espera por un navegador libre cuenta
+        remaining = deadline - (time.perf_counter() - waiting_since)
+        if remaining <= 0:
+            self._release(browser)
+            return None
+        
+        holder['browser'] = browser
+        start = time.perf_counter()
+        try:
+            png = browser.render(url, width, height, remaining)
+            self.renders += 1
+            self.total_render_time += time.perf_counter() - start
+            return png
+        except Exception as e:
+            self.failures += 1
+            browser.broken = True
+            logger.warning(f"❌ Render de {url} falló: {e}")
+            return None
+        finally:
+            self._release(browser)
+    
+    async def render(self, url: str, width: Optional[int] = None, height: Optional[int] = None,
+                     deadline: float = 15) -> Optional[bytes]:
+        """PNG de la página, o None si no hay navegador libre o el render falló."""
+        if not self.available:
+            return None
+        
+        holder: Dict[str, _Browser] = {}
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._executor, self._render_blocking,
+            url, width or self.width, height or self.height, deadline, holder
+        )
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=deadline + HANG_GRACE)
+        except asyncio.TimeoutError:
+            # Colgado dentro de Selenium: matar el driver destraba el thread
+            self.timeouts += 1
+            browser = holder.get('browser')
+            if browser is not None and not self.closed:
+                browser.broken = True
+                self._maintenance.submit(browser.quit)
+            return None
+    
+    def close(self):
+        with self._lock:
+            self.closed = True
+            browsers, self._all = self._all, []
+        for browser in browsers:
+            browser.quit()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._maintenance.shutdown(wait=False, cancel_futures=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            alive = len(self._all)
+        return {
+            "browser": self.browser,
+            "size": self.size,
+            "alive": alive,
+            "idle": self._idle.qsize(),
+            "max_pages": self.max_pages,
+            "renders": self.renders,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "recycled": self.recycled,
+            "launch_failures": self.launch_failures,
+            "avg_render_ms": round(self.total_render_time / self.renders * 1000, 1) if self.renders else 0
+        }
@@ -0,0 +1,139 @@
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # Dependencia opcional: sin NumPy no hay analytics (solo color dominante)
+    np = None
+
+# Lado máximo de la muestra analizada: el costo depende de esto, no de la imagen original
+ANALYTICS_MAX_SIDE = 150
+PALETTE_SIZE = 5
+HISTOGRAM_BINS = 16
+# Bits por canal al agrupar colores de la paleta (3 -> 512 cubos RGB)
+PALETTE_BITS = 3
+# Píxeles con alpha por debajo de esto no cuentan para paleta ni brillo
+VISIBLE_ALPHA = 128
+
+# Luma ITU-R 601, la misma que usa PIL al convertir a 'L'
+_LUMA = (0.299, 0.587, 0.114)
+
+
+def downsample(img: 'Image.Image', max_side: int = ANALYTICS_MAX_SIDE) -> 'Image.Image':
+    """img si ya es chica; si no, una copia reducida con reduce() + BILINEAR (rápido)."""
+    from PIL import Image
+    
+    if max(img.size) <= max_side:
+        return img
+    sample = img.copy()
+    sample.thumbnail((max_side, max_side), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return sample
+
+
+def _to_rgba_array(img: 'Image.Image') -> 'np.ndarray':
+    if img.mode not in ('RGB', 'RGBA'):
+        # P con transparencia, LA, L, CMYK, I;16...: todo a RGBA
+        img = img.convert('RGBA')
+    pixels = np.asarray(img, dtype=np.uint8)
+    if pixels.shape[-1] == 3:
+        alpha = np.full(pixels.shape[:2] + (1,), 255, dtype=np.uint8)
+        pixels = np.concatenate((pixels, alpha), axis=-1)
+    return pixels
+
+
+def _palette(rgb: 'np.ndarray', k: int) -> List[Dict[str, Any]]:
+    """
+    Los k colores más frecuentes: se agrupa cada píxel en un cubo RGB de
+    PALETTE_BITS bits por canal y se reporta el color medio de cada cubo.
+    """
+    if not len(rgb):
+        return []
+    
+    shift = 8 - PALETTE_BITS
+    quantized = (rgb >> shift).astype(np.int32)
+    bins = (quantized[:, 0] << (2 * PALETTE_BITS)) | (quantized[:, 1] << PALETTE_BITS) | quantized[:, 2]
+    
+    n_bins = 1 << (3 * PALETTE_BITS)
+    counts = np.bincount(bins, minlength=n_bins)
+    top = np.argsort(counts)[::-1][:k]
+    top = top[counts[top] > 0]
+    
+    sums = np.stack([np.bincount(bins, weights=rgb[:, channel], minlength=n_bins)
+                     for channel in range(3)], axis=1)
+    means = np.rint(sums[top] / counts[top, None]).astype(int)
+    
+    return [
+        {
+            'r': int(r), 'g': int(g), 'b': int(b),
+            'hex': f'#{int(r):02x}{int(g):02x}{int(b):02x}',
+            'share': round(float(count) / len(rgb), 4)
+        }
+        for (r, g, b), count in zip(means, counts[top])
+    ]
+
+
+def _laplacian_variance(luma: 'np.ndarray') -> float:
+    """Varianza del laplaciano 4-vecinos: baja = borrosa, alta = bordes definidos."""
+    if luma.shape[0] < 3 or luma.shape[1] < 3:
+        return 0.0
+    laplacian = (luma[:-2, 1:-1] + luma[2:, 1:-1] + luma[1:-1, :-2] + luma[1:-1, 2:]
+                 - 4 * luma[1:-1, 1:-1])
+    return float(laplacian.var())
+
+
+def analyze_image(img: 'Image.Image', palette_size: int = PALETTE_SIZE,
+                  max_side: int = ANALYTICS_MAX_SIDE) -> Optional[Dict[str, Any]]:
+    """
+    Paleta, brillo/contraste, nitidez y transparencia de img.
+    
+    Trabaja sobre una muestra de como mucho max_side de lado (lo ideal es
+    pasar el thumbnail, que ya está reducido): el costo no depende de la
+    resolución original. La nitidez se mide a ese tamaño, así que es
+    comparable entre imágenes analizadas con el mismo max_side.
+    
+    Devuelve None si NumPy no está instalado.
+    """
+    if np is None:
+        return None
+    
+    sample = downsample(img, max_side)
+    pixels = _to_rgba_array(sample)
+    height, width = pixels.shape[:2]
+    total = height * width
+    
+    alpha = pixels[..., 3]
+    visible = alpha >= VISIBLE_ALPHA
+    rgb = pixels[..., :3]
+    
+    luma = rgb.astype(np.float32) @ np.array(_LUMA, dtype=np.float32)
+    visible_luma = luma[visible]
+    if visible_luma.size:
+        histogram, _ = np.histogram(visible_luma, bins=HISTOGRAM_BINS, range=(0, 256))
+        low, high = np.percentile(visible_luma, (5, 95))
+        brightness = {
+            'mean': round(float(visible_luma.mean()), 2),
+            # Contraste RMS: desvío estándar de la luma
+            'contrast': round(float(visible_luma.std()), 2),
+            'dynamic_range': round(float(high - low), 2),
+            'histogram': [round(float(value), 4) for value in histogram / visible_luma.size]
+        }
+    else:
+        brightness = {'mean': 0.0, 'contrast': 0.0, 'dynamic_range': 0.0,
+                      'histogram': [0.0] * HISTOGRAM_BINS}
+    
+    has_alpha = 'A' in sample.getbands() or 'transparency' in sample.info
+    transparent = int(np.count_nonzero(alpha == 0))
+    opaque = int(np.count_nonzero(alpha == 255))
+    
+    return {
+        'sample_size': {'width': width, 'height': height},
+        'palette': _palette(rgb[visible], palette_size),
+        'brightness': brightness,
+        'sharpness': round(_laplacian_variance(luma), 2),
+        'transparency': {
+            'has_alpha': has_alpha,
+            'transparent_pct': round(transparent / total * 100, 2),
+            'translucent_pct': round((total - transparent - opaque) / total * 100, 2),
+            'mean_alpha': round(float(alpha.mean()), 2)
+        }
+    }
+
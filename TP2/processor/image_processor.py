@@ -1,104 +1,268 @@
 
 import base64
+import asyncio
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union, AsyncIterator, Optional, Tuple
 from io import BytesIO
 
 logger = logging.getLogger(__name__)
 
 
-def process_images(image_urls: List[str], max_images: int = 5) -> List[Dict[str, Any]]:
-    import requests
+# Tope por imagen descargada: una imagen enorme no llena la memoria del servidor
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+DOWNLOAD_TIMEOUT = 5
+THUMBNAIL_SIZE = (150, 150)
+
+# Presets de thumbnail: velocidad vs calidad
+#   draft: decodificar el JPEG ya reducido (DCT a 1/2, 1/4 o 1/8) en vez de todos los píxeles
+#   reducing_gap: reduce() entero primero y el filtro solo en el último tramo
+#   resample: filtro del tramo final (en reducciones grandes casi no se nota)
+THUMBNAIL_PRESETS = {
+    'fast': {
+        'draft': True,
+        'reducing_gap': 2.0,
+        'resample': 'BILINEAR',
+        'format': 'JPEG',
+        'quality': 75,
+        'optimize': False,
+        'flatten': False
+    },
+    'balanced': {
+        'draft': True,
+        'reducing_gap': 3.0,
+        'resample': 'BICUBIC',
+        'format': 'WEBP',
+        'quality': 80,
+        'optimize': False,
+        'flatten': False
+    },
+    # Comportamiento original: todos los píxeles, LANCZOS, transparencia
+    # sobre fondo blanco y PNG optimizado (mismos bytes que antes)
+    'quality': {
+        'draft': False,
+        'reducing_gap': 2.0,
+        'resample': 'LANCZOS',
+        'format': 'PNG',
+        'quality': None,
+        'optimize': True,
+        'flatten': True
+    }
+}
+
+DEFAULT_THUMBNAIL_PRESET = 'fast'
+
+
+async def download_images(image_urls: List[str], session=None,
+                          max_bytes: int = MAX_IMAGE_BYTES,
+                          timeout: int = DOWNLOAD_TIMEOUT) -> AsyncIterator[Tuple[str, Optional[bytes]]]:
+    """
+    Descarga todas las imágenes a la vez y entrega (url, bytes) en el orden
+    en que terminan; bytes es None si la descarga falló.
+    
+    La concurrencia real la acota el OutboundGovernor compartido (global y
+    por host), así muchas imágenes del mismo CDN no abren decenas de conexiones.
+    """
+    from scraper.async_http import AsyncHTTPClient
+    
+    async with AsyncHTTPClient(timeout=timeout, session=session, max_bytes=max_bytes,
+                               content_types=('image/',)) as client:
+        
+        async def download(url: str) -> Tuple[str, Optional[bytes]]:
+            try:
+                data, status, _ = await client.fetch_bytes(url)
+                if status != 200:
+                    logger.warning(f"Error descargando {url}: HTTP {status}")
+                    return url, None
+                return url, data
+            except Exception as e:
+                logger.warning(f"Error descargando {url}: {e}")
+                return url, None
+        
+        tasks = [asyncio.ensure_future(download(url)) for url in image_urls]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def process_image_bytes(url: str, img_data: bytes, binary_output: bool = False,
+                        preset: str = DEFAULT_THUMBNAIL_PRESET) -> Optional[Dict[str, Any]]:
+    """Decode + thumbnail + metadata de una imagen ya descargada (CPU-bound)."""
     from PIL import Image
     
-    logger.info(f"Procesando {min(len(image_urls), max_images)} imágenes")
+    try:
+        img = Image.open(BytesIO(img_data))
+        
+        # Antes del thumbnail: con draft el JPEG se decodifica ya reducido
+        original_size = img.size
+        img_format = img.format or 'UNKNOWN'
+        
+        thumb = _thumbnail_image(img, THUMBNAIL_SIZE, preset)
+        thumbnail_data = _encode_thumbnail(thumb, preset, as_bytes=binary_output)
+        
+        # Analytics sobre el thumbnail: el costo no depende de la resolución original
+        metadata = extract_image_metadata(img, sample=thumb)
+        
+        return {
+            "url": url,
+            "thumbnail": thumbnail_data,
+            "original_size": {
+                "width": original_size[0],
+                "height": original_size[1]
+            },
+            "thumbnail_size": {
+                "width": THUMBNAIL_SIZE[0],
+                "height": THUMBNAIL_SIZE[1]
+            },
+            "format": img_format,
+            "thumbnail_format": THUMBNAIL_PRESETS[preset]['format'],
+            "size_bytes": len(img_data),
+            "mode": img.mode,
+            **metadata
+        }
+    
+    except Exception as e:
+        logger.warning(f"Error procesando {url}: {e}")
+        return None
+
+
+def process_images(image_urls: List[str], max_images: int = 5,
+                   binary_output: bool = False,
+                   preset: str = DEFAULT_THUMBNAIL_PRESET) -> List[Dict[str, Any]]:
+    """
+    Versión sincrónica: descargas en paralelo y procesamiento en este proceso.
+    El servidor usa WorkerPool.process_images_async, que además reparte el
+    procesamiento entre los workers del pool.
+    """
+    image_urls = image_urls[:max_images]
+    logger.info(f"Procesando {len(image_urls)} imágenes")
+    
+    async def download_all():
+        return [item async for item in download_images(image_urls)]
     
-    results = []
+    downloaded = dict(asyncio.run(download_all())) if image_urls else {}
     
-    for i, url in enumerate(image_urls[:max_images]):
-        try:
-            logger.debug(f"Descargando imagen {i+1}/{max_images}: {url}")
-            
-            response = requests.get(
-                url,
-                timeout=5,
-                stream=True,
-                headers={'User-Agent': 'Mozilla/5.0'}
-            )
-            
-            if response.status_code != 200:
-                logger.warning(f"Error descargando {url}: HTTP {response.status_code}")
-                continue
-            
-            img_data = response.content
-            img = Image.open(BytesIO(img_data))
-            
-            original_size = img.size
-            img_format = img.format or 'UNKNOWN'
-            
-            thumbnail_data = create_thumbnail(img, size=(150, 150))
-            
-            metadata = extract_image_metadata(img)
-            
-            result = {
-                "url": url,
-                "thumbnail": thumbnail_data,
-                "original_size": {
-                    "width": original_size[0],
-                    "height": original_size[1]
-                },
-                "thumbnail_size": {
-                    "width": 150,
-                    "height": 150
-                },
-                "format": img_format,
-                "size_bytes": len(img_data),
-                "mode": img.mode,
-                **metadata
-            }
-            
+    results = []
+    for url in image_urls:
+        if downloaded.get(url) is None:
+            continue
+        result = process_image_bytes(url, downloaded[url], binary_output, preset)
+        if result:
             results.append(result)
             logger.debug(f"Imagen procesada: {url}")
-            
-        except requests.Timeout:
-            logger.warning(f"Timeout descargando {url}")
-            continue
-            
-        except requests.RequestException as e:
-            logger.warning(f"Error de red descargando {url}: {e}")
-            continue
-            
-        except Exception as e:
-            logger.warning(f"Error procesando {url}: {e}")
-            continue
     
     logger.info(f"Procesadas {len(results)} de {len(image_urls)} imágenes")
     return results
 
 
-def create_thumbnail(img: 'Image.Image', size: tuple = (150, 150)) -> str:
+def create_thumbnail(img: 'Image.Image', size: tuple = (150, 150),
+                     as_bytes: bool = False, preset: str = DEFAULT_THUMBNAIL_PRESET,
+                     output_format: Optional[str] = None,
+                     quality: Optional[int] = None) -> Union[str, bytes]:
+    """
+    Thumbnail de img según el preset; output_format y quality lo pisan.
+    
+    Con draft, si img es un JPEG todavía sin decodificar, se decodifica
+    directamente a un tamaño cercano al del thumbnail (y img queda así).
+    """
+    thumb = _thumbnail_image(img, size, preset)
+    return _encode_thumbnail(thumb, preset, as_bytes, output_format, quality)
+
+
+def _thumbnail_image(img: 'Image.Image', size: tuple, preset: str) -> 'Image.Image':
+    """Copia reducida de img, todavía sin convertir al formato de salida."""
     from PIL import Image
     
+    if preset not in THUMBNAIL_PRESETS:
+        raise ValueError(f"Unknown thumbnail preset: {preset}")
+    options = THUMBNAIL_PRESETS[preset]
+    
+    if options['draft'] and options['reducing_gap']:
+        # No-op si no es JPEG o si ya se cargó
+        gap = options['reducing_gap']
+        img.draft('RGB', (int(size[0] * gap), int(size[1] * gap)))
+    
     thumb = img.copy()
     
-    thumb.thumbnail(size, Image.Resampling.LANCZOS)
+    thumb.thumbnail(size, getattr(Image.Resampling, options['resample']),
+                    reducing_gap=options['reducing_gap'])
+    return thumb
+
+
+def _encode_thumbnail(thumb: 'Image.Image', preset: str, as_bytes: bool = False,
+                      output_format: Optional[str] = None,
+                      quality: Optional[int] = None) -> Union[str, bytes]:
+    options = THUMBNAIL_PRESETS[preset]
+    output_format = (output_format or options['format']).upper()
+    quality = quality or options['quality']
+    
+    thumb = _convert_for_format(thumb, output_format, options['flatten'])
     
-    if thumb.mode in ('RGBA', 'LA', 'P'):
-        background = Image.new('RGB', thumb.size, (255, 255, 255))
-        if thumb.mode == 'P':
-            thumb = thumb.convert('RGBA')
-        background.paste(thumb, mask=thumb.split()[-1] if thumb.mode == 'RGBA' else None)
-        thumb = background
+    save_options = {'format': output_format}
+    if options['optimize']:
+        save_options['optimize'] = True
+    if quality and output_format in ('JPEG', 'WEBP'):
+        save_options['quality'] = quality
+    if output_format == 'WEBP':
+        # method 0-6: 0 es el más rápido
+        save_options['method'] = 0 if preset == 'fast' else 4
     
     buffer = BytesIO()
-    thumb.save(buffer, format='PNG', optimize=True)
+    thumb.save(buffer, **save_options)
+    
+    if as_bytes:
+        return buffer.getvalue()
     
     thumbnail_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
     
     return thumbnail_b64
 
 
-def extract_image_metadata(img: 'Image.Image') -> Dict[str, Any]:
+def _convert_for_format(img: 'Image.Image', output_format: str,
+                        flatten: bool = False) -> 'Image.Image':
+    from PIL import Image
+    
+    if flatten:
+        # Igual que el create_thumbnail original, LA incluido (se pega sin máscara)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+            return background
+        if output_format == 'PNG':
+            return img
+    
+    # WEBP y PNG conservan la transparencia; JPEG no
+    if output_format in ('WEBP', 'PNG'):
+        if img.mode in ('RGBA', 'RGB', 'L', 'LA'):
+            return img
+        if img.mode in ('P', 'PA'):
+            has_alpha = img.mode == 'PA' or 'transparency' in img.info
+            return img.convert('RGBA' if has_alpha else 'RGB')
+    if output_format == 'JPEG' and img.mode in ('RGB', 'L'):
+        return img
+    
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1])
+        return background
+    
+    return img.convert('RGB')
+
+
+def extract_image_metadata(img: 'Image.Image', sample: Optional['Image.Image'] = None) -> Dict[str, Any]:
+    """
+    EXIF de img y analytics (paleta, brillo, nitidez, transparencia) de
+    sample, o de img reducida si no se pasa una muestra.
+    """
+    from processor.image_analytics import analyze_image, downsample
+    
     metadata = {}
     
     try:
@@ -113,9 +277,19 @@ def extract_image_metadata(img: 'Image.Image') -> Dict[str, Any]:
     except:
         metadata['has_exif'] = False
     
+    if sample is None:
+        sample = downsample(img)
+    
     try:
-        if img.mode == 'RGB':
-            colors = img.getcolors(maxcolors=1000000)
+        analytics = analyze_image(sample)
+        if analytics is not None:
+            metadata['analytics'] = analytics
+            if analytics['palette']:
+                dominant = analytics['palette'][0]
+                metadata['dominant_color'] = {'r': dominant['r'], 'g': dominant['g'], 'b': dominant['b']}
+        elif sample.mode == 'RGB':
+            # Sin NumPy: solo el color más repetido de la muestra
+            colors = sample.getcolors(maxcolors=sample.size[0] * sample.size[1])
             if colors:
                 dominant_color = max(colors, key=lambda x: x[0])[1]
                 metadata['dominant_color'] = {
@@ -123,8 +297,8 @@ def extract_image_metadata(img: 'Image.Image') -> Dict[str, Any]:
                     'g': dominant_color[1],
                     'b': dominant_color[2]
                 }
-    except:
-        pass
+    except Exception as e:
+        logger.debug(f"Error analizando imagen: {e}")
     
     return metadata
 
@@ -1,122 +1,409 @@
-import time
+import re
+import asyncio
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urljoin, urldefrag, urlparse
+
+from lxml import etree
+
+from common.protocol import open_page_snapshot
 
 logger = logging.getLogger(__name__)
 
 
-def analyze_performance(url: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
+# Tipos de subrecurso que se reportan (siempre presentes en "resources")
+RESOURCE_TYPES = ('scripts', 'stylesheets', 'images', 'fonts', 'iframes', 'videos')
+
+# Deadline de todo el análisis: HTML + subrecursos
+DEFAULT_TIMEOUT = 8
+# Como un navegador: ~6 requests a la vez
+DEFAULT_CONCURRENCY = 6
+MAX_RESOURCES = 150
+MAX_RESOURCE_BYTES = 20 * 1024 * 1024
+SLOWEST_LIMIT = 5
+# El snapshot se parsea de a pedazos, cediendo el loop entre uno y otro
+FEED_CHUNK_CHARS = 64 * 1024
+
+# <link rel=preload as=...> -> tipo
+_PRELOAD_TYPES = {
+    'script': 'scripts',
+    'style': 'stylesheets',
+    'image': 'images',
+    'font': 'fonts'
+}
+
+# url(...) de una fuente, dentro de <style> o de una hoja de estilos
+_FONT_URL_RE = re.compile(
+    r'url\(\s*[\'"]?([^\'")\s]+?\.(?:woff2?|ttf|otf|eot)(?:[?#][^\'")\s]*)?)[\'"]?\s*\)',
+    re.IGNORECASE
+)
+
+
+def _first_srcset_url(srcset: Optional[str]) -> Optional[str]:
+    if not srcset:
+        return None
+    first = srcset.split(',')[0].strip()
+    return first.split()[0] if first else None
+
+
+def font_urls(css: str, base_url: str) -> List[str]:
+    return [urljoin(base_url, match) for match in _FONT_URL_RE.findall(css)]
+
+
+class ResourceExtractor:
     """
-    Análisis de rendimiento SIMPLIFICADO y RÁPIDO.
-    Hace un request HTTP básico con timeout agresivo.
+    Target de eventos del parser HTML de lxml (como SinglePassExtractor):
+    junta los subrecursos que pediría un navegador sin armar el árbol.
+    
+    Se alimenta mientras se descarga el HTML, cuando todavía no se conoce
+    la URL final (redirects): las URLs se guardan tal cual y resolve()
+    las hace absolutas al final.
+    
+    Bloqueantes (critical path): hojas de estilo que aplican a pantalla y
+    scripts sin async/defer/module.
     """
-    options = options or {}
-    timeout = 5  # TIMEOUT MUY CORTO: 5 segundos máximo
     
-    logger.info(f"⚡ Performance analysis (fast mode): {url}")
+    def __init__(self, limit: int = MAX_RESOURCES):
+        self.limit = limit
+        self._found: List[Tuple[str, str, bool]] = []
+        self._base_href: Optional[str] = None
+        self._media_depth = 0
+        self._style: Optional[List[str]] = None
     
-    try:
-        import requests
+    # ---------- Eventos del parser (interfaz target de lxml) ----------
+    
+    def start(self, tag: str, attrib):
+        if tag == 'script':
+            blocking = ('async' not in attrib and 'defer' not in attrib
+                        and attrib.get('type', '').lower() != 'module')
+            self._add(attrib.get('src'), 'scripts', blocking)
+        elif tag == 'link':
+            self._on_link(attrib)
+        elif tag == 'img':
+            # El navegador pide una sola: src o el primer candidato del srcset
+            self._add(attrib.get('src') or _first_srcset_url(attrib.get('srcset')), 'images')
+        elif tag == 'iframe':
+            self._add(attrib.get('src'), 'iframes')
+        elif tag in ('video', 'audio'):
+            self._media_depth += 1
+            self._add(attrib.get('src'), 'videos')
+            self._add(attrib.get('poster'), 'images')
+        elif tag == 'source' and self._media_depth:
+            self._add(attrib.get('src'), 'videos')
+        elif tag == 'style':
+            self._style = []
+        elif tag == 'base' and self._base_href is None:
+            self._base_href = attrib.get('href')
+    
+    def end(self, tag: str):
+        if tag in ('video', 'audio') and self._media_depth:
+            self._media_depth -= 1
+        elif tag == 'style' and self._style is not None:
+            for match in _FONT_URL_RE.findall(''.join(self._style)):
+                self._add(match, 'fonts')
+            self._style = None
+    
+    def data(self, data: str):
+        if self._style is not None:
+            self._style.append(data)
+    
+    def comment(self, text: str):
+        pass
+    
+    def close(self):
+        pass
+    
+    # ---------- Handlers por tag ----------
+    
+    def _on_link(self, attrib):
+        rel = set(attrib.get('rel', '').lower().split())
         
-        start_time = time.time()
+        if 'stylesheet' in rel:
+            media = attrib.get('media', 'all').lower()
+            blocking = 'alternate' not in rel and 'print' not in media
+            self._add(attrib.get('href'), 'stylesheets', blocking)
+        elif 'modulepreload' in rel:
+            self._add(attrib.get('href'), 'scripts')
+        elif 'preload' in rel:
+            self._add(attrib.get('href'), _PRELOAD_TYPES.get(attrib.get('as', '').lower()))
+        elif 'icon' in rel or 'apple-touch-icon' in rel:
+            self._add(attrib.get('href'), 'images')
+    
+    def _add(self, href: Optional[str], kind: Optional[str], blocking: bool = False):
+        # Tope a lo crudo también: una página con miles de <img> no crece sin límite
+        if href and kind and len(self._found) < self.limit * 4:
+            self._found.append((href.strip(), kind, blocking))
+    
+    def resolve(self, page_url: str) -> Dict[str, List]:
+        """{url absoluta: [tipo, bloqueante]} en orden de aparición, sin repetidos."""
+        base_url = urljoin(page_url, self._base_href) if self._base_href else page_url
+        resources: Dict[str, List] = {}
         
-        # Request con timeout muy corto
-        response = requests.get(
-            url,
-            timeout=timeout,
-            allow_redirects=True,
-            headers={'User-Agent': 'Mozilla/5.0'},
-            stream=False  # No streaming
-        )
+        for href, kind, blocking in self._found:
+            url = urldefrag(urljoin(base_url, href))[0]
+            if urlparse(url).scheme not in ('http', 'https'):
+                continue
+            
+            known = resources.get(url)
+            if known:
+                # Un preload seguido del <link>/<script> real: el recurso es uno solo
+                known[1] = known[1] or blocking
+            elif len(resources) < self.limit:
+                resources[url] = [kind, blocking]
+        
+        return resources
+
+
+def _empty_result(analysis_mode: str, **extra) -> Dict[str, Any]:
+    return {
+        "load_time_ms": 0,
+        "html_time_ms": 0,
+        "critical_path_ms": 0,
+        "total_size_kb": 0,
+        "total_bytes": 0,
+        "page_size_kb": 0,
+        "num_requests": 0,
+        "failed_requests": 0,
+        "pending_requests": 0,
+        "status_code": 0,
+        "redirect_count": 0,
+        "resources": {kind: 0 for kind in RESOURCE_TYPES},
+        "breakdown": {},
+        "blocking_resources": 0,
+        "network_timing": {},
+        "connections_reused": 0,
+        "slowest": [],
+        "content_type": "unknown",
+        "server": "unknown",
+        "analysis_mode": analysis_mode,
+        **extra
+    }
+
+
+def _read_snapshot(page: Optional[Dict[str, Any]], url: str) -> Optional[Tuple[str, int, Dict[str, Any]]]:
+    """(html, status, metadata como los de fetch) de un snapshot del servidor A, o None."""
+    if not page:
+        return None
+    try:
+        html = open_page_snapshot(page)
+    except ValueError as e:
+        logger.warning(f"⚠️  Snapshot inválido, se descarga la página: {e}")
+        return None
+    
+    headers = page.get('headers') or {}
+    return html, page.get('status_code', 200), {
+        'final_url': page.get('final_url') or url,
+        'content_type': page.get('content_type'),
+        'bytes_read': page.get('bytes_read', len(html)),
+        'redirect_count': page.get('redirect_count', 0),
+        'server': headers.get('Server'),
+        'timing': page.get('timing') or {}
+    }
+
+
+async def analyze_performance_async(url: str, options: Dict[str, Any] = None,
+                                    session=None, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Peso real de la página: descarga el HTML, extrae scripts, hojas de
+    estilo, imágenes, fuentes e iframes y los descarga en paralelo (como
+    mucho max_concurrency a la vez) hasta el deadline.
+    
+    - load_time_ms: hasta que terminó el último recurso.
+    - critical_path_ms: HTML + el recurso bloqueante más lento.
+    - total_size_kb / breakdown: bytes ya descomprimidos, total y por tipo.
+    
+    Los recursos que no terminan antes del deadline quedan en
+    pending_requests y el resultado sale con analysis_mode "partial".
+    Las fuentes declaradas en hojas externas se piden al llegar la hoja.
+    Los videos se cuentan pero no se descargan: el navegador solo pide
+    lo que reproduce.
+    
+    Con options["page"] (snapshot que manda el servidor A) el HTML no se
+    vuelve a pedir: se usan su body, headers y tiempos.
+    """
+    from scraper.async_http import AsyncHTTPClient
+    
+    options = options or {}
+    timeout = float(options.get('timeout', DEFAULT_TIMEOUT))
+    if deadline is not None:
+        timeout = min(timeout, deadline)
+    concurrency = max(1, int(options.get('max_concurrency', DEFAULT_CONCURRENCY)))
+    max_resources = int(options.get('max_resources', MAX_RESOURCES))
+    
+    logger.info(f"⚡ Performance analysis: {url}")
+    
+    loop = asyncio.get_running_loop()
+    analysis_start = loop.time()
+    
+    async with AsyncHTTPClient(timeout=timeout, session=session,
+                               max_bytes=MAX_RESOURCE_BYTES) as client:
+        extractor = ResourceExtractor(max_resources)
+        parser = etree.HTMLParser(target=extractor, recover=True)
         
-        load_time = (time.time() - start_time) * 1000  # ms
+        snapshot = _read_snapshot(options.get('page'), url)
+        if snapshot:
+            # ---------- Documento: el que ya descargó el servidor A ----------
+            html, status_code, metadata = snapshot
+            # Un documento grande de una vez frenaría al resto de los pedidos
+            for offset in range(0, len(html), FEED_CHUNK_CHARS):
+                parser.feed(html[offset:offset + FEED_CHUNK_CHARS])
+                await asyncio.sleep(0)
+            html_end = metadata['timing'].get('total_ms', 0) / 1000
+        else:
+            # ---------- Documento: se parsea mientras se descarga ----------
+            try:
+                _, status_code, metadata = await client.fetch(url, parser=parser, keep_body=False)
+            except TimeoutError:
+                logger.warning(f"⏱️  Timeout ({timeout}s) descargando el HTML")
+                return _empty_result("timeout_fallback", load_time_ms=round(timeout * 1000, 2),
+                                     num_requests=1, note=f"Request timeout after {timeout}s")
+            except Exception as e:
+                logger.error(f"❌ Error: {e}")
+                return _empty_result("error_fallback", error=str(e))
+            
+            html_end = loop.time() - analysis_start
         
-        # Datos básicos
-        status_code = response.status_code
-        page_size = len(response.content)
-        redirect_count = len(response.history)
+        # Origen de la línea de tiempo: el pedido del HTML, lo haya hecho quien lo haya hecho
+        start = analysis_start - (html_end if snapshot else 0)
         
-        # Análisis MÍNIMO de recursos (sin parsear HTML completo)
-        content_type = response.headers.get('Content-Type', 'unknown')
-        server = response.headers.get('Server', 'unknown')
+        try:
+            parser.close()
+        except etree.LxmlError:
+            # Documento vacío: lxml no recibió ningún feed
+            pass
         
-        # Estimación simple de recursos
-        resources = {
-            "scripts": 0,
-            "stylesheets": 0,
-            "images": 0,
-            "videos": 0,
-            "iframes": 0
-        }
+        is_html = 'html' in (metadata['content_type'] or '')
+        found = extractor.resolve(metadata['final_url']) if is_html else {}
         
-        # Solo contar si es HTML
-        if 'html' in content_type.lower():
-            # Conteo rápido sin parsing completo
-            html_lower = response.text.lower() if len(response.content) < 500000 else ""
-            resources["scripts"] = html_lower.count('<script')
-            resources["stylesheets"] = html_lower.count('<link') + html_lower.count('rel="stylesheet"')
-            resources["images"] = html_lower.count('<img')
+        # ---------- Subrecursos en paralelo ----------
+        semaphore = asyncio.Semaphore(concurrency)
+        records: List[Dict[str, Any]] = []
+        tasks: List[asyncio.Task] = []
         
-        num_requests = 1 + sum(resources.values())
+        def schedule(resource_url: str, kind: str, blocking: bool):
+            tasks.append(asyncio.create_task(fetch_resource(resource_url, kind, blocking)))
         
-        result = {
-            "load_time_ms": round(load_time, 2),
-            "total_size_kb": round(page_size / 1024, 2),
-            "page_size_kb": round(page_size / 1024, 2),
-            "num_requests": num_requests,
-            "status_code": status_code,
-            "redirect_count": redirect_count,
-            "resources": resources,
-            "content_type": content_type,
-            "server": server,
-            "analysis_mode": "fast"
-        }
+        async def fetch_resource(resource_url: str, kind: str, blocking: bool):
+            record = {"url": resource_url, "type": kind, "blocking": blocking,
+                      "status": 0, "bytes": 0}
+            async with semaphore:
+                fetch_start = loop.time()
+                try:
+                    # La hoja de estilos se lee para encontrar sus fuentes
+                    body, status, meta = await client.fetch_bytes(
+                        resource_url, keep_body=kind == 'stylesheets'
+                    )
+                    record["status"] = status
+                    record["bytes"] = meta['bytes_read']
+                    record["reused"] = meta['timing']['reused_connection']
+                except Exception as e:
+                    body = b''
+                    record["error"] = str(e)
+                fetch_end = loop.time()
+            
+            record["end"] = fetch_end - start
+            record["time_ms"] = round((fetch_end - fetch_start) * 1000, 2)
+            records.append(record)
+            
+            if body and record["status"] == 200:
+                css = body.decode('utf-8', errors='replace')
+                for font_url in font_urls(css, meta['final_url']):
+                    if font_url not in found and len(found) < max_resources:
+                        found[font_url] = ['fonts', False]
+                        schedule(font_url, 'fonts', False)
         
-        logger.info(f"✅ Performance OK: {load_time:.2f}ms, {page_size} bytes")
-        return result
+        for resource_url, (kind, blocking) in list(found.items()):
+            if kind != 'videos':
+                schedule(resource_url, kind, blocking)
         
-    except requests.Timeout:
-        logger.warning(f"⏱️  Timeout ({timeout}s) - Usando valores estimados")
-        # FALLBACK: devolver datos estimados en lugar de error
-        return {
-            "load_time_ms": timeout * 1000,
-            "total_size_kb": 0,
-            "page_size_kb": 0,
-            "num_requests": 1,
-            "status_code": 0,
-            "redirect_count": 0,
-            "resources": {
-                "scripts": 0,
-                "stylesheets": 0,
-                "images": 0,
-                "videos": 0,
-                "iframes": 0
-            },
-            "content_type": "unknown",
-            "server": "unknown",
-            "analysis_mode": "timeout_fallback",
-            "note": f"Request timeout after {timeout}s"
-        }
-    
-    except Exception as e:
-        logger.error(f"❌ Error: {e}")
-        # FALLBACK: devolver datos básicos en lugar de fallar
-        return {
-            "load_time_ms": 0,
-            "total_size_kb": 0,
-            "page_size_kb": 0,
-            "num_requests": 0,
-            "status_code": 0,
-            "redirect_count": 0,
-            "resources": {
-                "scripts": 0,
-                "stylesheets": 0,
-                "images": 0,
-                "videos": 0,
-                "iframes": 0
-            },
-            "content_type": "unknown",
-            "server": "unknown",
-            "analysis_mode": "error_fallback",
-            "error": str(e)
-        }
+        try:
+            # Una hoja puede agregar fuentes mientras se espera: repetir hasta que no quede nada
+            while True:
+                pending = [task for task in tasks if not task.done()]
+                remaining = timeout - (loop.time() - analysis_start)
+                if not pending or remaining <= 0:
+                    break
+                await asyncio.wait(pending, timeout=remaining)
+        finally:
+            stopped = loop.time() - start
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    # ---------- Métricas ----------
+    html_bytes = metadata['bytes_read']
+    breakdown = {
+        "document": {"count": 1, "requests": 1, "bytes": html_bytes, "failed": 0}
+    }
+    for kind in RESOURCE_TYPES:
+        breakdown[kind] = {"count": 0, "requests": 0, "bytes": 0, "failed": 0}
+    for kind, _ in found.values():
+        breakdown[kind]["count"] += 1
+    
+    failed = 0
+    for record in records:
+        entry = breakdown[record["type"]]
+        entry["requests"] += 1
+        entry["bytes"] += record["bytes"]
+        if "error" in record or record["status"] >= 400:
+            entry["failed"] += 1
+            failed += 1
+    for entry in breakdown.values():
+        entry["kb"] = round(entry["bytes"] / 1024, 2)
+    
+    total_bytes = sum(entry["bytes"] for entry in breakdown.values())
+    
+    # Sin el bloqueante que no llegó no se puede pintar: el camino crítico es todo el deadline
+    finished = {record["url"] for record in records}
+    blocking_pending = any(
+        blocking and kind != 'videos' and url not in finished
+        for url, (kind, blocking) in found.items()
+    )
+    if pending and blocking_pending:
+        critical_path = stopped
+    else:
+        critical_path = max([html_end] + [record["end"] for record in records if record["blocking"]])
+    load_time = stopped if pending else max([html_end] + [record["end"] for record in records])
+    
+    slowest = sorted(records, key=lambda record: record["time_ms"], reverse=True)[:SLOWEST_LIMIT]
+    
+    result = {
+        "load_time_ms": round(load_time * 1000, 2),
+        "html_time_ms": round(html_end * 1000, 2),
+        "critical_path_ms": round(critical_path * 1000, 2),
+        "total_size_kb": round(total_bytes / 1024, 2),
+        "total_bytes": total_bytes,
+        "page_size_kb": round(html_bytes / 1024, 2),
+        "num_requests": 1 + len(records),
+        "failed_requests": failed,
+        "pending_requests": len(pending),
+        "status_code": status_code,
+        "redirect_count": metadata.get('redirect_count', 0),
+        "resources": {kind: breakdown[kind]["count"] for kind in RESOURCE_TYPES},
+        "breakdown": breakdown,
+        "blocking_resources": sum(1 for _, blocking in found.values() if blocking),
+        # DNS / conexión (incluye TLS) / TTFB / descarga del documento
+        "network_timing": metadata.get('timing') or {},
+        "connections_reused": sum(1 for record in records if record.get("reused")),
+        "slowest": [
+            {key: record[key] for key in ("url", "type", "bytes", "time_ms")}
+            for record in slowest
+        ],
+        "content_type": metadata['content_type'] or 'unknown',
+        "server": metadata.get('server') or 'unknown',
+        "html_source": "snapshot" if snapshot else "fetched",
+        "analysis_mode": "partial" if pending else "full"
+    }
+    
+    logger.info(f"✅ Performance OK: {result['num_requests']} requests, {total_bytes} bytes, "
+                f"critical path {result['critical_path_ms']}ms")
+    return result
+
+
+def analyze_performance(url: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Versión sincrónica (scripts y process_task). El servidor usa
+    analyze_performance_async directamente en su event loop.
+    """
+    return asyncio.run(analyze_performance_async(url, options))
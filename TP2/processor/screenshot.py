@@ -1,14 +1,18 @@
 import base64
 import time
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 
 logger = logging.getLogger(__name__)
 
 
-def generate_screenshot(url: str, options: Dict[str, Any] = None) -> str:
+def generate_screenshot(url: str, options: Dict[str, Any] = None) -> Union[str, bytes]:
     """
     Genera screenshot usando fallback (PIL) para evitar problemas con Selenium.
+    Con options['binary_output'] devuelve los bytes PNG crudos en vez de base64.
+    
+    Los screenshots reales los hace el BrowserPool del servidor; esto queda
+    para cuando no hay navegador instalado o el render falla.
     """
     if options is None:
         options = {}
@@ -18,10 +22,20 @@ def generate_screenshot(url: str, options: Dict[str, Any] = None) -> str:
     
     logger.info(f"Generando screenshot fallback de {url}")
     
-    return _generate_screenshot_fallback(url, width, height)
+    png_bytes = _generate_screenshot_fallback(url, width, height)
+    
+    return encode_screenshot(png_bytes, options)
+
+
+def encode_screenshot(png_bytes: bytes, options: Dict[str, Any] = None) -> Union[str, bytes]:
+    """PNG crudo con options['binary_output'], base64 si no (JSON legacy)."""
+    if options and options.get('binary_output'):
+        return png_bytes
+    
+    return base64.b64encode(png_bytes).decode('utf-8')
 
 
-def _generate_screenshot_fallback(url: str, width: int, height: int) -> str:
+def _generate_screenshot_fallback(url: str, width: int, height: int) -> bytes:
     """Genera imagen placeholder simple y rápida."""
     from PIL import Image, ImageDraw, ImageFont
     import io
@@ -55,10 +69,9 @@ def _generate_screenshot_fallback(url: str, width: int, height: int) -> str:
         draw.text((50, y_offset), line, fill='#333333', font=font)
         y_offset += 40
     
-    # Convertir a base64
     buffer = io.BytesIO()
     img.save(buffer, format='PNG')
-    screenshot_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    png_bytes = buffer.getvalue()
     
-    logger.info(f"Screenshot fallback generado: {len(screenshot_b64)} chars")
-    return screenshot_b64
+    logger.info(f"Screenshot fallback generado: {len(png_bytes)} bytes")
+    return png_bytes
@@ -1,66 +1,218 @@
 import os
+import time
+import signal
+import asyncio
 import logging
+import importlib
 from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, Tuple
 
 logger = logging.getLogger(__name__)
 
 
+def _init_worker():
+    """Pre-importa las dependencias pesadas una sola vez por proceso."""
+    # Ctrl+C llega a todo el grupo: el cierre lo maneja el proceso principal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    
+    for module in ('PIL.Image', 'requests', 'processor.screenshot',
+                   'processor.performance', 'processor.image_processor'):
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            # Un initializer que falla rompe el pool entero
+            logger.warning(f"⚠️  No se pudo precargar {module}: {e}")
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _run_in_worker(func, *args):
+    """Ejecuta la tarea y reporta qué proceso del pool la atendió."""
+    return os.getpid(), func(*args)
+
+
 class WorkerPool:
     
-    def __init__(self, num_processes: Optional[int] = None):
+    def __init__(self, num_processes: Optional[int] = None, warm: bool = False,
+                 thumbnail_preset: Optional[str] = None):
         self.num_processes = num_processes or os.cpu_count()
-        self.executor = ProcessPoolExecutor(max_workers=self.num_processes)
+        # Preset de thumbnails si el mensaje no pide uno (None = el del módulo)
+        self.thumbnail_preset = thumbnail_preset
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.num_processes,
+            initializer=_init_worker
+        )
+        # Sesión HTTP del event loop que use process_task_async (la fija el servidor)
+        self.http_session = None
+        # Navegadores headless para screenshots reales (los lanza el servidor)
+        self.browser_pool = None
         logger.info(f"Pool inicializado con {self.num_processes} procesos")
+        
+        if warm:
+            self.warm_up()
     
-    def process_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
+    def warm_up(self, timeout: float = 30) -> int:
+        """Fuerza el arranque de todos los procesos antes de recibir tareas."""
+        futures = [self.executor.submit(_worker_ready) for _ in range(self.num_processes)]
+        pids = set()
+        for future in futures:
+            try:
+                pids.add(future.result(timeout=timeout))
+            except Exception as e:
+                logger.warning(f"⚠️  Worker no respondió al warm-up: {e}")
+        
+        logger.info(f"🔥 Pool precalentado: {len(pids)} procesos listos")
+        return len(pids)
+    
+    # Timeout reducido según tipo de tarea
+    TIMEOUT_MAP = {
+        'screenshot_request': 15,
+        'performance_request': 10,
+        'images_request': 20
+    }
+    
+    def _resolve_task(self, task: Dict[str, Any]) -> Optional[Tuple[Callable, tuple]]:
+        """Traduce un mensaje del protocolo a (función, argumentos) para el pool."""
         task_type = task.get('type')
         url = task.get('url', '')
         data = task.get('data', {})
         
-        logger.info(f"⚙️  Procesando tarea: {task_type} para {url}")
+        if task_type == 'screenshot_request':
+            from processor.screenshot import generate_screenshot
+            return generate_screenshot, (url, data)
+        
+        if task_type == 'performance_request':
+            from processor.performance import analyze_performance
+            return analyze_performance, (url, data)
+        
+        if task_type == 'images_request':
+            from processor.image_processor import process_images, DEFAULT_THUMBNAIL_PRESET
+            return process_images, (
+                data.get('image_urls', []),
+                data.get('max_images', 5),
+                data.get('binary_output', False),
+                data.get('thumbnail_preset') or self.thumbnail_preset or DEFAULT_THUMBNAIL_PRESET
+            )
+        
+        return None
+    
+    # Margen antes del timeout de la tarea para responder con lo que haya
+    DEADLINE_MARGIN = 0.9
+    
+    async def process_images_async(self, data: Dict[str, Any], deadline: float,
+                                   session=None) -> Dict[str, Any]:
+        """
+        Pipeline de imágenes: todas las descargas en paralelo en el event loop
+        y, a medida que llega cada una, decode/thumbnail/metadata en el pool.
+        Al vencer el deadline se devuelve lo que ya terminó (partial=True).
+        """
+        from processor.image_processor import (
+            download_images, process_image_bytes, MAX_IMAGE_BYTES, DEFAULT_THUMBNAIL_PRESET
+        )
+        
+        image_urls = data.get('image_urls', [])[:data.get('max_images', 5)]
+        binary_output = data.get('binary_output', False)
+        preset = data.get('thumbnail_preset') or self.thumbnail_preset or DEFAULT_THUMBNAIL_PRESET
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        
+        results: Dict[str, Dict[str, Any]] = {}
+        failed = 0
+        processing = set()
+        
+        async def process(url: str, img_data: bytes):
+            nonlocal failed
+            _, result = await loop.run_in_executor(
+                self.executor, _run_in_worker, process_image_bytes, url, img_data, binary_output, preset
+            )
+            if result:
+                results[url] = result
+            else:
+                failed += 1
         
-        # Timeout reducido según tipo de tarea
-        timeout_map = {
-            'screenshot_request': 15,
-            'performance_request': 10,
-            'images_request': 20
+        async def pipeline():
+            nonlocal failed
+            downloads = download_images(image_urls, session=session,
+                                        max_bytes=data.get('max_image_bytes', MAX_IMAGE_BYTES))
+            try:
+                async for url, img_data in downloads:
+                    if img_data is None:
+                        failed += 1
+                        continue
+                    # El CPU de esta imagen arranca mientras siguen las descargas
+                    task = asyncio.create_task(process(url, img_data))
+                    processing.add(task)
+                    task.add_done_callback(processing.discard)
+                if processing:
+                    await asyncio.gather(*processing)
+            finally:
+                await downloads.aclose()
+        
+        runner = asyncio.create_task(pipeline())
+        done, _ = await asyncio.wait({runner}, timeout=deadline)
+        partial = not done
+        if partial:
+            runner.cancel()
+            for task in list(processing):
+                task.cancel()
+            await asyncio.gather(runner, *processing, return_exceptions=True)
+            logger.warning(f"⏱️  Imágenes: deadline de {deadline:.1f}s, "
+                           f"{len(results)} de {len(image_urls)} listas")
+        elif runner.exception():
+            raise runner.exception()
+        
+        return {
+            # Mismo orden que image_urls
+            "thumbnails": [results[url] for url in image_urls if url in results],
+            "requested": len(image_urls),
+            "completed": len(results),
+            "failed": failed,
+            "partial": partial,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)
         }
+    
+    async def render_screenshot_async(self, url: str, data: Dict[str, Any], deadline: float):
+        """Screenshot real con el BrowserPool; si no sale, el placeholder en el pool de procesos."""
+        from processor.screenshot import generate_screenshot, encode_screenshot
+        
+        png = await self.browser_pool.render(url, data.get('width'), data.get('height'), deadline=deadline)
+        if png is not None:
+            return encode_screenshot(png, data)
         
-        timeout = timeout_map.get(task_type, 15)
+        logger.warning(f"⚠️  Screenshot de {url} con placeholder")
+        loop = asyncio.get_running_loop()
+        _, result = await loop.run_in_executor(self.executor, _run_in_worker, generate_screenshot, url, data)
+        return result
+    
+    def process_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        task_type = task.get('type')
+        url = task.get('url', '')
+        
+        logger.info(f"⚙️  Procesando tarea: {task_type} para {url}")
+        
+        timeout = self.TIMEOUT_MAP.get(task_type, 15)
         
         try:
-            if task_type == 'screenshot_request':
-                from processor.screenshot import generate_screenshot
-                logger.debug(f"  → Ejecutando screenshot en proceso")
-                future = self.executor.submit(generate_screenshot, url, data)
-                result = future.result(timeout=timeout)
-                
-            elif task_type == 'performance_request':
-                from processor.performance import analyze_performance
-                logger.debug(f"  → Ejecutando performance en proceso")
-                future = self.executor.submit(analyze_performance, url, data)
-                result = future.result(timeout=timeout)
-                
-            elif task_type == 'images_request':
-                from processor.image_processor import process_images
-                image_urls = data.get('image_urls', [])
-                max_images = data.get('max_images', 5)
-                logger.debug(f"  → Ejecutando images en proceso")
-                future = self.executor.submit(process_images, image_urls, max_images)
-                result = future.result(timeout=timeout)
-            
-            else:
+            resolved = self._resolve_task(task)
+            if resolved is None:
                 logger.warning(f"❌ Tipo de tarea desconocido: {task_type}")
                 return {
                     "success": False,
                     "error": f"Unknown task type: {task_type}"
                 }
             
+            func, args = resolved
+            logger.debug(f"  → Ejecutando {task_type} en proceso")
+            future = self.executor.submit(_run_in_worker, func, *args)
+            process_id, result = future.result(timeout=timeout)
+            
             logger.info(f"✅ Tarea completada: {task_type}")
             return {
                 "success": True,
-                "result": result
+                "result": result,
+                "process_id": process_id
             }
             
         except FutureTimeoutError:
@@ -77,6 +229,76 @@ class WorkerPool:
                 "error": str(e)
             }
     
+    async def process_task_async(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Igual que process_task pero sin bloquear el event loop que lo llama."""
+        task_type = task.get('type')
+        url = task.get('url', '')
+        
+        logger.info(f"⚙️  Procesando tarea: {task_type} para {url}")
+        
+        timeout = self.TIMEOUT_MAP.get(task_type, 15)
+        
+        try:
+            resolved = self._resolve_task(task)
+            if resolved is None:
+                logger.warning(f"❌ Tipo de tarea desconocido: {task_type}")
+                return {
+                    "success": False,
+                    "error": f"Unknown task type: {task_type}"
+                }
+            
+            if task_type == 'images_request':
+                # Descargas en el loop y CPU repartido en el pool: no es una sola tarea
+                result = await self.process_images_async(
+                    task.get('data', {}),
+                    deadline=timeout * self.DEADLINE_MARGIN,
+                    session=self.http_session
+                )
+                process_id = os.getpid()
+            elif task_type == 'screenshot_request' and self.browser_pool and self.browser_pool.available:
+                result = await self.render_screenshot_async(
+                    url, task.get('data', {}),
+                    deadline=timeout * self.DEADLINE_MARGIN
+                )
+                process_id = os.getpid()
+            elif task_type == 'performance_request':
+                # Casi todo es esperar la red: corre en el loop sin ocupar un worker
+                from processor.performance import analyze_performance_async
+                result = await analyze_performance_async(
+                    url, task.get('data', {}),
+                    session=self.http_session,
+                    deadline=timeout * self.DEADLINE_MARGIN
+                )
+                process_id = os.getpid()
+            else:
+                func, args = resolved
+                loop = asyncio.get_running_loop()
+                process_id, result = await asyncio.wait_for(
+                    loop.run_in_executor(self.executor, _run_in_worker, func, *args),
+                    timeout=timeout
+                )
+            
+            logger.info(f"✅ Tarea completada: {task_type}")
+            return {
+                "success": True,
+                "result": result,
+                "process_id": process_id
+            }
+            
+        except asyncio.TimeoutError:
+            logger.error(f"⏱️  Timeout procesando {task_type} para {url} (>{timeout}s)")
+            return {
+                "success": False,
+                "error": f"Timeout after {timeout} seconds"
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Error procesando {task_type}: {e}", exc_info=True)
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
     def shutdown(self, wait: bool = True):
         logger.info("Cerrando pool de procesos...")
         self.executor.shutdown(wait=wait)
@@ -1,32 +1,112 @@
+import re
+import codecs
 import asyncio
 import aiohttp
 import logging
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, Iterable
 from urllib.parse import urlparse
 
+from common.outbound import OutboundGovernor, get_governor
+from common.timing_stats import TimingStats, get_timing_stats
+from scraper.tracing import RequestTiming, create_trace_config
+
 logger = logging.getLogger(__name__)
 
 
+# Tipos que tiene sentido parsear como HTML
+HTML_CONTENT_TYPES = (
+    'text/html',
+    'application/xhtml+xml',
+    'application/xml',
+    'text/xml',
+    'text/plain'
+)
+
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+class ResponseTooLarge(ValueError):
+    """El body supera max_bytes (por Content-Length o leyendo)."""
+
+
+class UnsupportedContentType(ValueError):
+    """El Content-Type no es uno de los aceptados."""
+
+
+def create_session(limit: int = 100, limit_per_host: int = 10, dns_ttl: int = 300,
+                   timeout: int = 45) -> aiohttp.ClientSession:
+    """
+    Sesión pensada para vivir toda la aplicación: conserva cache DNS,
+    conexiones keep-alive y sesiones TLS entre requests. Con TraceConfig
+    cada fetch sabe cuánto fue DNS, conexión, TTFB y descarga.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        ttl_dns_cache=dns_ttl,
+        enable_cleanup_closed=True
+    )
+    return aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        connector=connector,
+        trace_configs=[create_trace_config()]
+    )
+
+
+async def close_session(session: aiohttp.ClientSession):
+    await session.close()
+    # Esperar a que se cierren las conexiones SSL
+    await asyncio.sleep(0.25)
+
+
 class AsyncHTTPClient:
-    def __init__(self, timeout: int = 45, max_redirects: int = 10):
+    
+    CHUNK_SIZE = 64 * 1024
+    
+    def __init__(self, timeout: int = 45, max_redirects: int = 10,
+                 session: Optional[aiohttp.ClientSession] = None,
+                 max_bytes: Optional[int] = None,
+                 content_types: Optional[Iterable[str]] = None,
+                 governor: Optional[OutboundGovernor] = None,
+                 timing_stats: Optional[TimingStats] = None):
         self.timeout = aiohttp.ClientTimeout(total=timeout)
         self.max_redirects = max_redirects
-        self.session: Optional[aiohttp.ClientSession] = None
+        # Límite del body ya descomprimido (None = sin límite)
+        self.max_bytes = max_bytes
+        # Content-Types aceptados (None = cualquiera)
+        self.content_types = tuple(content_types) if content_types else None
+        # Límite de concurrencia saliente compartido por todo el proceso
+        self.governor = governor or get_governor()
+        # Tiempos por fase agregados por dominio (/stats)
+        self.timing_stats = timing_stats or get_timing_stats()
+        self.session: Optional[aiohttp.ClientSession] = session
+        # Una sesión compartida la cierra quien la creó, no este cliente
+        self._owns_session = session is None
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession(
-            timeout=self.timeout,
-            connector=aiohttp.TCPConnector(limit=10)
-        )
+        if self._owns_session:
+            self.session = aiohttp.ClientSession(
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=10),
+                trace_configs=[create_trace_config()]
+            )
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
-            # Esperar a que se cierren las conexiones
-            await asyncio.sleep(0.25)
+        if self._owns_session and self.session:
+            await close_session(self.session)
     
-    async def fetch(self, url: str, headers: Dict[str, str] = None) -> Tuple[str, int, Dict[str, Any]]:
+    async def fetch(self, url: str, headers: Dict[str, str] = None,
+                    parser=None, keep_body: bool = True) -> Tuple[str, int, Dict[str, Any]]:
+        """
+        Descarga el body en streaming, chunk por chunk.
+        
+        - Content-Length y Content-Type se validan antes de leer.
+        - Nunca se leen más de max_bytes (ResponseTooLarge).
+        - Si se pasa un parser incremental (ej: SinglePassExtractor.parser),
+          cada chunk decodificado se le entrega al llegar; con keep_body=False
+          el HTML completo no se guarda y se devuelve "".
+        """
         if not self.session:
             raise RuntimeError("Client must be used as context manager")
         
@@ -49,30 +129,50 @@ class AsyncHTTPClient:
         logger.info(f"Fetching: {url}")
         
         try:
-            async with self.session.get(
-                url,
-                headers=default_headers,
-                allow_redirects=True,
-                max_redirects=self.max_redirects
-            ) as response:
-                
-                # Obtener contenido
-                html = await response.text()
-                status_code = response.status
-                
-                # Metadata
-                metadata = {
-                    'final_url': str(response.url),
-                    'content_type': response.content_type,
-                    'content_length': response.content_length,
-                    'charset': response.charset or 'utf-8',
-                    'redirected': url != str(response.url)
-                }
-                
-                logger.info(f"Fetched {url}: {status_code}, {len(html)} bytes")
-                
-                return html, status_code, metadata
-                
+            async with self.governor.slot(url) as outcome:
+                timing = RequestTiming()
+                async with self.session.get(
+                    url,
+                    headers=default_headers,
+                    allow_redirects=True,
+                    max_redirects=self.max_redirects,
+                    timeout=self.timeout,
+                    trace_request_ctx=timing
+                ) as response:
+                    # Latencia hasta los headers: la señal de carga del origen
+                    timing.mark_headers()
+                    outcome.latency = timing.latency
+                    outcome.status = response.status
+                    
+                    self._check_headers(url, response)
+                    
+                    # Obtener contenido
+                    html, bytes_read, charset = await self._read_body(url, response, parser, keep_body)
+                    status_code = response.status
+                    timing.mark_done()
+                    
+                    # Metadata
+                    metadata = {
+                        'final_url': str(response.url),
+                        'content_type': response.content_type,
+                        'content_length': response.content_length,
+                        'charset': charset,
+                        'bytes_read': bytes_read,
+                        'redirected': url != str(response.url),
+                        'redirect_count': len(response.history),
+                        'server': response.headers.get('Server'),
+                        'headers': dict(response.headers),
+                        # Ya sin la espera por el governor: solo lo que tardó el origen
+                        'timing': self._record_timing(url, timing),
+                        # Validadores para revalidar con GET condicional
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified')
+                    }
+                    
+                    logger.info(f"Fetched {url}: {status_code}, {bytes_read} bytes")
+                    
+                    return html, status_code, metadata
+        
         except asyncio.TimeoutError:
             logger.error(f"Timeout fetching {url}")
             raise TimeoutError(f"Request timeout after {self.timeout.total}s: {url}")
@@ -81,36 +181,183 @@ class AsyncHTTPClient:
             logger.error(f"Client error fetching {url}: {e}")
             raise ConnectionError(f"Failed to fetch {url}: {str(e)}")
         
+        except (ResponseTooLarge, UnsupportedContentType) as e:
+            logger.warning(f"Rejected {url}: {e}")
+            raise
+        
         except Exception as e:
             logger.error(f"Unexpected error fetching {url}: {e}")
             raise
     
-    async def fetch_multiple(self, urls: list) -> Dict[str, Tuple[str, int, Dict]]:
+    async def fetch_bytes(self, url: str, headers: Dict[str, str] = None,
+                          keep_body: bool = True) -> Tuple[bytes, int, Dict[str, Any]]:
+        """
+        Como fetch pero sin decodificar el body: imágenes y otros binarios.
+        Con keep_body=False solo se cuentan los bytes y se devuelve b"".
+        """
         if not self.session:
             raise RuntimeError("Client must be used as context manager")
         
-        logger.info(f"Fetching {len(urls)} URLs in parallel")
+        if not self._is_valid_url(url):
+            raise ValueError(f"Invalid URL: {url}")
+        
+        request_headers = {'User-Agent': 'Mozilla/5.0', 'Accept': '*/*'}
+        if headers:
+            request_headers.update(headers)
+        
+        try:
+            async with self.governor.slot(url) as outcome:
+                timing = RequestTiming()
+                async with self.session.get(url, headers=request_headers, allow_redirects=True,
+                                            max_redirects=self.max_redirects,
+                                            timeout=self.timeout,
+                                            trace_request_ctx=timing) as response:
+                    timing.mark_headers()
+                    outcome.latency = timing.latency
+                    outcome.status = response.status
+                    
+                    self._check_headers(url, response)
+                    
+                    parts = []
+                    bytes_read = 0
+                    async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                        if self.max_bytes and bytes_read + len(chunk) > self.max_bytes:
+                            if self._enforces_policy(response):
+                                raise ResponseTooLarge(f"Body exceeds {self.max_bytes} bytes: {url}")
+                            chunk = chunk[:self.max_bytes - bytes_read]
+                        bytes_read += len(chunk)
+                        if keep_body:
+                            parts.append(chunk)
+                        if self.max_bytes and bytes_read >= self.max_bytes:
+                            break
+                    
+                    timing.mark_done()
+                    return b''.join(parts), response.status, {
+                        'final_url': str(response.url),
+                        'content_type': response.content_type,
+                        'bytes_read': bytes_read,
+                        'timing': self._record_timing(url, timing)
+                    }
         
-        # Crear tasks para todas las URLs
-        tasks = {url: asyncio.create_task(self.fetch(url)) for url in urls}
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Request timeout after {self.timeout.total}s: {url}")
+        
+        except aiohttp.ClientError as e:
+            raise ConnectionError(f"Failed to fetch {url}: {str(e)}")
+    
+    def _record_timing(self, url: str, timing: RequestTiming) -> Dict[str, Any]:
+        summary = timing.summary()
+        self.timing_stats.record(self.governor.host_of(url), summary)
+        return summary
+    
+    @staticmethod
+    def _enforces_policy(response: aiohttp.ClientResponse) -> bool:
+        """
+        Tipo y tamaño solo se exigen en respuestas 2xx: una página de error
+        (404 en text/plain, 500 en JSON) conserva su status; su body se
+        trunca en max_bytes en vez de rechazarse.
+        """
+        return 200 <= response.status < 300
+    
+    def _check_headers(self, url: str, response: aiohttp.ClientResponse):
+        if not self._enforces_policy(response):
+            return
+        
+        # Sin header Content-Type no hay nada que validar
+        if self.content_types and 'Content-Type' in response.headers:
+            # Un tipo terminado en "/" acepta toda la familia (ej: "image/")
+            content_type = response.content_type
+            if not any(content_type == allowed or (allowed.endswith('/') and content_type.startswith(allowed))
+                       for allowed in self.content_types):
+                raise UnsupportedContentType(
+                    f"Unsupported content type {response.content_type}: {url}"
+                )
+        
+        if self.max_bytes and response.content_length and response.content_length > self.max_bytes:
+            raise ResponseTooLarge(
+                f"Content-Length {response.content_length} exceeds {self.max_bytes} bytes: {url}"
+            )
+    
+    async def _read_body(self, url: str, response: aiohttp.ClientResponse,
+                         parser=None, keep_body: bool = True) -> Tuple[str, int, str]:
+        decoder = None
+        charset = response.charset
+        parts = []
+        bytes_read = 0
         
-        # Esperar a que todas completen
+        async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+            truncated = False
+            if self.max_bytes and bytes_read + len(chunk) > self.max_bytes:
+                if self._enforces_policy(response):
+                    raise ResponseTooLarge(f"Body exceeds {self.max_bytes} bytes: {url}")
+                # Página de error: quedarse con lo que entra y dejar de leer
+                chunk = chunk[:self.max_bytes - bytes_read]
+                truncated = True
+            bytes_read += len(chunk)
+            
+            if decoder is None:
+                # Sin charset en el header: buscar <meta charset> en el primer chunk
+                if not charset:
+                    match = _META_CHARSET_RE.search(chunk[:4096])
+                    charset = match.group(1).decode('ascii') if match else 'utf-8'
+                decoder = self._decoder(charset)
+            
+            text = decoder.decode(chunk)
+            if parser is not None and text:
+                parser.feed(text)
+            if keep_body:
+                parts.append(text)
+            if truncated:
+                break
+        
+        if decoder is not None:
+            text = decoder.decode(b'', final=True)
+            if parser is not None and text:
+                parser.feed(text)
+            if keep_body:
+                parts.append(text)
+        
+        return ''.join(parts), bytes_read, charset or 'utf-8'
+    
+    @staticmethod
+    def _decoder(charset: str):
+        try:
+            return codecs.getincrementaldecoder(charset)(errors='replace')
+        except LookupError:
+            return codecs.getincrementaldecoder('utf-8')(errors='replace')
+    
+    async def fetch_multiple(self, urls: list, concurrency: int = 10) -> Dict[str, Tuple[str, int, Dict]]:
+        if not self.session:
+            raise RuntimeError("Client must be used as context manager")
+        
+        logger.info(f"Fetching {len(urls)} URLs in parallel (max {concurrency} at a time)")
+        
+        # Workers fijos que toman URLs a medida que se liberan: miles de URLs
+        # no crean miles de tasks ni abren miles de conexiones
+        pending = iter(urls)
         results = {}
-        for url, task in tasks.items():
-            try:
-                results[url] = await task
-            except Exception as e:
-                logger.error(f"Error fetching {url}: {e}")
-                results[url] = (None, 0, {'error': str(e)})
-        
-        return results
+        
+        async def worker():
+            for url in pending:
+                try:
+                    results[url] = await self.fetch(url)
+                except Exception as e:
+                    logger.error(f"Error fetching {url}: {e}")
+                    results[url] = (None, 0, {'error': str(e)})
+        
+        await asyncio.gather(*[worker() for _ in range(max(1, min(concurrency, len(urls))))])
+        
+        # Mismo orden que urls
+        return {url: results[url] for url in urls}
     
     async def head(self, url: str) -> Dict[str, Any]:
         if not self.session:
             raise RuntimeError("Client must be used as context manager")
         
         try:
-            async with self.session.head(url, allow_redirects=True) as response:
+            async with self.governor.slot(url) as outcome, \
+                    self.session.head(url, allow_redirects=True, timeout=self.timeout) as response:
+                outcome.status = response.status
                 return {
                     'status': response.status,
                     'content_type': response.content_type,
@@ -1,20 +1,315 @@
 
 from bs4 import BeautifulSoup
+from lxml import etree
 from urllib.parse import urljoin, urlparse
-from typing import Dict, List, Set
+from typing import Dict, List, Set, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+SOCIAL_PATTERNS = {
+    'facebook': ['facebook.com', 'fb.com'],
+    'twitter': ['twitter.com', 'x.com'],
+    'instagram': ['instagram.com'],
+    'linkedin': ['linkedin.com'],
+    'youtube': ['youtube.com', 'youtu.be'],
+    'github': ['github.com'],
+    'tiktok': ['tiktok.com']
+}
+
+# BeautifulSoup no cuenta como texto lo que está dentro de estos tags
+# (Script, Stylesheet, TemplateString, RubyText...)
+TEXT_EXCLUDED_TAGS = frozenset(('script', 'style', 'template', 'rt', 'rp'))
+
+HEADING_TAGS = frozenset(f'h{i}' for i in range(1, 7))
+
+
+def _absolute_http_url(base_url: str, href: str) -> Optional[str]:
+    """URL absoluta si es HTTP/HTTPS, None en otro caso."""
+    try:
+        absolute_url = urljoin(base_url, href)
+        if urlparse(absolute_url).scheme in ['http', 'https']:
+            return absolute_url
+    except Exception:
+        pass
+    return None
+
+
+def _social_platform(href: str) -> Optional[str]:
+    for platform, patterns in SOCIAL_PATTERNS.items():
+        if any(pattern in href for pattern in patterns):
+            return platform
+    return None
+
+
+class SinglePassExtractor:
+    """
+    Extractor de una sola pasada: target de eventos del parser HTML de lxml.
+    
+    Recibe start/end/data del mismo parser que usa BeautifulSoup('lxml'),
+    pero no construye ningún árbol: cada dato se recolecta al pasar.
+    El resultado es idéntico al de HTMLParser.parse(engine='soup').
+    
+    Uso incremental: SinglePassExtractor.parser(url) devuelve un parser de
+    lxml; feed(chunk) las veces que haga falta y close() devuelve el dict.
+    """
+    
+    # Mismo tamaño de chunk que usa BeautifulSoup al alimentar a lxml
+    CHUNK_SIZE = 512
+    
+    LINKS_LIMIT = 100
+    IMAGES_LIMIT = 20
+    
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        
+        self._depth = 0
+        self._excluded_depth = 0
+        self._buffer: List[str] = []
+        self._text: List[str] = []
+        self._word_count = 0
+        self._char_count = 0
+        
+        # Título: primer <title>; si no hay, primer <h1>
+        self._title_parts: Optional[List[str]] = None
+        self._title_depth = 0
+        self._h1_parts: Optional[List[str]] = None
+        self._h1_depth = 0
+        
+        self._links: Set[str] = set()
+        self._meta_tags: Dict = {}
+        self._meta_seen: Set[str] = set()
+        self._og_tags: Dict[str, str] = {}
+        self._twitter_tags: Dict[str, str] = {}
+        self._canonical_seen = False
+        self._structure = {f"h{i}": 0 for i in range(1, 7)}
+        self._images_count = 0
+        self._image_urls: List[str] = []
+        self._paragraph_count = 0
+        self._list_count = 0
+        self._social_links: Dict[str, str] = {}
+    
+    @classmethod
+    def parser(cls, base_url: str) -> etree.HTMLParser:
+        # Misma configuración que el builder lxml de BeautifulSoup
+        return etree.HTMLParser(target=cls(base_url), recover=True)
+    
+    @classmethod
+    def extract(cls, html: str, base_url: str) -> Dict:
+        parser = cls.parser(base_url)
+        # Al menos un feed, aunque el documento esté vacío
+        parser.feed(html[:cls.CHUNK_SIZE])
+        for i in range(cls.CHUNK_SIZE, len(html), cls.CHUNK_SIZE):
+            parser.feed(html[i:i + cls.CHUNK_SIZE])
+        return parser.close()
+    
+    # ---------- Eventos del parser (interfaz target de lxml) ----------
+    
+    def start(self, tag: str, attrib):
+        self._flush()
+        self._depth += 1
+        
+        if tag in TEXT_EXCLUDED_TAGS:
+            self._excluded_depth += 1
+        
+        if tag == 'a':
+            self._on_anchor(attrib)
+        elif tag == 'img':
+            self._on_image(attrib)
+        elif tag == 'meta':
+            self._on_meta(attrib)
+        elif tag == 'link':
+            self._on_link(attrib)
+        elif tag == 'p':
+            self._paragraph_count += 1
+        elif tag == 'ul' or tag == 'ol':
+            self._list_count += 1
+        elif tag == 'title':
+            if self._title_parts is None:
+                self._title_parts = []
+                self._title_depth = self._depth
+        elif tag in HEADING_TAGS:
+            self._structure[tag] += 1
+            if tag == 'h1' and self._h1_parts is None:
+                self._h1_parts = []
+                self._h1_depth = self._depth
+    
+    def end(self, tag: str):
+        self._flush()
+        
+        if self._depth == self._title_depth:
+            self._title_depth = 0
+        if self._depth == self._h1_depth:
+            self._h1_depth = 0
+        if tag in TEXT_EXCLUDED_TAGS:
+            self._excluded_depth -= 1
+        
+        self._depth -= 1
+    
+    def data(self, data: str):
+        # lxml puede partir un mismo texto en varios eventos
+        self._buffer.append(data)
+    
+    def comment(self, text: str):
+        self._flush()
+    
+    def pi(self, target: str, data: str = None):
+        self._flush()
+    
+    def doctype(self, *args):
+        self._flush()
+    
+    def close(self) -> Dict:
+        self._flush()
+        return self._result()
+    
+    def _flush(self):
+        if not self._buffer:
+            return
+        
+        text = ''.join(self._buffer).strip()
+        self._buffer = []
+        
+        if not text or self._excluded_depth:
+            return
+        
+        self._word_count += len(text.split())
+        self._char_count += len(text)
+        self._text.append(text)
+        
+        if self._title_depth:
+            self._title_parts.append(text)
+        if self._h1_depth:
+            self._h1_parts.append(text)
+    
+    # ---------- Handlers por tag ----------
+    
+    def _on_anchor(self, attrib):
+        href = attrib.get('href')
+        if href is None:
+            return
+        
+        platform = _social_platform(href.lower())
+        if platform and platform not in self._social_links:
+            self._social_links[platform] = href.lower()
+        
+        if len(self._links) >= self.LINKS_LIMIT:
+            return
+        
+        href = href.strip()
+        
+        # Ignorar anchors y javascript
+        if href.startswith('#') or href.startswith('javascript:'):
+            return
+        
+        absolute_url = _absolute_http_url(self.base_url, href)
+        if absolute_url:
+            self._links.add(absolute_url)
+    
+    def _on_image(self, attrib):
+        self._images_count += 1
+        
+        src = attrib.get('src')
+        if src is None or len(self._image_urls) >= self.IMAGES_LIMIT:
+            return
+        
+        src = src.strip()
+        
+        # Ignorar data URIs
+        if src.startswith('data:'):
+            return
+        
+        absolute_url = _absolute_http_url(self.base_url, src)
+        if absolute_url:
+            self._image_urls.append(absolute_url)
+    
+    def _on_meta(self, attrib):
+        name = attrib.get('name')
+        prop = attrib.get('property')
+        content = attrib.get('content')
+        
+        # description / keywords / author: solo cuenta el primer tag de cada uno
+        if name in ('description', 'keywords', 'author') and name not in self._meta_seen:
+            self._meta_seen.add(name)
+            if content:
+                self._meta_tags[name] = content
+        
+        if prop and prop.startswith('og:') and content:
+            self._og_tags[prop] = content
+        
+        if name and name.startswith('twitter:') and content:
+            self._twitter_tags[name] = content
+    
+    def _on_link(self, attrib):
+        if self._canonical_seen:
+            return
+        
+        # rel es multivaluado: rel="canonical nofollow" también cuenta
+        if 'canonical' in attrib.get('rel', '').split():
+            self._canonical_seen = True
+            href = attrib.get('href')
+            if href:
+                self._meta_tags['canonical'] = href
+    
+    def _result(self) -> Dict:
+        meta_tags = {
+            key: self._meta_tags[key]
+            for key in ('description', 'keywords', 'author')
+            if key in self._meta_tags
+        }
+        if self._og_tags:
+            meta_tags['open_graph'] = self._og_tags
+        if self._twitter_tags:
+            meta_tags['twitter'] = self._twitter_tags
+        if 'canonical' in self._meta_tags:
+            meta_tags['canonical'] = self._meta_tags['canonical']
+        
+        if self._title_parts is not None:
+            title = ''.join(self._title_parts)
+        elif self._h1_parts is not None:
+            title = ''.join(self._h1_parts)
+        else:
+            title = ""
+        
+        # Igual que ' '.join(textos): un espacio entre cada par de textos
+        char_count = self._char_count + max(0, len(self._text) - 1)
+        
+        return {
+            "title": title,
+            "links": sorted(self._links)[:self.LINKS_LIMIT],
+            "meta_tags": meta_tags,
+            "structure": self._structure,
+            "images_count": self._images_count,
+            "image_urls": self._image_urls,
+            "text_stats": {
+                "word_count": self._word_count,
+                "paragraph_count": self._paragraph_count,
+                "list_count": self._list_count,
+                "char_count": char_count
+            },
+            "social_links": self._social_links
+        }
+
+
 class HTMLParser:
     
+    # 'single_pass': extractor de eventos lxml (default)
+    # 'soup': implementación original sobre BeautifulSoup, mismo resultado
+    ENGINES = ('single_pass', 'soup')
+    
     @staticmethod
-    def parse(html: str, base_url: str) -> Dict:
-        soup = BeautifulSoup(html, 'lxml')
+    def parse(html: str, base_url: str, engine: str = 'single_pass') -> Dict:
+        if engine not in HTMLParser.ENGINES:
+            raise ValueError(f"Unknown parser engine: {engine}")
         
         logger.info(f"Parsing HTML from {base_url}")
         
+        if engine == 'single_pass':
+            return SinglePassExtractor.extract(html, base_url)
+        
+        soup = BeautifulSoup(html, 'lxml')
+        
         return {
             "title": HTMLParser._extract_title(soup),
             "links": HTMLParser._extract_links(soup, base_url),
@@ -174,22 +469,12 @@ class HTMLParser:
     
     @staticmethod
     def _extract_social_links(soup: BeautifulSoup) -> Dict[str, str]:
-        social_patterns = {
-            'facebook': ['facebook.com', 'fb.com'],
-            'twitter': ['twitter.com', 'x.com'],
-            'instagram': ['instagram.com'],
-            'linkedin': ['linkedin.com'],
-            'youtube': ['youtube.com', 'youtu.be'],
-            'github': ['github.com'],
-            'tiktok': ['tiktok.com']
-        }
-        
         social_links = {}
         
         for a in soup.find_all('a', href=True):
             href = a['href'].lower()
             
-            for platform, patterns in social_patterns.items():
+            for platform, patterns in SOCIAL_PATTERNS.items():
                 if any(pattern in href for pattern in patterns):
                     if platform not in social_links:
                         social_links[platform] = href
@@ -198,5 +483,5 @@ class HTMLParser:
         return social_links
 
 
-def parse_html(html: str, url: str) -> Dict:
-    return HTMLParser.parse(html, url)
\ No newline at end of file
+def parse_html(html: str, url: str, engine: str = 'single_pass') -> Dict:
+    return HTMLParser.parse(html, url, engine)
\ No newline at end of file
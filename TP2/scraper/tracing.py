@@ -0,0 +1,163 @@
+import time
+import aiohttp
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+
+class RequestTiming:
+    """
+    Fases de un request, completadas por los hooks de TraceConfig.
+    
+    Se pasa como trace_request_ctx en session.get(); quien hace el request
+    marca los headers recibidos (mark_headers) y el fin del body (mark_done).
+    Con redirects, DNS/connect/queued suman todos los saltos y el TTFB es
+    el del último.
+    
+    connect_ms incluye el handshake TLS: aiohttp no lo expone por separado.
+    Sin TraceConfig en la sesión (traced=False) solo hay TTFB, descarga y total.
+    """
+    
+    __slots__ = ('start', 'queued', 'dns', 'connect', 'reused', 'redirects',
+                 'headers_sent', 'headers_received', 'done', 'traced', '_marks')
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queued = 0.0
+        self.dns = 0.0
+        self.connect = 0.0
+        self.reused = False
+        self.redirects = 0
+        self.headers_sent: Optional[float] = None
+        self.headers_received: Optional[float] = None
+        self.done: Optional[float] = None
+        self.traced = False
+        self._marks: Dict[str, float] = {}
+    
+    def begin(self, phase: str):
+        self.traced = True
+        self._marks[phase] = time.perf_counter()
+    
+    def elapsed(self, phase: str) -> float:
+        started = self._marks.pop(phase, None)
+        return time.perf_counter() - started if started is not None else 0.0
+    
+    def mark_headers(self):
+        if self.headers_received is None:
+            self.headers_received = time.perf_counter()
+    
+    def mark_done(self):
+        self.mark_headers()
+        self.done = time.perf_counter()
+    
+    @property
+    def latency(self) -> float:
+        """Hasta los headers de la respuesta (lo que usa el OutboundGovernor)."""
+        return (self.headers_received or time.perf_counter()) - self.start
+    
+    def summary(self) -> Dict[str, Any]:
+        headers_received = self.headers_received or time.perf_counter()
+        done = self.done or headers_received
+        
+        if self.headers_sent is not None:
+            ttfb = headers_received - self.headers_sent
+        else:
+            # Sin hooks de envío: lo que queda después de cola, DNS y conexión
+            ttfb = max(0.0, headers_received - self.start - self.queued - self.dns - self.connect)
+        
+        return {
+            'queued_ms': round(self.queued * 1000, 2),
+            'dns_ms': round(self.dns * 1000, 2),
+            'connect_ms': round(self.connect * 1000, 2),
+            'ttfb_ms': round(ttfb * 1000, 2),
+            'download_ms': round((done - headers_received) * 1000, 2),
+            'total_ms': round((done - self.start) * 1000, 2),
+            'reused_connection': self.reused,
+            'redirects': self.redirects,
+            'traced': self.traced
+        }
+
+
+def _timing(trace_config_ctx: SimpleNamespace) -> Optional[RequestTiming]:
+    timing = trace_config_ctx.trace_request_ctx
+    return timing if isinstance(timing, RequestTiming) else None
+
+
+async def _on_queued_start(session, ctx, params):
+    timing = _timing(ctx)
+    if timing:
+        timing.begin('queued')
+
+
+async def _on_queued_end(session, ctx, params):
+    timing = _timing(ctx)
+    if timing:
+        timing.queued += timing.elapsed('queued')
+
+
+async def _on_create_start(session, ctx, params):
+    timing = _timing(ctx)
+    if timing:
+        timing.begin('connect')
+        # La resolución DNS ocurre dentro de la creación de la conexión
+        ctx.dns_before_connect = timing.dns
+
+
+async def _on_create_end(session, ctx, params):
+    timing = _timing(ctx)
+    if timing:
+        dns = timing.dns - getattr(ctx, 'dns_before_connect', timing.dns)
+        timing.connect += max(0.0, timing.elapsed('connect') - dns)
+
+
+async def _on_reuseconn(session, ctx, params):
+    timing = _timing(ctx)
+    if timing:
+        timing.traced = True
+        timing.reused = True
+
+
+async def _on_dns_start(session, ctx, params):
+    timing = _timing(ctx)
+    if timing:
+        timing.begin('dns')
+
+
+async def _on_dns_end(session, ctx, params):
+    timing = _timing(ctx)
+    if timing:
+        timing.dns += timing.elapsed('dns')
+
+
+async def _on_headers_sent(session, ctx, params):
+    timing = _timing(ctx)
+    if timing:
+        timing.traced = True
+        timing.headers_sent = time.perf_counter()
+
+
+async def _on_redirect(session, ctx, params):
+    timing = _timing(ctx)
+    if timing:
+        timing.redirects += 1
+
+
+async def _on_request_end(session, ctx, params):
+    timing = _timing(ctx)
+    if timing:
+        timing.headers_received = time.perf_counter()
+
+
+def create_trace_config() -> aiohttp.TraceConfig:
+    """Hooks que completan el RequestTiming pasado como trace_request_ctx."""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_queued_start.append(_on_queued_start)
+    trace_config.on_connection_queued_end.append(_on_queued_end)
+    trace_config.on_connection_create_start.append(_on_create_start)
+    trace_config.on_connection_create_end.append(_on_create_end)
+    trace_config.on_connection_reuseconn.append(_on_reuseconn)
+    trace_config.on_dns_resolvehost_start.append(_on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(_on_dns_end)
+    trace_config.on_request_headers_sent.append(_on_headers_sent)
+    trace_config.on_request_redirect.append(_on_redirect)
+    trace_config.on_request_end.append(_on_request_end)
+    return trace_config
@@ -2,16 +2,18 @@
 import sys
 import os
 import argparse
-import socket
+import asyncio
 import logging
 import signal
-from concurrent.futures import ProcessPoolExecutor
-import time
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
 
-from common.protocol import Protocol, MessageType, create_response
+from common.protocol import Protocol, MessageType, create_response, negotiate_codec
+from common.serialization import Serializer, SerializationFormat
 from processor.worker_pool import WorkerPool
+from processor.browser_pool import BrowserPool, BROWSERS, DEFAULT_MAX_PAGES
+from processor.image_processor import THUMBNAIL_PRESETS, DEFAULT_THUMBNAIL_PRESET
+from scraper.async_http import create_session, close_session
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,180 +22,263 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def handle_client_connection(client_socket_fd, client_addr, worker_pool_size):
-    """Maneja conexión de cliente en proceso separado."""
-    client_socket = None
-    try:
-        # Recrear socket desde FD
-        client_socket = socket.fromfd(client_socket_fd, socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.settimeout(30)
+class MultiprocessingServer:
+    """
+    Front end asyncio: acepta y atiende miles de conexiones en un solo
+    event loop, y despacha el trabajo CPU-bound al WorkerPool persistente.
+    """
+    
+    def __init__(self, host, port, num_workers=None, backlog=1024, max_inflight=None,
+                 idle_timeout=300, codecs=None, thumbnail_preset=None,
+                 browsers=2, browser='chrome', browser_max_pages=DEFAULT_MAX_PAGES):
+        self.host = host
+        self.port = port
+        self.num_workers = num_workers or os.cpu_count()
+        self.backlog = backlog
+        # Conexiones persistentes sin tráfico se cierran pasado este tiempo
+        self.idle_timeout = idle_timeout
+        # Codecs aceptados en orden de preferencia (pickle solo si se pide explícito)
+        self.codecs = codecs or [
+            codec for codec in Serializer.available_formats()
+            if codec != SerializationFormat.PICKLE
+        ]
+        # Tareas despachadas al pool a la vez; el resto espera en el loop
+        self.max_inflight = max_inflight or self.num_workers * 4
+        self.running = False
+        self.server = None
         
-        logger.info(f"🔧 Proceso {os.getpid()} manejando cliente {client_addr}")
+        self._loop = None
+        self._stop_event = None
+        self._inflight = None
         
-        # Recibir mensaje
-        message = Protocol.receive_message_sync(client_socket)
-        msg_type = message.get('type', 'unknown')
-        url = message.get('url', '')
+        self.connection_count = 0
+        self.active_connections = 0
+        self.inflight_tasks = 0
         
-        logger.info(f"📩 Proceso {os.getpid()}: Tarea {msg_type} para {url}")
+        # Pool de procesos de larga vida: se crea y precalienta una sola vez
+        self.worker_pool = WorkerPool(self.num_workers, warm=True, thumbnail_preset=thumbnail_preset)
         
-        # Procesar mensaje
-        if msg_type == MessageType.PING:
-            response = create_response(True, result={
-                "message": "PONG from processor",
-                "process_id": os.getpid(),
-                "using_multiprocessing": True
-            })
-        elif msg_type == MessageType.SHUTDOWN:
-            logger.warning(f"⚠️ Comando SHUTDOWN desde {client_addr}")
-            response = create_response(True, result={"message": "Shutting down"})
-            Protocol.send_message_sync(client_socket, response)
-            return "SHUTDOWN"
-        else:
-            # Procesar con worker pool
-            with WorkerPool(worker_pool_size) as pool:
-                result = pool.process_task(message)
-                
-                if result.get('success'):
-                    result_data = result.get('result')
-                    if isinstance(result_data, dict):
-                        result_data['handled_by_process'] = os.getpid()
-                    response = create_response(True, result=result_data)
-                else:
-                    response = create_response(False, error=result.get('error'))
+        # Navegadores headless para screenshots (0 = siempre placeholder)
+        self.browser_pool = BrowserPool(browsers, browser, browser_max_pages) if browsers > 0 else None
+        
+        logger.info(f"✅ Servidor Multiprocessing creado")
+        logger.info(f"   Workers: {self.num_workers}")
+        logger.info(f"   Dirección: {host}:{port}")
+        logger.info(f"   Backlog: {self.backlog}, tareas en vuelo: {self.max_inflight}")
+        logger.info(f"   Codecs: {', '.join(c.value for c in self.codecs)}")
+    
+    def start(self):
+        """Inicia el servidor (bloquea hasta que se detiene)."""
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.shutdown()
+    
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self._inflight = asyncio.Semaphore(self.max_inflight)
         
-        # Enviar respuesta
-        Protocol.send_message_sync(client_socket, response)
-        logger.info(f"✅ Proceso {os.getpid()}: Respuesta enviada")
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self._loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Windows o loop fuera del main thread
+                pass
         
-        return "OK"
+        self.server = await asyncio.start_server(
+            self.handle_connection,
+            self.host,
+            self.port,
+            backlog=self.backlog,
+            reuse_address=True
+        )
+        self.running = True
         
-    except socket.timeout:
-        logger.error(f"⏱️ Timeout en proceso {os.getpid()}")
-        try:
-            if client_socket:
-                error_response = create_response(False, error="Request timeout")
-                Protocol.send_message_sync(client_socket, error_response)
-        except:
-            pass
-        return "TIMEOUT"
+        # Descargas de imágenes desde el loop, con keep-alive y DNS cacheado
+        self.worker_pool.http_session = create_session()
+        
+        # Lanzar navegadores tarda segundos: mientras tanto, placeholder
+        browsers_ready = None
+        if self.browser_pool:
+            self.worker_pool.browser_pool = self.browser_pool
+            browsers_ready = self._loop.run_in_executor(None, self.browser_pool.start)
+        
+        addrs = [sock.getsockname() for sock in self.server.sockets]
+        logger.info(f"✅ Servidor escuchando en: {addrs}")
+        print(f"✅ Servidor iniciado correctamente")
+        print(f"📡 Escuchando en: {', '.join(str(a) for a in addrs)}")
+        print(f"⚙️  Pool de {self.num_workers} procesos activo")
+        print(f"⏹️  Presiona Ctrl+C para detener\n")
         
-    except Exception as e:
-        logger.error(f"❌ Error en proceso {os.getpid()}: {e}", exc_info=True)
         try:
-            if client_socket:
-                error_response = create_response(False, error=str(e))
-                Protocol.send_message_sync(client_socket, error_response)
-        except:
-            pass
-        return "ERROR"
+            async with self.server:
+                await self._stop_event.wait()
+        finally:
+            await close_session(self.worker_pool.http_session)
+            if self.browser_pool:
+                self.browser_pool.close()
+                await asyncio.gather(browsers_ready, return_exceptions=True)
         
-    finally:
-        if client_socket:
-            try:
-                client_socket.shutdown(socket.SHUT_RDWR)
-            except:
-                pass
-            try:
-                client_socket.close()
-            except:
-                pass
-        logger.info(f"🔌 Proceso {os.getpid()}: Conexión cerrada")
-
-
-class MultiprocessingServer:
-    """Servidor que usa ProcessPoolExecutor."""
+        self.running = False
     
-    def __init__(self, host, port, num_workers=None):
-        self.host = host
-        self.port = port
-        self.num_workers = num_workers or os.cpu_count()
+    def stop(self):
+        """Pide al event loop que deje de aceptar conexiones (thread-safe)."""
         self.running = False
-        self.socket = None
-        self.executor = ProcessPoolExecutor(max_workers=self.num_workers)
-        
-        logger.info(f"✅ Servidor Multiprocessing creado")
-        logger.info(f"   Workers: {self.num_workers}")
-        logger.info(f"   Dirección: {host}:{port}")
+        if self._loop and self._stop_event:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
     
-    def start(self):
-        """Inicia el servidor."""
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.settimeout(1.0)
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Conexión persistente y multiplexada: cada mensaje se atiende en su
+        propia task y la respuesta vuelve con el mismo "id", en el orden en
+        que terminan (no en el que llegaron).
+        """
+        client_addr = writer.get_extra_info('peername')
+        self.connection_count += 1
+        self.active_connections += 1
+        connection_number = self.connection_count
+        logger.info(f"📨 Nueva conexión #{connection_number} de: {client_addr}")
+        
+        write_lock = asyncio.Lock()
+        pending = set()
+        # Estado de la conexión: codec negociado (None = JSON legacy)
+        session = {'codec': None}
         
         try:
-            self.socket.bind((self.host, self.port))
-            self.socket.listen(10)
-            self.running = True
-            
-            actual_addr = self.socket.getsockname()
-            logger.info(f"✅ Servidor escuchando en: {actual_addr}")
-            print(f"✅ Servidor iniciado correctamente")
-            print(f"📡 Escuchando en: {actual_addr}")
-            print(f"⚙️  Pool de {self.num_workers} procesos activo")
-            print(f"⏹️  Presiona Ctrl+C para detener\n")
-            
-            connection_count = 0
-            
             while self.running:
                 try:
-                    client_socket, client_addr = self.socket.accept()
-                    connection_count += 1
-                    logger.info(f"📨 Nueva conexión #{connection_count} de: {client_addr}")
-                    
-                    # Duplicar FD antes de cerrar en proceso padre
-                    client_fd = client_socket.fileno()
-                    client_fd_dup = os.dup(client_fd)
-                    
-                    # Enviar al pool
-                    future = self.executor.submit(
-                        handle_client_connection,
-                        client_fd_dup,
-                        client_addr,
-                        max(1, self.num_workers // 2)
+                    message = await asyncio.wait_for(
+                        Protocol.receive_message_async(
+                            reader,
+                            allow_pickle=SerializationFormat.PICKLE in self.codecs
+                        ),
+                        timeout=self.idle_timeout
                     )
-                    
-                    # Cerrar en proceso padre
-                    client_socket.close()
-                    
-                    # Verificar resultado (sin bloquear mucho)
-                    try:
-                        result = future.result(timeout=0.1)
-                        if result == "OK":
-                            logger.info(f"✅ Conexión #{connection_count} completada exitosamente")
-                        else:
-                            logger.warning(f"⚠️ Conexión #{connection_count} completada con {result}")
-                    except:
-                        # El proceso sigue trabajando
-                        pass
-                        
-                except socket.timeout:
-                    continue
-                except KeyboardInterrupt:
-                    logger.info("\n⚠️ Señal de interrupción recibida")
+                except asyncio.IncompleteReadError:
+                    # EOF: el cliente terminó de enviar
                     break
-                except Exception as e:
-                    if self.running:
-                        logger.error(f"❌ Error aceptando conexión: {e}")
+                
+                if message.get('type') == MessageType.HELLO:
+                    async with write_lock:
+                        await self._negotiate(message, session, writer)
+                    continue
+                
+                task = asyncio.create_task(
+                    self._reply(message, client_addr, writer, write_lock, session)
+                )
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            logger.info(f"✅ Conexión #{connection_number} completada exitosamente")
+        
+        except asyncio.TimeoutError:
+            logger.info(f"⏱️ Conexión #{connection_number} inactiva por {self.idle_timeout}s")
+        
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"⚠️ Conexión #{connection_number} con {client_addr}: {e}")
+            async with write_lock:
+                await self._send_error(writer, str(e))
+        
+        except Exception as e:
+            logger.error(f"❌ Error con cliente {client_addr}: {e}", exc_info=True)
+            async with write_lock:
+                await self._send_error(writer, str(e))
         
         finally:
-            self.shutdown()
+            for task in pending:
+                task.cancel()
+            self.active_connections -= 1
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+            logger.info(f"🔌 Conexión con {client_addr} cerrada")
+    
+    async def _negotiate(self, message, session, writer):
+        """Responde el HELLO en JSON legacy y fija el codec del resto de la conexión."""
+        codec = negotiate_codec(message.get('codecs', []), self.codecs)
+        response = create_response(True, result={
+            "codec": codec.value,
+            "attachments": True,
+            "version": Protocol.FRAME_VERSION
+        }, request_id=message.get('id'))
+        await Protocol.send_message_async(writer, response)
+        session['codec'] = codec
+        logger.info(f"🤝 Codec negociado: {codec.value}")
+    
+    async def _reply(self, message, client_addr, writer, write_lock, session):
+        request_id = message.get('id')
+        try:
+            response = await self.handle_message(message, client_addr)
+        except Exception as e:
+            logger.error(f"❌ Error procesando mensaje de {client_addr}: {e}", exc_info=True)
+            response = create_response(False, error=str(e))
+        
+        if request_id is not None:
+            response['id'] = request_id
+        
+        # Un solo escritor a la vez para no intercalar frames
+        async with write_lock:
+            try:
+                await Protocol.send_message_async(writer, response, codec=session['codec'])
+            except (ConnectionError, RuntimeError) as e:
+                logger.warning(f"⚠️ No se pudo responder a {client_addr}: {e}")
+    
+    async def handle_message(self, message, client_addr):
+        msg_type = message.get('type', 'unknown')
+        url = message.get('url', '')
+        
+        logger.info(f"📩 Tarea {msg_type} para {url}")
+        
+        if msg_type == MessageType.PING:
+            return create_response(True, result={
+                "message": "PONG from processor",
+                "process_id": os.getpid(),
+                "using_multiprocessing": True,
+                "active_connections": self.active_connections,
+                "inflight_tasks": self.inflight_tasks,
+                "browsers": self.browser_pool.stats() if self.browser_pool else None
+            })
+        
+        if msg_type == MessageType.SHUTDOWN:
+            logger.warning(f"⚠️ Comando SHUTDOWN desde {client_addr}")
+            return create_response(True, result={"message": "Shutting down"})
+        
+        # Despachar al worker pool compartido sin bloquear el accept
+        async with self._inflight:
+            self.inflight_tasks += 1
+            try:
+                result = await self.worker_pool.process_task_async(message)
+            finally:
+                self.inflight_tasks -= 1
+        
+        if result.get('success'):
+            result_data = result.get('result')
+            if isinstance(result_data, dict):
+                result_data['handled_by_process'] = result.get('process_id')
+            return create_response(True, result=result_data)
+        
+        return create_response(False, error=result.get('error'))
+    
+    @staticmethod
+    async def _send_error(writer, error):
+        try:
+            await Protocol.send_message_async(writer, create_response(False, error=error))
+        except Exception:
+            pass
     
     def shutdown(self):
         """Cierra el servidor."""
         logger.info("🛑 Cerrando servidor...")
         self.running = False
         
-        if self.socket:
-            try:
-                self.socket.close()
-            except:
-                pass
-        
-        if self.executor:
-            logger.info("Cerrando pool de procesos...")
-            self.executor.shutdown(wait=True, cancel_futures=False)
+        if self.worker_pool:
+            self.worker_pool.shutdown()
+            self.worker_pool = None
         
         logger.info("✅ Servidor cerrado")
 
@@ -206,6 +291,20 @@ def parse_args():
     parser.add_argument('-i', '--ip', required=True, help='Dirección de escucha')
     parser.add_argument('-p', '--port', type=int, required=True, help='Puerto')
     parser.add_argument('-n', '--processes', type=int, default=None, help='Número de procesos')
+    parser.add_argument('--backlog', type=int, default=1024,
+                        help='Backlog de listen() (default: 1024)')
+    parser.add_argument('--max-inflight', type=int, default=None,
+                        help='Máximo de tareas despachadas al pool a la vez (default: 4 x procesos)')
+    parser.add_argument('--codecs', default=None,
+                        help='Codecs aceptados en orden de preferencia, ej: msgpack,json,pickle')
+    parser.add_argument('--thumbnail-preset', choices=sorted(THUMBNAIL_PRESETS), default=None,
+                        help=f'Velocidad/calidad de los thumbnails (default: {DEFAULT_THUMBNAIL_PRESET})')
+    parser.add_argument('--browsers', type=int, default=2,
+                        help='Navegadores headless para screenshots; 0 = placeholder (default: 2)')
+    parser.add_argument('--browser', choices=BROWSERS, default='chrome',
+                        help='Navegador de los screenshots (default: chrome)')
+    parser.add_argument('--browser-max-pages', type=int, default=DEFAULT_MAX_PAGES,
+                        help=f'Renders antes de reciclar cada navegador (default: {DEFAULT_MAX_PAGES})')
     parser.add_argument('-v', '--verbose', action='store_true', help='Modo verbose')
     
     return parser.parse_args()
@@ -227,18 +326,20 @@ def main():
     
     server = None
     try:
-        server = MultiprocessingServer(args.ip, args.port, args.processes)
-        
-        def signal_handler(signum, frame):
-            print(f"\n⚠️ Señal {signum} recibida")
-            if server:
-                server.running = False
-        
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
-        
+        server = MultiprocessingServer(
+            args.ip,
+            args.port,
+            args.processes,
+            backlog=args.backlog,
+            max_inflight=args.max_inflight,
+            codecs=[SerializationFormat(c.strip()) for c in args.codecs.split(',')] if args.codecs else None,
+            thumbnail_preset=args.thumbnail_preset,
+            browsers=args.browsers,
+            browser=args.browser,
+            browser_max_pages=args.browser_max_pages
+        )
         server.start()
-        
+    
     except OSError as e:
         if e.errno == 98:
             logger.error(f"❌ Puerto {args.port} ocupado")
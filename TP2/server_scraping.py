@@ -2,6 +2,8 @@
 import sys
 import os
 import argparse
+import functools
+import asyncio
 import logging
 from aiohttp import web
 import socket
@@ -10,6 +12,12 @@ import socket
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
 
 from api.handlers import ScrapingHandler, index_handler
+from api.parse_executor import ParseExecutor
+from api.jobs import JobManager
+from scraper.async_http import create_session, close_session
+from common.cache import configure_cache, get_cache, CACHE_BACKENDS
+from common.rate_limiter import configure_rate_limiter, parse_override
+from common.outbound import configure_governor
 
 # Configurar logging
 logging.basicConfig(
@@ -26,9 +34,52 @@ async def create_app(args) -> web.Application:
     app['processing_host'] = args.processing_host
     app['processing_port'] = args.processing_port
     app['workers'] = args.workers
+    app['parse_executor_kind'] = args.parse_executor
+    app['http_limit'] = args.http_limit
+    app['http_limit_per_host'] = args.http_limit_per_host
+    app['dns_ttl'] = args.dns_ttl
+    app['max_page_bytes'] = args.max_page_bytes
+    app['cache_sweep_interval'] = args.cache_sweep_interval
+    app['job_workers'] = args.job_workers
+    app['job_queue_size'] = args.job_queue_size
+    app['job_result_mb'] = args.job_result_mb
+    app['batch_concurrency'] = args.batch_concurrency
+    app['batch_per_domain'] = args.batch_per_domain
+    app['batch_max_urls'] = args.batch_max_urls
+    app['crawl_concurrency'] = args.crawl_concurrency
+    app['crawl_max_depth'] = args.crawl_max_depth
+    app['crawl_max_pages'] = args.crawl_max_pages
+    # Tope global de scrapes de todos los batches y crawls en curso
+    app['batch_slots'] = asyncio.Semaphore(args.batch_concurrency)
+    
+    # Caché acotado en entradas y memoria (propio o compartido entre procesos)
+    configure_cache(
+        ttl_seconds=args.cache_ttl,
+        max_entries=args.cache_max_entries,
+        max_bytes=args.cache_max_mb * 1024 * 1024,
+        backend=args.cache_backend,
+        path=args.cache_path,
+        stale_ttl=args.cache_stale_ttl
+    )
+    
+    # Concurrencia saliente: tope global y por host adaptativo, hasta los límites del conector
+    configure_governor(
+        global_limit=args.http_limit,
+        per_host=min(args.outbound_per_host, args.http_limit_per_host),
+        max_per_host=args.http_limit_per_host
+    )
+    
+    # Token bucket por dominio, con límites propios para algunos dominios
+    app['rate_limit_max_wait'] = args.rate_max_wait
+    configure_rate_limiter(
+        max_requests=args.rate_limit,
+        window_seconds=args.rate_window,
+        overrides=dict(args.rate_limit_domain)
+    )
     
     # Crear handler
     scraping_handler = ScrapingHandler(app)
+    app['scraping_handler'] = scraping_handler
     
     # Configurar rutas
     app.router.add_get('/', index_handler)
@@ -36,10 +87,73 @@ async def create_app(args) -> web.Application:
     app.router.add_get('/health', scraping_handler.health)
     app.router.add_get('/info', scraping_handler.info)
     app.router.add_get('/stats', scraping_handler.stats)
+    app.router.add_post('/scrape/batch', scraping_handler.scrape_batch)
+    app.router.add_get('/crawl', scraping_handler.crawl)
+    app.router.add_post('/jobs', scraping_handler.create_job)
+    app.router.add_get('/status/{task_id}', scraping_handler.job_status)
+    app.router.add_get('/result/{task_id}', scraping_handler.job_result)
+    
+    # Recursos con el ciclo de vida de la app: sesión HTTP y pool de parsing
+    app.cleanup_ctx.append(http_session_ctx)
+    app.cleanup_ctx.append(parse_executor_ctx)
+    app.cleanup_ctx.append(cache_ctx)
+    app.cleanup_ctx.append(jobs_ctx)
+    
+    # Cerrar conexiones persistentes con el servidor de procesamiento
+    app.on_cleanup.append(scraping_handler.close)
     
     return app
 
 
+async def http_session_ctx(app: web.Application):
+    app['http_session'] = create_session(
+        limit=app['http_limit'],
+        limit_per_host=app['http_limit_per_host'],
+        dns_ttl=app['dns_ttl']
+    )
+    yield
+    await close_session(app['http_session'])
+
+
+async def parse_executor_ctx(app: web.Application):
+    app['parse_executor'] = ParseExecutor(app['parse_executor_kind'], app['workers'])
+    yield
+    app['parse_executor'].shutdown()
+
+
+async def cache_ctx(app: web.Application):
+    cache = get_cache()
+    sweeper = asyncio.create_task(cache.run_sweeper(app['cache_sweep_interval']))
+    yield
+    sweeper.cancel()
+    try:
+        await sweeper
+    except asyncio.CancelledError:
+        pass
+    cache.close()
+
+
+async def jobs_ctx(app: web.Application):
+    # Los workers corren el mismo pipeline que /scrape (caché, coalescing, etc.)
+    # y, como cola, esperan el token del dominio en vez de recibir 429
+    app['jobs'] = JobManager(
+        functools.partial(app['scraping_handler'].run_scrape, wait_for_token=True),
+        workers=app['job_workers'],
+        queue_size=app['job_queue_size'],
+        max_result_bytes=app['job_result_mb'] * 1024 * 1024
+    )
+    app['jobs'].start()
+    yield
+    await app['jobs'].stop()
+
+
+def _rate_override(spec: str):
+    try:
+        return parse_override(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description='Servidor de Scraping Web Asíncrono',
@@ -69,7 +183,191 @@ Ejemplos:
         '-w', '--workers',
         type=int,
         default=4,
-        help='Número de workers (default: 4)'
+        help='Número de workers para parsing HTML (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--parse-executor',
+        choices=ParseExecutor.KINDS,
+        default='process',
+        help='Dónde se parsea el HTML: process o thread (default: process)'
+    )
+    
+    parser.add_argument(
+        '--http-limit',
+        type=int,
+        default=100,
+        help='Conexiones salientes totales de la sesión HTTP compartida (default: 100)'
+    )
+    
+    parser.add_argument(
+        '--http-limit-per-host',
+        type=int,
+        default=10,
+        help='Conexiones salientes simultáneas por host (default: 10)'
+    )
+    
+    parser.add_argument(
+        '--outbound-per-host',
+        type=int,
+        default=4,
+        help='Requests simultáneos iniciales por host; se ajusta solo hasta --http-limit-per-host (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--dns-ttl',
+        type=int,
+        default=300,
+        help='TTL del cache DNS en segundos (default: 300)'
+    )
+    
+    parser.add_argument(
+        '--max-page-bytes',
+        type=int,
+        default=10 * 1024 * 1024,
+        help='Tamaño máximo del HTML descargado, en bytes (default: 10 MB)'
+    )
+    
+    parser.add_argument(
+        '--cache-backend',
+        choices=CACHE_BACKENDS,
+        default='memory',
+        help='memory (por proceso) o sqlite (compartido entre instancias, requiere --cache-path)'
+    )
+    
+    parser.add_argument(
+        '--cache-path',
+        default=None,
+        help='Archivo SQLite del caché compartido'
+    )
+    
+    parser.add_argument(
+        '--cache-ttl',
+        type=int,
+        default=3600,
+        help='TTL del caché de respuestas en segundos (default: 3600)'
+    )
+    
+    parser.add_argument(
+        '--cache-stale-ttl',
+        type=int,
+        default=1800,
+        help='Segundos extra en que una entrada vencida se sirve mientras se revalida (default: 1800, 0 = desactivado)'
+    )
+    
+    parser.add_argument(
+        '--cache-max-entries',
+        type=int,
+        default=1000,
+        help='Máximo de respuestas en caché (default: 1000)'
+    )
+    
+    parser.add_argument(
+        '--cache-max-mb',
+        type=int,
+        default=256,
+        help='Memoria máxima del caché en MB (default: 256)'
+    )
+    
+    parser.add_argument(
+        '--cache-sweep-interval',
+        type=float,
+        default=60,
+        help='Segundos entre barridos de entradas expiradas (default: 60)'
+    )
+    
+    parser.add_argument(
+        '--job-workers',
+        type=int,
+        default=4,
+        help='Workers de la cola de /jobs (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--job-queue-size',
+        type=int,
+        default=100,
+        help='Trabajos pendientes máximos antes de responder 503 (default: 100)'
+    )
+    
+    parser.add_argument(
+        '--job-result-mb',
+        type=int,
+        default=64,
+        help='Memoria máxima para resultados de /jobs guardados, en MB (default: 64)'
+    )
+    
+    parser.add_argument(
+        '--batch-concurrency',
+        type=int,
+        default=20,
+        help='Scrapes simultáneos de /scrape/batch y /crawl, sumando todos (default: 20)'
+    )
+    
+    parser.add_argument(
+        '--batch-per-domain',
+        type=int,
+        default=4,
+        help='Scrapes simultáneos por dominio dentro de un batch o crawl (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--batch-max-urls',
+        type=int,
+        default=10000,
+        help='Máximo de URLs por batch (default: 10000)'
+    )
+    
+    parser.add_argument(
+        '--crawl-concurrency',
+        type=int,
+        default=5,
+        help='Páginas scrapeadas a la vez por cada crawl (default: 5)'
+    )
+    
+    parser.add_argument(
+        '--crawl-max-depth',
+        type=int,
+        default=3,
+        help='Profundidad máxima aceptada en /crawl (default: 3)'
+    )
+    
+    parser.add_argument(
+        '--crawl-max-pages',
+        type=int,
+        default=500,
+        help='Máximo de páginas por crawl (default: 500)'
+    )
+    
+    parser.add_argument(
+        '--rate-limit',
+        type=int,
+        default=10,
+        help='Requests por dominio en cada ventana, también la ráfaga máxima (default: 10)'
+    )
+    
+    parser.add_argument(
+        '--rate-window',
+        type=float,
+        default=60,
+        help='Ventana del rate limit en segundos (default: 60)'
+    )
+    
+    parser.add_argument(
+        '--rate-max-wait',
+        type=float,
+        default=10,
+        help='Segundos que /scrape espera turno antes de responder 429; 0 = no esperar. '
+             'Batch, crawl y jobs esperan lo necesario (default: 10)'
+    )
+    
+    parser.add_argument(
+        '--rate-limit-domain',
+        type=_rate_override,
+        action='append',
+        default=[],
+        metavar='DOMAIN=N/SECONDS',
+        help='Límite propio para un dominio, ej: example.com=60/60 (repetible)'
     )
     
     parser.add_argument(
@@ -91,7 +389,12 @@ Ejemplos:
         help='Modo verbose (DEBUG logging)'
     )
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    
+    if args.cache_backend == 'sqlite' and not args.cache_path:
+        parser.error('--cache-backend sqlite requiere --cache-path')
+    
+    return args
 
 
 async def on_startup(app: web.Application):
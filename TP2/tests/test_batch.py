@@ -0,0 +1,241 @@
+"""
+Tests del scraping en batch (/scrape/batch).
+"""
+import pytest
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.batch import run_batch, DomainLimiter
+
+
+@pytest.mark.asyncio
+async def test_run_batch_respects_global_and_domain_limits():
+    active = {'total': 0, 'max': 0}
+    per_domain = {}
+    max_per_domain = {}
+    
+    async def run(url):
+        domain = url.split('/')[2]
+        active['total'] += 1
+        per_domain[domain] = per_domain.get(domain, 0) + 1
+        active['max'] = max(active['max'], active['total'])
+        max_per_domain[domain] = max(max_per_domain.get(domain, 0), per_domain[domain])
+        await asyncio.sleep(0.01)
+        active['total'] -= 1
+        per_domain[domain] -= 1
+        return {"url": url}, 200
+    
+    urls = [f'https://site{i % 3}.com/{i}' for i in range(30)]
+    results = [item async for item in run_batch(urls, run, concurrency=5, per_domain=1)]
+    
+    assert sorted(index for index, _, _, _ in results) == list(range(30))
+    assert all(urls[index] == url for index, url, _, _ in results)
+    assert active['max'] <= 5
+    assert max(max_per_domain.values()) == 1
+
+
+@pytest.mark.asyncio
+async def test_run_batch_streams_in_completion_order_and_isolates_errors():
+    async def run(url):
+        if url.endswith('boom'):
+            raise RuntimeError("boom")
+        await asyncio.sleep(0.1 if url.endswith('slow') else 0)
+        return {"url": url}, 200
+    
+    urls = ['https://a.com/slow', 'https://b.com/fast', 'https://c.com/boom']
+    results = [item async for item in run_batch(urls, run, concurrency=3)]
+    
+    assert results[-1][1] == 'https://a.com/slow'
+    statuses = {url: status for _, url, _, status in results}
+    assert statuses == {'https://a.com/slow': 200, 'https://b.com/fast': 200, 'https://c.com/boom': 500}
+
+
+@pytest.mark.asyncio
+async def test_run_batch_stops_workers_when_consumer_leaves():
+    started = []
+    
+    async def run(url):
+        started.append(url)
+        await asyncio.sleep(0)
+        return {}, 200
+    
+    urls = [f'https://example.com/{i}' for i in range(1000)]
+    batch = run_batch(urls, run, concurrency=4)
+    await batch.__anext__()
+    await batch.aclose()
+    
+    # Sin consumidor los workers se frenan con la cola de salida llena
+    assert len(started) < 20
+
+
+@pytest.mark.asyncio
+async def test_domain_limiter_drops_idle_domains():
+    limiter = DomainLimiter(per_domain=2)
+    
+    async with limiter.slot('https://example.com/a'):
+        async with limiter.slot('https://example.com/b'):
+            assert limiter.active_domains == 1
+    
+    assert limiter.active_domains == 0
+
+
+@pytest.mark.asyncio
+async def test_batch_endpoint_streams_ndjson():
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    from api.handlers import ScrapingHandler
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    app['batch_concurrency'] = 4
+    app['batch_per_domain'] = 2
+    app['batch_max_urls'] = 3
+    app['batch_slots'] = asyncio.Semaphore(4)
+    handler = ScrapingHandler(app)
+    
+    async def fake_run_scrape(url, force_refresh=False, on_state=None, wait_for_token=False, slot=None):
+        return {"url": url, "status": "success"}, 200
+    
+    handler.run_scrape = fake_run_scrape
+    app.router.add_post('/scrape/batch', handler.scrape_batch)
+    
+    async with TestClient(TestServer(app)) as client:
+        response = await client.post('/scrape/batch', json={
+            'urls': ['https://example.com', 'ftp://invalid']
+        })
+        assert response.status == 200
+        assert response.content_type == 'application/x-ndjson'
+        
+        lines = [json.loads(line) for line in (await response.text()).splitlines()]
+        by_url = {line['url']: line for line in lines if 'url' in line}
+        assert by_url['https://example.com']['status_code'] == 200
+        assert by_url['https://example.com']['result']['status'] == 'success'
+        assert by_url['ftp://invalid']['status_code'] == 400
+        assert lines[-1] == {**lines[-1], "done": True, "total": 2, "succeeded": 1, "failed": 1}
+        
+        # Texto plano: una URL por línea
+        response = await client.post('/scrape/batch', data='https://a.com\nhttps://b.com\n')
+        lines = (await response.text()).splitlines()
+        assert len(lines) == 3
+        
+        assert (await client.post('/scrape/batch', json={'urls': []})).status == 400
+        assert (await client.post('/scrape/batch', json={'urls': ['https://a.com'] * 4})).status == 413
+
+
+@pytest.mark.asyncio
+async def test_batch_endpoint_reports_invalid_entries_and_keeps_going():
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    from api.handlers import ScrapingHandler
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    app['batch_concurrency'] = 1
+    app['batch_per_domain'] = 1
+    app['batch_max_urls'] = 10
+    app['batch_slots'] = asyncio.Semaphore(1)
+    handler = ScrapingHandler(app)
+    
+    async def fake_run_scrape(url, force_refresh=False, on_state=None, wait_for_token=False, slot=None):
+        return {"url": url, "status": "success"}, 200
+    
+    handler.run_scrape = fake_run_scrape
+    app.router.add_post('/scrape/batch', handler.scrape_batch)
+    
+    urls = ['https://a.com/1', 5, 'https://a.com/2', None, {'url': 'https://a.com/x'}, 'https://a.com/3']
+    async with TestClient(TestServer(app)) as client:
+        response = await client.post('/scrape/batch', json={'urls': urls, 'concurrency': 1})
+        lines = [json.loads(line) for line in (await response.text()).splitlines()]
+    
+    # Un solo worker: las entradas inválidas son líneas 400 y el resto sigue
+    assert [line['status_code'] for line in sorted(lines[:-1], key=lambda line: line['index'])] == [
+        200, 400, 200, 400, 400, 200
+    ]
+    assert lines[-1] == {**lines[-1], "done": True, "total": 6, "succeeded": 3, "failed": 3}
+
+
+@pytest.mark.asyncio
+async def test_batch_on_one_domain_waits_for_rate_limit_with_defaults():
+    """Defaults del servidor escalados x0.01: 30 URLs de un dominio, ningún 429."""
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    from api.handlers import ScrapingHandler
+    from common import rate_limiter as rate_limiter_module
+    
+    scale = 0.01
+    previous_limiter = rate_limiter_module._global_limiter
+    rate_limiter_module.configure_rate_limiter(max_requests=10, window_seconds=60 * scale)
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    app['rate_limit_max_wait'] = 10 * scale
+    app['batch_concurrency'] = 20
+    app['batch_per_domain'] = 4
+    app['batch_max_urls'] = 10000
+    app['batch_slots'] = asyncio.Semaphore(20)
+    handler = ScrapingHandler(app)
+    
+    async def fake_pipeline(url, key, previous=None, on_state=None, on_links=None):
+        return {"url": url, "status": "success"}, 200
+    
+    handler._scrape_pipeline = fake_pipeline
+    app.router.add_post('/scrape/batch', handler.scrape_batch)
+    
+    urls = [f'https://batch-defaults.example.com/{i}' for i in range(30)]
+    try:
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post('/scrape/batch', json={'urls': urls, 'refresh': 'true'})
+            lines = [json.loads(line) for line in (await response.text()).splitlines()]
+    finally:
+        rate_limiter_module._global_limiter = previous_limiter
+    
+    assert {line['status_code'] for line in lines[:-1]} == {200}
+    assert lines[-1]['succeeded'] == 30
+
+
+@pytest.mark.asyncio
+async def test_waiting_for_rate_limit_does_not_hold_the_global_slot():
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    from api.handlers import ScrapingHandler
+    from common import rate_limiter as rate_limiter_module
+    
+    previous_limiter = rate_limiter_module._global_limiter
+    limiter = rate_limiter_module.configure_rate_limiter(max_requests=100, window_seconds=1)
+    # Un token cada 0.5s: la segunda URL del dominio lento espera
+    limiter.set_limit('slow.example.com', 1, 0.5)
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    app['rate_limit_max_wait'] = 0.1
+    app['batch_concurrency'] = 3
+    app['batch_per_domain'] = 2
+    app['batch_max_urls'] = 10
+    app['batch_slots'] = asyncio.Semaphore(1)
+    handler = ScrapingHandler(app)
+    
+    async def fake_pipeline(url, key, previous=None, on_state=None, on_links=None):
+        return {"url": url, "status": "success"}, 200
+    
+    handler._scrape_pipeline = fake_pipeline
+    app.router.add_post('/scrape/batch', handler.scrape_batch)
+    
+    urls = ['https://slow.example.com/1', 'https://slow.example.com/2', 'https://fast.example.com/1']
+    try:
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post('/scrape/batch', json={'urls': urls, 'refresh': 'true'})
+            lines = [json.loads(line) for line in (await response.text()).splitlines()]
+    finally:
+        rate_limiter_module._global_limiter = previous_limiter
+    
+    # El único cupo global no queda tomado por la URL que espera su token
+    assert [line['url'] for line in lines[:-1]][-1] == 'https://slow.example.com/2'
+    assert lines[-1]['succeeded'] == 3
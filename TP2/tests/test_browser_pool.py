@@ -0,0 +1,159 @@
+"""
+Tests del pool de navegadores headless (screenshots reales).
+
+Los que necesitan un navegador se saltean si no hay Selenium + Chrome.
+"""
+import pytest
+import asyncio
+import time
+import sys
+import os
+from io import BytesIO
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from processor.browser_pool import BrowserPool
+
+
+def no_browser(width, height):
+    raise ImportError("No module named 'selenium'")
+
+
+async def _start_site():
+    """Página roja, y /slow que nunca termina de cargar."""
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    
+    async def red(request):
+        return web.Response(text='<html><body style="margin:0;background:#ff0000"></body></html>',
+                            content_type='text/html')
+    
+    async def slow(request):
+        response = web.StreamResponse(headers={'Content-Type': 'text/html'})
+        await response.prepare(request)
+        await response.write(b'<html><body style="margin:0;background:#0000ff">')
+        await asyncio.sleep(30)
+        return response
+    
+    app = web.Application()
+    app.router.add_get('/', red)
+    app.router.add_get('/slow', slow)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+@pytest.fixture
+def browser_pool():
+    pool = BrowserPool(size=1, max_pages=2, width=800, height=600)
+    if not pool.start():
+        pool.close()
+        pytest.skip("No hay navegador headless instalado")
+    yield pool
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_without_browser_is_unavailable():
+    pool = BrowserPool(size=2, launcher=no_browser)
+    
+    assert pool.start() == 0
+    assert pool.available is False
+    assert await pool.render('http://example.com') is None
+    assert pool.stats()['launch_failures'] == 2
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_screenshot_task_falls_back_to_placeholder():
+    from processor.worker_pool import WorkerPool
+    
+    pool = BrowserPool(size=1, launcher=no_browser)
+    pool.start()
+    with WorkerPool(num_processes=1) as workers:
+        workers.browser_pool = pool
+        result = await workers.process_task_async({
+            'type': 'screenshot_request',
+            'url': 'http://example.com',
+            'data': {'width': 320, 'height': 200, 'binary_output': True}
+        })
+    pool.close()
+    
+    assert result['success'] is True
+    assert result['result'].startswith(b'\x89PNG')
+
+
+@pytest.mark.asyncio
+async def test_wait_for_idle_browser_counts_against_deadline(monkeypatch):
+    from processor import browser_pool as browser_pool_module
+    
+    deadlines = []
+    
+    def fake_render(browser, url, width, height, deadline):
+        deadlines.append(deadline)
+        return b'png'
+    
+    # Sin Selenium: el "navegador" es un objeto cualquiera y render se reemplaza
+    monkeypatch.setattr(browser_pool_module._Browser, 'render', fake_render)
+    pool = BrowserPool(size=1, launcher=lambda width, height: object())
+    assert pool.start() == 1
+    
+    busy = pool._idle.get()
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.3, pool._idle.put, busy)
+    try:
+        assert await pool.render('http://example.com', deadline=1) == b'png'
+        # Los 0.3s esperando un navegador libre se descuentan del render
+        assert 0 < deadlines[0] <= 0.75
+        assert pool.stats()['idle'] == 1
+    finally:
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_render_real_page(browser_pool):
+    from PIL import Image
+    
+    server = await _start_site()
+    try:
+        png = await browser_pool.render(str(server.make_url('/')), deadline=10)
+    finally:
+        await server.close()
+    
+    img = Image.open(BytesIO(png)).convert('RGB')
+    assert img.size[0] == 800
+    assert img.getpixel((img.size[0] // 2, img.size[1] // 2)) == (255, 0, 0)
+
+
+@pytest.mark.asyncio
+async def test_browser_is_recycled_after_max_pages(browser_pool):
+    server = await _start_site()
+    try:
+        for _ in range(3):
+            assert await browser_pool.render(str(server.make_url('/')), deadline=10)
+        # El reemplazo se lanza en segundo plano
+        for _ in range(100):
+            if browser_pool.stats()['alive']:
+                break
+            await asyncio.sleep(0.1)
+    finally:
+        await server.close()
+    
+    stats = browser_pool.stats()
+    assert stats['renders'] == 3
+    assert stats['recycled'] >= 1
+    assert stats['alive'] == 1
+
+
+@pytest.mark.asyncio
+async def test_render_deadline_captures_partial_page(browser_pool):
+    server = await _start_site()
+    try:
+        start = time.perf_counter()
+        png = await browser_pool.render(str(server.make_url('/slow')), deadline=2)
+        elapsed = time.perf_counter() - start
+    finally:
+        await server.close()
+    
+    assert png is not None
+    assert elapsed < 6
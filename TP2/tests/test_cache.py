@@ -0,0 +1,238 @@
+"""
+Tests del caché LRU acotado.
+"""
+import pytest
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.cache import LRUCache, SQLiteCache, estimate_size
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=3)
+    
+    for i in range(3):
+        cache.set(f'http://example.com/{i}', {'i': i})
+    
+    # Usar /0 lo vuelve el más reciente: el desalojado es /1
+    assert cache.get('http://example.com/0') == {'i': 0}
+    cache.set('http://example.com/3', {'i': 3})
+    
+    assert cache.get('http://example.com/1') is None
+    assert cache.get('http://example.com/0') is not None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size'] == 3
+
+
+def test_byte_budget_and_accounting():
+    cache = LRUCache(max_entries=100, max_bytes=10_000)
+    screenshot = 'A' * 4_000
+    
+    cache.set('http://a.com', {'screenshot': screenshot})
+    cache.set('http://b.com', {'screenshot': screenshot})
+    assert cache.stats()['bytes'] == 2 * estimate_size({'screenshot': screenshot})
+    
+    # La tercera no entra: se desaloja la primera
+    cache.set('http://c.com', {'screenshot': screenshot})
+    assert cache.get('http://a.com') is None
+    assert cache.stats()['bytes'] <= 10_000
+    
+    # Más grande que todo el presupuesto: no se guarda
+    cache.set('http://huge.com', {'screenshot': 'A' * 20_000})
+    assert cache.get('http://huge.com') is None
+    assert cache.stats()['rejected'] == 1
+    
+    # Reemplazar una entrada descuenta su tamaño anterior
+    cache.set('http://b.com', {'screenshot': ''})
+    cache.remove('http://c.com')
+    assert cache.stats()['bytes'] == estimate_size({'screenshot': ''})
+    
+    largest = cache.stats()['largest_entries']
+    assert largest[0]['url'] == 'http://b.com'
+
+
+@pytest.mark.asyncio
+async def test_background_sweeper_removes_expired():
+    cache = LRUCache(ttl_seconds=0.05)
+    for i in range(5):
+        cache.set(f'http://example.com/{i}', {'i': i})
+    
+    sweeper = asyncio.create_task(cache.run_sweeper(interval=0.05))
+    await asyncio.sleep(0.2)
+    sweeper.cancel()
+    
+    stats = cache.stats()
+    assert stats['size'] == 0
+    assert stats['bytes'] == 0
+    assert stats['expirations'] == 5
+
+
+def _write_entry(path, url):
+    cache = SQLiteCache(path)
+    cache.set(url, {'from': os.getpid()})
+    cache.close()
+
+
+def test_sqlite_cache_shared_between_processes(tmp_path):
+    import multiprocessing
+    
+    path = str(tmp_path / 'cache.db')
+    reader = SQLiteCache(path)
+    assert reader.get('http://example.com') is None
+    
+    # Otra instancia del servidor (otro proceso) escribe; esta la ve
+    writer = multiprocessing.get_context('spawn').Process(
+        target=_write_entry, args=(path, 'http://example.com')
+    )
+    writer.start()
+    writer.join(30)
+    
+    value = reader.get('http://example.com')
+    assert value == {'from': writer.pid}
+    assert reader.stats()['size'] == 1
+    assert reader.stats()['hits'] == 1
+    reader.close()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_lock_wait_does_not_block_event_loop(tmp_path):
+    import sqlite3
+    
+    path = str(tmp_path / 'cache.db')
+    cache = SQLiteCache(path, timeout=5)
+    cache.set('http://a.com', {'v': 1})
+    
+    # Otro proceso toma el lock de escritura y lo suelta recién a los 0.3s
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    ticks = 0
+    
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+    
+    async def release():
+        await asyncio.sleep(0.3)
+        other.execute("COMMIT")
+    
+    ticking = asyncio.create_task(ticker())
+    try:
+        await asyncio.gather(cache.set_async('http://b.com', {'v': 2}), release())
+    finally:
+        ticking.cancel()
+        other.close()
+    
+    # El loop siguió atendiendo mientras el set esperaba el lock
+    assert ticks >= 10
+    assert (await cache.lookup_async('http://b.com')).value == {'v': 2}
+    assert (await cache.stats_async())['size'] == 2
+    cache.close()
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_cache_backends_share_ttl_semantics(backend, tmp_path):
+    import time
+    from common.cache import create_cache
+    
+    cache = create_cache(backend, ttl_seconds=0.1, max_entries=2, path=str(tmp_path / 'cache.db'))
+    
+    cache.set('http://a.com', {'v': 1})
+    cache.set('http://b.com', {'v': 2})
+    assert cache.get('http://a.com') == {'v': 1}
+    
+    # Leer no renueva el TTL, pero sí la recencia: se desaloja b
+    cache.set('http://c.com', {'v': 3})
+    assert cache.get('http://b.com') is None
+    assert cache.stats()['evictions'] == 1
+    
+    time.sleep(0.15)
+    assert cache.get('http://a.com') is None
+    assert cache.stats()['expirations'] == 1
+    assert cache.clean_expired() == 1
+    assert cache.stats()['size'] == 0
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate_with_conditional_get():
+    import json
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer, make_mocked_request
+    from api.handlers import ScrapingHandler
+    from api.parse_executor import ParseExecutor
+    from common import cache as cache_module
+    from scraper.async_http import create_session, close_session
+    
+    hits = {'200': 0, '304': 0}
+    
+    async def origin(request):
+        if request.headers.get('If-None-Match') == '"v1"':
+            hits['304'] += 1
+            return web.Response(status=304, headers={'ETag': '"v1"'})
+        hits['200'] += 1
+        return web.Response(text='<html><title>Origen</title></html>', content_type='text/html',
+                            headers={'ETag': '"v1"'})
+    
+    origin_app = web.Application()
+    origin_app.router.add_get('/', origin)
+    server = TestServer(origin_app)
+    await server.start_server()
+    
+    previous_cache = cache_module._global_cache
+    cache_module._global_cache = LRUCache(ttl_seconds=0.1, stale_ttl=60)
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    app['max_page_bytes'] = 1024 * 1024
+    app['http_session'] = create_session()
+    app['parse_executor'] = ParseExecutor('thread', 1)
+    handler = ScrapingHandler(app)
+    processing_calls = 0
+    
+    async def fake_processing(url, scraping_data, page=None):
+        nonlocal processing_calls
+        processing_calls += 1
+        return {'screenshot': 'abc'}
+    
+    handler.processing_client.request_processing = fake_processing
+    
+    async def scrape(refresh=False):
+        query = f"url={server.make_url('/')}" + ('&refresh=true' if refresh else '')
+        response = await handler.scrape(make_mocked_request('GET', f'/scrape?{query}', app=app))
+        return json.loads(response.text)
+    
+    try:
+        first = await scrape()
+        assert first['scraping_data']['title'] == 'Origen'
+        assert hits == {'200': 1, '304': 0}
+        
+        # Vencida: se sirve stale al instante y se revalida en background
+        await asyncio.sleep(0.15)
+        stale = await scrape()
+        assert stale['stale'] is True
+        assert stale['scraping_data']['title'] == 'Origen'
+        
+        await asyncio.gather(*handler._background)
+        assert hits == {'200': 1, '304': 1}
+        assert processing_calls == 1
+        
+        fresh = await scrape()
+        assert fresh['from_cache'] is True
+        assert 'stale' not in fresh
+        
+        # refresh=true también usa GET condicional
+        refreshed = await scrape(refresh=True)
+        assert refreshed['revalidated'] is True
+        assert hits == {'200': 1, '304': 2}
+        assert handler.revalidation['not_modified'] == 2
+    finally:
+        cache_module._global_cache = previous_cache
+        app['parse_executor'].shutdown()
+        await close_session(app['http_session'])
+        await server.close()
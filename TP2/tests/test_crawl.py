@@ -0,0 +1,259 @@
+"""
+Tests del crawl recursivo (/crawl).
+"""
+import pytest
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.crawl import BloomFilter, Crawler
+from common.rate_limiter import RateLimiter
+
+
+# Sitio de prueba: página -> links que contiene
+SITE = {
+    'https://site.com/': ['https://site.com/a', 'https://site.com/b#top', 'https://other.com/x'],
+    'https://site.com/a': ['https://site.com/', 'https://site.com/c', 'mailto:me@site.com'],
+    'https://site.com/b': ['https://SITE.com:443/a', 'https://site.com/d'],
+    'https://site.com/c': ['https://site.com/e'],
+    'https://site.com/d': [],
+    'https://site.com/e': [],
+}
+
+
+def fake_site(visited):
+    async def run(url):
+        visited.append(url)
+        await asyncio.sleep(0.01)
+        if url not in SITE:
+            return {"status": "error", "message": "Not found", "url": url}, 502
+        return {"url": url, "scraping_data": {"links": SITE[url]}}, 200
+    return run
+
+
+def test_bloom_filter_has_no_false_negatives():
+    seen = BloomFilter(capacity=1000, error_rate=0.01)
+    urls = [f'https://example.com/{i}' for i in range(1000)]
+    
+    added = sum(seen.add(url) for url in urls[:500])
+    assert added >= 495
+    assert all(url in seen for url in urls[:500])
+    assert not seen.add(urls[0])
+    
+    false_positives = sum(url in seen for url in urls[500:])
+    assert false_positives < 25
+    assert seen.memory_bytes < 2000
+
+
+@pytest.mark.asyncio
+async def test_crawl_follows_links_breadth_first_without_repeats():
+    visited = []
+    crawler = Crawler(fake_site(visited), max_depth=2, max_pages=100)
+    
+    pages = [page async for page in crawler.crawl('https://site.com')]
+    
+    # /e está a profundidad 3; other.com queda fuera por same_domain
+    assert sorted(visited) == ['https://site.com/', 'https://site.com/a', 'https://site.com/b',
+                               'https://site.com/c', 'https://site.com/d']
+    assert {page['url']: page['depth'] for page in pages}['https://site.com/c'] == 2
+    stats = crawler.stats()
+    assert stats['pages'] == 5
+    assert stats['off_domain'] == 1
+    assert stats['duplicates'] >= 2
+
+
+@pytest.mark.asyncio
+async def test_crawl_respects_max_pages_and_other_domains():
+    visited = []
+    crawler = Crawler(fake_site(visited), max_depth=5, max_pages=3, same_domain=False)
+    
+    pages = [page async for page in crawler.crawl('https://site.com/')]
+    
+    assert len(pages) == 3
+    assert crawler.stats()['over_limit'] > 0
+
+
+@pytest.mark.asyncio
+async def test_crawl_waits_for_rate_limit_instead_of_failing():
+    limiter = RateLimiter(max_requests=2, window_seconds=1)
+    visited = []
+    site = fake_site(visited)
+    
+    async def run(url):
+        # Igual que run_scrape: espera el token del dominio
+        if not await limiter.acquire(url, max_wait=5):
+            return {"status": "error"}, 429
+        return await site(url)
+    
+    crawler = Crawler(run, max_depth=1, max_pages=3)
+    start = asyncio.get_running_loop().time()
+    pages = [page async for page in crawler.crawl('https://site.com/')]
+    
+    # Ráfaga de 2 y después 2 por segundo: la 3ra página espera
+    assert [page['status_code'] for page in pages] == [200, 200, 200]
+    assert asyncio.get_running_loop().time() - start >= 0.45
+
+
+@pytest.mark.asyncio
+async def test_crawl_endpoint_streams_ndjson():
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    from api.handlers import ScrapingHandler
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    app['batch_per_domain'] = 2
+    app['batch_slots'] = asyncio.Semaphore(4)
+    app['crawl_concurrency'] = 2
+    app['crawl_max_depth'] = 1
+    app['crawl_max_pages'] = 100
+    handler = ScrapingHandler(app)
+    
+    visited = []
+    site = fake_site(visited)
+    
+    async def fake_run_scrape(url, force_refresh=False, on_state=None, wait_for_token=False,
+                              slot=None, on_links=None):
+        return await site(url)
+    
+    handler.run_scrape = fake_run_scrape
+    app.router.add_get('/crawl', handler.crawl)
+    
+    async with TestClient(TestServer(app)) as client:
+        # depth se recorta al máximo configurado
+        response = await client.get('/crawl', params={'url': 'https://site.com/', 'depth': '5'})
+        assert response.status == 200
+        assert response.content_type == 'application/x-ndjson'
+        
+        lines = [json.loads(line) for line in (await response.text()).splitlines()]
+        assert {line['url'] for line in lines[:-1]} == {
+            'https://site.com/', 'https://site.com/a', 'https://site.com/b'
+        }
+        assert lines[-1]['done'] is True
+        assert lines[-1]['succeeded'] == 3
+        
+        assert (await client.get('/crawl', params={'url': 'ftp://x'})).status == 400
+        assert (await client.get('/crawl', params={'url': 'https://site.com', 'depth': 'x'})).status == 400
+
+
+@pytest.mark.asyncio
+async def test_crawl_with_default_rate_limit_does_not_fail_pages():
+    """
+    Defaults del servidor (10 requests por 60s, --rate-max-wait 10,
+    5 workers de crawl) escalados x0.01 para que el test dure ~2s:
+    40 páginas de un dominio necesitan esperas mucho más largas que
+    rate-max-wait y aun así ninguna termina en 429.
+    """
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    from api.handlers import ScrapingHandler
+    from common import rate_limiter as rate_limiter_module
+    
+    scale = 0.01
+    previous_limiter = rate_limiter_module._global_limiter
+    limiter = rate_limiter_module.configure_rate_limiter(max_requests=10, window_seconds=60 * scale)
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    app['rate_limit_max_wait'] = 10 * scale
+    app['batch_per_domain'] = 4
+    app['batch_slots'] = asyncio.Semaphore(20)
+    app['crawl_concurrency'] = 5
+    app['crawl_max_depth'] = 3
+    app['crawl_max_pages'] = 500
+    handler = ScrapingHandler(app)
+    
+    async def fake_pipeline(url, key, previous=None, on_state=None, on_links=None):
+        # Raíz con 39 links; las demás páginas sin links
+        links = [f'https://defaults.example.com/{i}' for i in range(39)] if url.endswith('.com/') else []
+        return {"url": url, "scraping_data": {"links": links}}, 200
+    
+    handler._scrape_pipeline = fake_pipeline
+    app.router.add_get('/crawl', handler.crawl)
+    
+    try:
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get('/crawl', params={
+                'url': 'https://defaults.example.com/', 'depth': '1', 'max_pages': '40', 'refresh': 'true'
+            })
+            lines = [json.loads(line) for line in (await response.text()).splitlines()]
+    finally:
+        rate_limiter_module._global_limiter = previous_limiter
+    
+    statuses = [line['status_code'] for line in lines[:-1]]
+    assert len(statuses) == 40
+    assert set(statuses) == {200}
+    assert lines[-1]['succeeded'] == 40
+    # Ráfaga de 10 y el resto esperando su token
+    assert limiter.stats()['waited'] == 30
+    assert limiter.stats()['rejected'] == 0
+
+
+@pytest.mark.asyncio
+async def test_crawl_skips_malformed_links_and_survives_link_errors():
+    async def run(url):
+        if url == 'https://site.com/':
+            return {"scraping_data": {"links": ['http://[::1', 'https://site.com/ok']}}, 200
+        if url == 'https://site.com/ok':
+            # links no es una lista: falla al encolar, la página se entrega igual
+            return {"scraping_data": {"links": 5}}, 200
+        return {"status": "error"}, 404
+    
+    crawler = Crawler(run, max_depth=3, max_pages=10)
+    pages = await asyncio.wait_for(_collect(crawler.crawl('https://site.com/')), timeout=2)
+    
+    assert [page['url'] for page in pages] == ['https://site.com/', 'https://site.com/ok']
+    assert crawler.stats()['invalid_links'] == 1
+
+
+async def _collect(pages):
+    return [page async for page in pages]
+
+
+@pytest.mark.asyncio
+async def test_crawl_follows_all_links_not_only_the_response_ones():
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    from api.handlers import ScrapingHandler
+    from common import rate_limiter as rate_limiter_module
+    
+    previous_limiter = rate_limiter_module._global_limiter
+    rate_limiter_module.configure_rate_limiter(max_requests=1000, window_seconds=1)
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    app['rate_limit_max_wait'] = 10
+    app['batch_per_domain'] = 4
+    app['batch_slots'] = asyncio.Semaphore(20)
+    app['crawl_concurrency'] = 5
+    app['crawl_max_depth'] = 1
+    app['crawl_max_pages'] = 500
+    handler = ScrapingHandler(app)
+    
+    async def fake_pipeline(url, key, previous=None, on_state=None, on_links=None):
+        # Como _scrape_pipeline: la respuesta lleva 50, on_links recibe todos
+        links = [f'https://all-links.example.com/{i}' for i in range(80)] if url.endswith('.com/') else []
+        if on_links:
+            on_links(links)
+        return {"url": url, "scraping_data": {"links": links[:50], "links_count": len(links)}}, 200
+    
+    handler._scrape_pipeline = fake_pipeline
+    app.router.add_get('/crawl', handler.crawl)
+    
+    try:
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get('/crawl', params={
+                'url': 'https://all-links.example.com/', 'max_pages': '100', 'refresh': 'true'
+            })
+            lines = [json.loads(line) for line in (await response.text()).splitlines()]
+    finally:
+        rate_limiter_module._global_limiter = previous_limiter
+    
+    assert lines[-1]['succeeded'] == 81
+    assert all('_all_links' not in line['result'] for line in lines[:-1])
@@ -0,0 +1,134 @@
+"""
+Tests de la cola de trabajos de /jobs.
+"""
+import pytest
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.jobs import JobManager, JobState, QueueFull
+
+
+@pytest.mark.asyncio
+async def test_job_goes_through_all_states():
+    seen = []
+    release = asyncio.Event()
+    
+    async def runner(url, refresh, on_state):
+        seen.append(JobState.SCRAPING)
+        on_state(JobState.PROCESSING)
+        await release.wait()
+        return {"url": url, "status": "success"}, 200
+    
+    manager = JobManager(runner, workers=1, queue_size=10)
+    manager.start()
+    try:
+        job = manager.submit('https://example.com')
+        assert job.state == JobState.PENDING
+        
+        await asyncio.sleep(0.05)
+        assert manager.get(job.id).state == JobState.PROCESSING
+        
+        release.set()
+        await asyncio.sleep(0.05)
+        assert job.state == JobState.COMPLETED
+        assert job.result == {"url": 'https://example.com', "status": "success"}
+        assert manager.stats()['completed'] == 1
+    finally:
+        await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_job_queue_is_bounded_and_failures_are_recorded():
+    async def runner(url, refresh, on_state):
+        await asyncio.sleep(0.05)
+        return {"status": "error", "message": "Failed to connect"}, 502
+    
+    manager = JobManager(runner, workers=1, queue_size=2)
+    manager.start()
+    try:
+        jobs = [manager.submit(f'https://example.com/{i}') for i in range(2)]
+        
+        # El worker no llegó a sacar ninguno: la cola está llena
+        with pytest.raises(QueueFull):
+            manager.submit('https://example.com/overflow')
+        
+        await asyncio.sleep(0.3)
+        assert all(job.state == JobState.FAILED for job in jobs)
+        assert jobs[0].error == "Failed to connect"
+        assert manager.stats()['rejected'] == 1
+    finally:
+        await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_job_endpoints():
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    from api.handlers import ScrapingHandler
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    handler = ScrapingHandler(app)
+    
+    async def fake_run_scrape(url, refresh=False, on_state=None):
+        await asyncio.sleep(0.1)
+        return {"url": url, "status": "success"}, 200
+    
+    app['jobs'] = JobManager(fake_run_scrape, workers=2)
+    app.router.add_post('/jobs', handler.create_job)
+    app.router.add_get('/status/{task_id}', handler.job_status)
+    app.router.add_get('/result/{task_id}', handler.job_result)
+    
+    async with TestClient(TestServer(app)) as client:
+        app['jobs'].start()
+        
+        response = await client.post('/jobs', json={'url': 'https://example.com'})
+        assert response.status == 202
+        task_id = (await response.json())['task_id']
+        
+        response = await client.get(f'/result/{task_id}')
+        assert response.status == 202
+        
+        await asyncio.sleep(0.2)
+        status = await (await client.get(f'/status/{task_id}')).json()
+        assert status['status'] == JobState.COMPLETED
+        
+        response = await client.get(f'/result/{task_id}')
+        assert response.status == 200
+        assert (await response.json())['result']['url'] == 'https://example.com'
+        
+        assert (await client.get('/status/unknown')).status == 404
+        assert (await client.post('/jobs', json={'url': 'ftp://x'})).status == 400
+        
+        await app['jobs'].stop()
+
+
+@pytest.mark.asyncio
+async def test_stored_results_are_bounded_and_swept():
+    async def runner(url, refresh, on_state):
+        return {"url": url, "screenshot": "x" * 1000}, 200
+    
+    manager = JobManager(runner, workers=1, queue_size=10, result_ttl=0.1,
+                         max_result_bytes=2500, sweep_interval=0.05)
+    manager.start()
+    try:
+        jobs = [manager.submit(f'https://example.com/{i}') for i in range(3)]
+        await asyncio.sleep(0.03)
+        
+        # Solo entran dos resultados: el más viejo se descarta, el estado queda
+        assert all(job.state == JobState.COMPLETED for job in jobs)
+        assert jobs[0].result is None and jobs[0].result_evicted
+        assert jobs[1].result is not None and jobs[2].result is not None
+        assert manager.stats()['result_bytes'] <= 2500
+        
+        # Sin submit() nuevos, el barrido periódico libera los vencidos
+        await asyncio.sleep(0.2)
+        assert all(manager.get(job.id) is None for job in jobs)
+        assert manager.stats()['result_bytes'] == 0
+    finally:
+        await manager.stop()
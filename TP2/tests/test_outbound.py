@@ -0,0 +1,94 @@
+"""
+Tests del límite de concurrencia saliente (global + por host adaptativo).
+"""
+import pytest
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.outbound import OutboundGovernor
+
+
+async def _track(governor, url, active, peak, delay=0.02, status=200):
+    async with governor.slot(url) as outcome:
+        host = url.split('/')[2]
+        active[host] = active.get(host, 0) + 1
+        active['*'] = active.get('*', 0) + 1
+        peak[host] = max(peak.get(host, 0), active[host])
+        peak['*'] = max(peak.get('*', 0), active['*'])
+        await asyncio.sleep(delay)
+        outcome.status = status
+        active[host] -= 1
+        active['*'] -= 1
+
+
+@pytest.mark.asyncio
+async def test_per_host_and_global_caps():
+    governor = OutboundGovernor(global_limit=5, per_host=2, max_per_host=2)
+    active, peak = {}, {}
+    
+    urls = [f'https://site{i % 4}.com/{i}' for i in range(40)]
+    await asyncio.gather(*(_track(governor, url, active, peak) for url in urls))
+    
+    assert peak['*'] <= 5
+    assert max(v for k, v in peak.items() if k != '*') <= 2
+    assert governor.stats()['requests'] == 40
+    assert governor.stats()['active'] == 0
+
+
+@pytest.mark.asyncio
+async def test_limit_grows_on_success_and_halves_on_backoff():
+    governor = OutboundGovernor(per_host=2, max_per_host=8)
+    active, peak = {}, {}
+    
+    for _ in range(10):
+        await asyncio.gather(*(_track(governor, 'https://fast.com/', active, peak, delay=0)
+                               for _ in range(8)))
+    assert governor.limit_for('https://fast.com/') == 8
+    
+    await _track(governor, 'https://fast.com/', active, peak, delay=0, status=503)
+    assert governor.limit_for('https://fast.com/') == 4
+    
+    with pytest.raises(ConnectionError):
+        async with governor.slot('https://fast.com/'):
+            raise ConnectionError("reset")
+    assert governor.limit_for('https://fast.com/') == 2
+    assert governor.stats()['busiest_hosts']['fast.com']['errors'] == 2
+
+
+@pytest.mark.asyncio
+async def test_validation_errors_do_not_lower_the_limit():
+    governor = OutboundGovernor(per_host=4, max_per_host=4)
+    
+    with pytest.raises(ValueError):
+        async with governor.slot('https://example.com/'):
+            raise ValueError("too large")
+    
+    assert governor.limit_for('https://example.com/') == 4
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_slot():
+    governor = OutboundGovernor(per_host=1, max_per_host=1)
+    release = asyncio.Event()
+    
+    async def hold():
+        async with governor.slot('https://example.com/'):
+            await release.wait()
+    
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    assert governor.stats()['waiting_host'] == 1
+    
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    release.set()
+    await holder
+    
+    # El slot volvió: un request nuevo entra sin esperar
+    await asyncio.wait_for(hold(), timeout=1)
+    assert governor.stats()['waiting_host'] == 0
@@ -0,0 +1,155 @@
+"""
+Tests del cliente del servidor de procesamiento (sin servidor real).
+"""
+import pytest
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.processing_client import ProcessingClient
+
+
+def make_client(delays, results=None):
+    client = ProcessingClient('127.0.0.1', 1)
+    results = results or {}
+    
+    async def fake_send_task(task_type, url, data):
+        await asyncio.sleep(delays.get(task_type, 0))
+        return {'success': True, 'result': results.get(task_type, {})}
+    
+    client._send_task = fake_send_task
+    return client
+
+
+@pytest.mark.asyncio
+async def test_request_processing_runs_tasks_concurrently():
+    client = make_client(
+        {'screenshot_request': 0.3, 'performance_request': 0.3, 'images_request': 0.3},
+        {'screenshot_request': 'abc', 'performance_request': {'load_time_ms': 1}, 'images_request': []}
+    )
+    
+    result = await client.request_processing('http://example.com', {'image_urls': ['http://example.com/a.png']})
+    
+    # En paralelo: ~max(0.3) en lugar de la suma (0.9)
+    assert result['timings_ms']['total'] < 600
+    assert set(result['timings_ms']) == {'screenshot', 'performance', 'images', 'total'}
+    assert result['screenshot'] == 'abc'
+    assert result['performance'] == {'load_time_ms': 1}
+
+
+@pytest.mark.asyncio
+async def test_request_processing_partial_results_on_deadline():
+    client = make_client({'screenshot_request': 5})
+    client.TASK_DEADLINES = {'screenshot': 0.1, 'performance': 1, 'images': 1}
+    
+    result = await client.request_processing('http://example.com', {})
+    
+    assert result['screenshot'] is None
+    assert 'Deadline' in result['screenshot_error']
+    assert result['performance'] == {}
+    assert result['timings_ms']['total'] < 1000
+
+
+@pytest.mark.asyncio
+async def test_request_processing_sends_page_snapshot_only_to_performance():
+    sent = {}
+    client = ProcessingClient('127.0.0.1', 1)
+    
+    async def fake_send_task(task_type, url, data):
+        sent[task_type] = data
+        return {'success': True, 'result': {}}
+    
+    client._send_task = fake_send_task
+    page = {'body': b'x', 'encoding': 'zlib'}
+    await client.request_processing('http://example.com', {'image_urls': ['http://example.com/a.png']},
+                                    page=page)
+    
+    assert sent['performance_request']['page'] is page
+    assert 'page' not in sent['screenshot_request']
+    assert 'page' not in sent['images_request']
+
+
+async def _start_fake_server(multiplexed: bool):
+    """Servidor nuevo (HELLO + varios requests) o viejo (un mensaje y cierra)."""
+    from common.protocol import Protocol, MessageType
+    
+    connections = []
+    
+    async def handle(reader, writer):
+        connections.append(writer)
+        try:
+            while True:
+                message = await Protocol.receive_message_async(reader)
+                if message.get('type') == MessageType.HELLO:
+                    if multiplexed:
+                        response = {'success': True, 'result': {'codec': 'json'}}
+                    else:
+                        response = {'success': False, 'error': 'Unknown message type'}
+                else:
+                    response = {'id': message.get('id'), 'success': True, 'result': message['url']}
+                await Protocol.send_message_async(writer, response)
+                if not multiplexed:
+                    break
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+    
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1], connections
+
+
+@pytest.mark.asyncio
+async def test_legacy_server_falls_back_to_one_connection_per_request():
+    from api.processing_client import MultiplexedConnection
+    
+    server, port, connections = await _start_fake_server(multiplexed=False)
+    conn = MultiplexedConnection('127.0.0.1', port)
+    try:
+        responses = await asyncio.gather(*[
+            conn.request({'type': 'performance_request', 'url': f'http://example.com/{i}'}, timeout=5)
+            for i in range(3)
+        ])
+    finally:
+        await conn.close()
+        server.close()
+        await server.wait_closed()
+    
+    assert conn.legacy is True
+    assert conn.supports_attachments is False
+    assert [response['result'] for response in responses] == [f'http://example.com/{i}' for i in range(3)]
+    # El HELLO rechazado + una conexión por request
+    assert len(connections) == 4
+
+
+@pytest.mark.asyncio
+async def test_old_read_loop_cleanup_does_not_touch_new_connection():
+    from api.processing_client import MultiplexedConnection
+    
+    server, port, _ = await _start_fake_server(multiplexed=True)
+    conn = MultiplexedConnection('127.0.0.1', port)
+    try:
+        # Lectora de una conexión anterior que todavía no terminó de cerrarse
+        _, old_writer = await asyncio.open_connection('127.0.0.1', port)
+        old_reader = asyncio.StreamReader()
+        old_future = asyncio.get_running_loop().create_future()
+        old_loop = asyncio.create_task(conn._read_loop(old_reader, old_writer, {1: old_future}))
+        
+        await conn.ensure_connected()
+        new_request = asyncio.create_task(
+            conn.request({'type': 'performance_request', 'url': 'http://example.com/new'}, timeout=5)
+        )
+        await asyncio.sleep(0)
+        
+        old_reader.feed_eof()
+        await old_loop
+        
+        assert isinstance(old_future.exception(), ConnectionError)
+        assert conn.connected
+        assert (await new_request)['result'] == 'http://example.com/new'
+    finally:
+        await conn.close()
+        server.close()
+        await server.wait_closed()
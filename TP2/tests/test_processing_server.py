@@ -2,6 +2,7 @@
 Tests para el servidor de procesamiento y workers.
 """
 import pytest
+import asyncio
 import socket
 import time
 import threading
@@ -62,6 +63,38 @@ def test_pool_multiple_tasks():
         assert len(results) == 10
 
 
+def test_worker_pool_warm_up():
+    from processor.worker_pool import WorkerPool
+    
+    with WorkerPool(num_processes=2) as pool:
+        assert pool.warm_up(timeout=10) >= 1
+        
+        # El pool persistente se reutiliza entre tareas
+        first = pool.process_task({'type': 'screenshot_request', 'url': 'http://a.test', 'data': {'width': 200, 'height': 100}})
+        second = pool.process_task({'type': 'screenshot_request', 'url': 'http://b.test', 'data': {'width': 200, 'height': 100}})
+        
+        assert first['success'] and second['success']
+        assert first['process_id'] != os.getpid()
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_process_task_async():
+    import asyncio
+    from processor.worker_pool import WorkerPool
+    
+    with WorkerPool(num_processes=2) as pool:
+        tasks = [
+            pool.process_task_async({'type': 'screenshot_request', 'url': f'http://{i}.test', 'data': {'width': 200, 'height': 100}})
+            for i in range(4)
+        ]
+        tasks.append(pool.process_task_async({'type': 'unknown_task_type', 'url': 'http://x.test'}))
+        
+        results = await asyncio.gather(*tasks)
+        
+        assert all(r['success'] for r in results[:4])
+        assert results[4]['success'] is False
+
+
 def test_pool_context_manager():
     with WorkerPool(num_processes=2) as pool:
         assert pool.num_processes == 2
@@ -109,6 +142,185 @@ def test_performance_metrics_structure():
     assert 'images' in result['resources']
 
 
+PAGE_HTML = """<html><head>
+<link rel="stylesheet" href="/style.css">
+<link rel="stylesheet" href="/print.css" media="print">
+<link rel="preload" href="/fonts/a.woff2" as="font">
+<link rel="icon" href="/favicon.ico">
+<script src="/app.js"></script>
+<script src="/lazy.js" async></script>
+<style>@font-face { src: url('/fonts/b.woff2') }</style>
+</head><body>
+<img src="/img/1.png"><img srcset="/img/2.png 1x, /img/2@2x.png 2x">
+<img src="/img/1.png#again"><img src="data:image/gif;base64,R0lGOD">
+<iframe src="/frame.html"></iframe>
+<video src="/movie.mp4" poster="/img/poster.png"></video>
+</body></html>"""
+
+
+async def _start_page_server(delays):
+    """Sirve PAGE_HTML en / y cada subrecurso con 1000 bytes; delays[path] segundos de espera."""
+    import asyncio
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    
+    requested = []
+    
+    async def page(request):
+        requested.append(request.path)
+        return web.Response(text=PAGE_HTML, content_type='text/html')
+    
+    async def resource(request):
+        requested.append(request.path)
+        await asyncio.sleep(delays.get(request.path, 0))
+        if request.path == '/style.css':
+            return web.Response(text="@font-face { src: url(fonts/c.woff2) }" + " " * 962,
+                                content_type='text/css')
+        return web.Response(body=b'x' * 1000, content_type='application/octet-stream')
+    
+    app = web.Application()
+    app.router.add_get('/', page)
+    app.router.add_get('/{path:.+}', resource)
+    server = TestServer(app)
+    await server.start_server()
+    return server, requested
+
+
+def test_resource_extractor_finds_subresources():
+    from lxml import etree
+    from processor.performance import ResourceExtractor
+    
+    extractor = ResourceExtractor()
+    parser = etree.HTMLParser(target=extractor, recover=True)
+    parser.feed(PAGE_HTML)
+    parser.close()
+    found = extractor.resolve('https://site.com/')
+    
+    assert found['https://site.com/style.css'] == ['stylesheets', True]
+    assert found['https://site.com/print.css'] == ['stylesheets', False]
+    assert found['https://site.com/app.js'] == ['scripts', True]
+    assert found['https://site.com/lazy.js'] == ['scripts', False]
+    assert found['https://site.com/fonts/a.woff2'][0] == 'fonts'
+    assert found['https://site.com/fonts/b.woff2'][0] == 'fonts'
+    assert found['https://site.com/img/2.png'][0] == 'images'
+    assert found['https://site.com/movie.mp4'][0] == 'videos'
+    # Sin repetidos (#fragmento) ni data: URIs
+    assert sum(1 for kind, _ in found.values() if kind == 'images') == 4
+
+
+@pytest.mark.asyncio
+async def test_analyze_performance_measures_page_weight():
+    from processor.performance import analyze_performance_async
+    
+    server, requested = await _start_page_server({'/style.css': 0.3, '/img/1.png': 0.6})
+    try:
+        result = await analyze_performance_async(str(server.make_url('/')), {'timeout': 5})
+    finally:
+        await server.close()
+    
+    # 11 del HTML (el video no se descarga) + la fuente de style.css
+    assert result['analysis_mode'] == 'full'
+    assert result['num_requests'] == 1 + 12
+    assert '/fonts/c.woff2' in requested
+    assert '/movie.mp4' not in requested
+    assert result['breakdown']['images'] == {"count": 4, "requests": 4, "bytes": 4000,
+                                             "failed": 0, "kb": 3.91}
+    assert result['breakdown']['fonts']['requests'] == 3
+    assert result['resources']['videos'] == 1
+    assert result['total_bytes'] == len(PAGE_HTML) + 12 * 1000
+    
+    # Camino crítico: HTML + style.css; la imagen lenta no bloquea
+    assert 300 <= result['critical_path_ms'] < 550
+    assert result['load_time_ms'] >= 600
+    assert result['slowest'][0]['url'].endswith('/img/1.png')
+
+
+@pytest.mark.asyncio
+async def test_analyze_performance_stops_at_deadline():
+    from processor.performance import analyze_performance_async
+    
+    server, _ = await _start_page_server({'/app.js': 5})
+    try:
+        start = time.perf_counter()
+        result = await analyze_performance_async(str(server.make_url('/')), deadline=1)
+        elapsed = time.perf_counter() - start
+    finally:
+        await server.close()
+    
+    assert elapsed < 2
+    assert result['analysis_mode'] == 'partial'
+    assert result['pending_requests'] == 1
+    assert result['num_requests'] == 12
+    # El script bloqueante nunca llegó
+    assert 1000 <= result['critical_path_ms'] < 1500
+
+
+@pytest.mark.asyncio
+async def test_analyze_performance_uses_page_snapshot():
+    from common.protocol import create_page_snapshot
+    from processor.performance import analyze_performance_async
+    
+    server, requested = await _start_page_server({})
+    page_url = str(server.make_url('/'))
+    snapshot = create_page_snapshot(PAGE_HTML, 200, {
+        'final_url': page_url,
+        'content_type': 'text/html',
+        'bytes_read': len(PAGE_HTML),
+        'headers': {'Server': 'origin/1.0'},
+        'timing': {'ttfb_ms': 150, 'download_ms': 50, 'total_ms': 200}
+    })
+    try:
+        result = await analyze_performance_async(page_url, {'page': snapshot})
+    finally:
+        await server.close()
+    
+    # El HTML no se volvió a pedir: solo los subrecursos
+    assert '/' not in requested
+    assert len(requested) == 12
+    assert result['html_source'] == 'snapshot'
+    assert result['html_time_ms'] == 200
+    assert result['server'] == 'origin/1.0'
+    assert result['num_requests'] == 13
+    assert result['critical_path_ms'] > 200
+
+
+@pytest.mark.asyncio
+async def test_analyze_performance_feeds_snapshot_in_chunks(monkeypatch):
+    from common.protocol import create_page_snapshot
+    from processor import performance
+    
+    # Pedazos chicos: los tags quedan partidos entre un feed y el siguiente
+    monkeypatch.setattr(performance, 'FEED_CHUNK_CHARS', 7)
+    server, requested = await _start_page_server({})
+    page_url = str(server.make_url('/'))
+    snapshot = create_page_snapshot(PAGE_HTML, 200, {
+        'final_url': page_url,
+        'content_type': 'text/html',
+        'bytes_read': len(PAGE_HTML),
+        'timing': {'total_ms': 200}
+    })
+    
+    ticks = 0
+    
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0)
+    
+    task = asyncio.create_task(ticker())
+    try:
+        result = await performance.analyze_performance_async(page_url, {'page': snapshot})
+    finally:
+        task.cancel()
+        await server.close()
+    
+    assert len(requested) == 12
+    assert result['num_requests'] == 13
+    # Entre pedazo y pedazo el loop atendió otras tareas
+    assert ticks >= len(PAGE_HTML) // 7
+
+
 # ==================== TESTS DE IMAGE PROCESSOR ====================
 
 def test_create_thumbnail():
@@ -168,6 +380,226 @@ def test_process_images_real():
         assert 'original_size' in result
 
 
+def _jpeg_bytes(width, height):
+    from PIL import Image
+    
+    # Gradiente + ruido: un JPEG "real", no de un solo color
+    img = Image.radial_gradient('L').resize((width, height)).convert('RGB')
+    img = Image.blend(img, Image.effect_noise((width, height), 40).convert('RGB'), 0.3)
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('preset,expected_format', [
+    ('fast', 'JPEG'), ('balanced', 'WEBP'), ('quality', 'PNG')
+])
+def test_thumbnail_presets(preset, expected_format):
+    from PIL import Image
+    from processor.image_processor import process_image_bytes
+    
+    result = process_image_bytes('http://x.test/a.jpg', _jpeg_bytes(1600, 1200),
+                                 binary_output=True, preset=preset)
+    
+    thumb = Image.open(BytesIO(result['thumbnail']))
+    assert thumb.format == expected_format
+    assert result['thumbnail_format'] == expected_format
+    assert max(thumb.size) == 150
+    # El tamaño original se mide antes de decodificar reducido
+    assert result['original_size'] == {'width': 1600, 'height': 1200}
+
+
+def test_thumbnail_keeps_transparency_only_where_supported():
+    from PIL import Image
+    from processor.image_processor import create_thumbnail
+    
+    rgba = Image.new('RGBA', (400, 400), (255, 0, 0, 0))
+    
+    jpeg = Image.open(BytesIO(create_thumbnail(rgba, as_bytes=True, preset='fast')))
+    webp = Image.open(BytesIO(create_thumbnail(rgba, as_bytes=True, preset='balanced')))
+    
+    assert jpeg.mode == 'RGB'
+    assert webp.mode == 'RGBA'
+    
+    with pytest.raises(ValueError):
+        create_thumbnail(rgba, preset='turbo')
+
+
+def _original_thumbnail(img, size=(150, 150)):
+    """create_thumbnail tal como era antes de los presets."""
+    from PIL import Image
+    
+    thumb = img.copy()
+    thumb.thumbnail(size, Image.Resampling.LANCZOS)
+    if thumb.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', thumb.size, (255, 255, 255))
+        if thumb.mode == 'P':
+            thumb = thumb.convert('RGBA')
+        background.paste(thumb, mask=thumb.split()[-1] if thumb.mode == 'RGBA' else None)
+        thumb = background
+    buffer = BytesIO()
+    thumb.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def test_quality_preset_matches_original_thumbnail():
+    from PIL import Image
+    from processor.image_processor import create_thumbnail
+    
+    rgba = Image.new('RGBA', (400, 300), (255, 0, 0, 0))
+    rgba.paste((0, 0, 255, 128), (100, 100, 300, 200))
+    palette = rgba.convert('RGB').convert('P', palette=Image.Palette.ADAPTIVE, colors=4)
+    palette.info['transparency'] = 0
+    images = [rgba, rgba.convert('LA'), palette, rgba.convert('RGB'), rgba.convert('L')]
+    
+    for img in images:
+        assert create_thumbnail(img, as_bytes=True, preset='quality') == _original_thumbnail(img), img.mode
+    
+    # El resto de los presets conserva la transparencia de una imagen P
+    webp = Image.open(BytesIO(create_thumbnail(palette, as_bytes=True, preset='balanced')))
+    assert webp.mode == 'RGBA'
+    assert webp.getextrema()[3][0] == 0
+
+
+def test_image_analytics():
+    from PIL import Image, ImageDraw, ImageFilter
+    from processor.image_analytics import analyze_image
+    
+    # Mitad izquierda roja opaca, mitad derecha transparente
+    img = Image.new('RGBA', (200, 100), (0, 0, 0, 0))
+    ImageDraw.Draw(img).rectangle((0, 0, 99, 99), fill=(255, 0, 0, 255))
+    
+    analytics = analyze_image(img)
+    
+    assert analytics['palette'][0]['hex'] == '#ff0000'
+    assert analytics['palette'][0]['share'] == 1.0
+    assert analytics['transparency']['has_alpha'] is True
+    assert 45 <= analytics['transparency']['transparent_pct'] <= 55
+    # Brillo solo de los píxeles visibles: luma del rojo puro
+    assert analytics['brightness']['mean'] == pytest.approx(76.2, abs=0.5)
+    assert sum(analytics['brightness']['histogram']) == pytest.approx(1.0)
+    
+    # Los bordes nítidos dan más varianza del laplaciano que los borrosos
+    checker = Image.new('L', (120, 120), 0)
+    draw = ImageDraw.Draw(checker)
+    for x in range(0, 120, 10):
+        for y in range((x // 10) % 2 * 10, 120, 20):
+            draw.rectangle((x, y, x + 9, y + 9), fill=255)
+    blurred = checker.filter(ImageFilter.GaussianBlur(3))
+    assert analyze_image(checker)['sharpness'] > 4 * analyze_image(blurred)['sharpness']
+    assert analyze_image(checker)['transparency']['has_alpha'] is False
+
+
+def test_image_analytics_cost_bounded_by_sample():
+    from processor.image_processor import process_image_bytes
+    
+    result = process_image_bytes('http://x.test/a.jpg', _jpeg_bytes(4000, 3000),
+                                 binary_output=True, preset='fast')
+    
+    analytics = result['analytics']
+    assert max(analytics['sample_size'].values()) <= 150
+    assert len(analytics['palette']) <= 5
+    assert result['dominant_color'] == {key: analytics['palette'][0][key] for key in 'rgb'}
+
+
+@pytest.mark.slow
+def test_thumbnail_benchmark(capsys):
+    from processor.image_processor import process_image_bytes
+    
+    rounds = 2
+    for width, height in ((800, 600), (4800, 3600)):
+        data = _jpeg_bytes(width, height)
+        timings = {}
+        for preset in ('quality', 'balanced', 'fast'):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                process_image_bytes('http://x.test/a.jpg', data, binary_output=True, preset=preset)
+            timings[preset] = (time.perf_counter() - start) / rounds
+        
+        # Reporte en la salida de pytest (no queda capturado)
+        with capsys.disabled():
+            print(f"\n{width}x{height} ({len(data) // 1024} KB) - " + ", ".join(
+                f"{preset}: {1 / seconds:.0f} img/s" for preset, seconds in timings.items()
+            ))
+        
+        # En una imagen grande draft decodifica a 1/8: margen amplio para CI cargado
+        if width >= 2400:
+            assert timings['fast'] < timings['quality']
+
+
+async def _start_image_server(delays):
+    """Sirve /img/<n>.png; delays[n] segundos de espera antes de responder."""
+    import asyncio
+    from PIL import Image
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    
+    buffer = BytesIO()
+    Image.new('RGB', (400, 300), color='green').save(buffer, format='PNG')
+    png = buffer.getvalue()
+    
+    async def image(request):
+        index = int(request.match_info['n'])
+        await asyncio.sleep(delays.get(index, 0))
+        return web.Response(body=png, content_type='image/png')
+    
+    async def not_image(request):
+        return web.Response(text='<html></html>', content_type='text/html')
+    
+    app = web.Application()
+    app.router.add_get('/img/{n}.png', image)
+    app.router.add_get('/page.html', not_image)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+@pytest.mark.asyncio
+async def test_images_pipeline_downloads_in_parallel():
+    from processor.worker_pool import WorkerPool
+    
+    server = await _start_image_server({i: 0.5 for i in range(5)})
+    urls = [str(server.make_url(f'/img/{i}.png')) for i in range(5)]
+    urls.append(str(server.make_url('/page.html')))
+    try:
+        with WorkerPool(num_processes=2) as pool:
+            start = time.perf_counter()
+            result = await pool.process_images_async(
+                {'image_urls': urls, 'max_images': 6, 'binary_output': True}, deadline=10
+            )
+            elapsed = time.perf_counter() - start
+    finally:
+        await server.close()
+    
+    # 5 x 0.5s en serie serían 2.5s
+    assert elapsed < 2
+    assert result['completed'] == 5
+    assert result['failed'] == 1
+    assert result['partial'] is False
+    assert [item['url'] for item in result['thumbnails']] == urls[:5]
+    assert result['thumbnails'][0]['original_size'] == {'width': 400, 'height': 300}
+    assert isinstance(result['thumbnails'][0]['thumbnail'], bytes)
+
+
+@pytest.mark.asyncio
+async def test_images_pipeline_returns_partial_results_on_deadline():
+    from processor.worker_pool import WorkerPool
+    
+    server = await _start_image_server({0: 0, 1: 0, 2: 5})
+    urls = [str(server.make_url(f'/img/{i}.png')) for i in range(3)]
+    try:
+        with WorkerPool(num_processes=2) as pool:
+            start = time.perf_counter()
+            result = await pool.process_images_async({'image_urls': urls}, deadline=1.5)
+            elapsed = time.perf_counter() - start
+    finally:
+        await server.close()
+    
+    assert elapsed < 2.5
+    assert result['partial'] is True
+    assert [item['url'] for item in result['thumbnails']] == urls[:2]
+
+
 # ==================== TESTS DE COMUNICACIÓN CON SERVIDOR ====================
 
 def test_server_ping():    
@@ -3,8 +3,11 @@ import asyncio
 import socket
 import threading
 import time
-from common.protocol import Protocol, MessageType, create_request, create_response
-from common.serialization import Serializer, Base64Helper, prepare_for_json
+from common.protocol import (
+    Protocol, MessageType, create_request, create_response, negotiate_codec,
+    create_page_snapshot, open_page_snapshot
+)
+from common.serialization import Serializer, SerializationFormat, Base64Helper, prepare_for_json
 
 def test_encode_decode_simple():
     data = {"type": "test", "message": "hello"}
@@ -58,6 +61,69 @@ def test_incomplete_message():
         Protocol.decode_message(incomplete)
 
 
+@pytest.mark.parametrize("codec", Serializer.available_formats())
+def test_binary_frame_roundtrip_with_attachments(codec):
+    png = bytes(range(256)) * 10
+    data = {
+        "type": MessageType.SUCCESS_RESPONSE,
+        "result": {"screenshot": png, "thumbnails": [{"url": "a", "thumbnail": png[:50]}]},
+        "id": 7
+    }
+    
+    encoded = Protocol.encode_frame(data, codec)
+    decoded = Protocol.decode_message(encoded, allow_pickle=True)
+    
+    assert encoded[0] == Protocol.FRAME_MAGIC
+    assert decoded["result"]["screenshot"] == png
+    assert decoded["result"]["thumbnails"][0]["thumbnail"] == png[:50]
+    # Los bytes viajan crudos: sin el ~33% extra de base64
+    assert len(encoded) < len(png) * 1.2
+
+
+def test_binary_frame_compression_and_pickle_guard():
+    data = {"html": "<p>hola</p>" * 20000}
+    
+    compressed = Protocol.encode_frame(data, SerializationFormat.JSON, compress=True)
+    assert compressed[3] & Protocol.FLAG_ZLIB
+    assert len(compressed) < len(data["html"]) // 10
+    assert Protocol.decode_message(compressed) == data
+    
+    pickled = Protocol.encode_frame(data, SerializationFormat.PICKLE)
+    with pytest.raises(ValueError, match="pickle"):
+        Protocol.decode_message(pickled)
+
+
+def test_page_snapshot_travels_compressed_as_attachment():
+    html = "<html><body>" + "<p>contenido repetido</p>" * 5000 + "</body></html>"
+    snapshot = create_page_snapshot(html, 200, {
+        'final_url': 'https://example.com/',
+        'content_type': 'text/html',
+        'bytes_read': len(html),
+        'headers': {'Server': 'nginx'},
+        'timing': {'ttfb_ms': 12.5, 'total_ms': 40.0}
+    })
+    
+    encoded = Protocol.encode_frame(create_request(MessageType.PERFORMANCE_REQUEST, 'https://example.com/',
+                                                   page=snapshot), SerializationFormat.JSON)
+    assert len(encoded) < len(html) // 10
+    
+    received = Protocol.decode_message(encoded)['data']['page']
+    assert open_page_snapshot(received) == html
+    assert received['timing'] == {'ttfb_ms': 12.5, 'total_ms': 40.0}
+    assert received['headers'] == {'Server': 'nginx'}
+    
+    with pytest.raises(ValueError):
+        open_page_snapshot({'body': 'no es binario'})
+
+
+def test_negotiate_codec():
+    supported = [SerializationFormat.MSGPACK, SerializationFormat.JSON]
+    
+    assert negotiate_codec(["json", "msgpack"], supported) == SerializationFormat.MSGPACK
+    assert negotiate_codec(["json"], supported) == SerializationFormat.JSON
+    assert negotiate_codec(["pickle"], supported) == SerializationFormat.JSON
+
+
 def test_create_request():
     req = create_request(
         MessageType.SCRAPE_REQUEST,
@@ -296,5 +362,48 @@ async def test_concurrent_clients():
         await server.wait_closed()
 
 
+@pytest.mark.asyncio
+async def test_multiplexed_out_of_order_responses():
+    from api.processing_client import MultiplexedConnection
+    
+    connections = 0
+    
+    async def server_handler(reader, writer):
+        nonlocal connections
+        connections += 1
+        hello = await Protocol.receive_message_async(reader)
+        assert hello["type"] == MessageType.HELLO
+        await Protocol.send_message_async(writer, create_response(True, result={"codec": "json"}))
+        
+        first = await Protocol.receive_message_async(reader)
+        second = await Protocol.receive_message_async(reader)
+        
+        # Responder en orden inverso: el cliente debe emparejar por id
+        for msg in (second, first):
+            response = create_response(True, result={"echo": msg["data"]["n"]}, request_id=msg["id"])
+            await Protocol.send_message_async(writer, response, codec=SerializationFormat.JSON)
+        
+        await reader.read()
+        writer.close()
+    
+    server = await asyncio.start_server(server_handler, '127.0.0.1', 9994)
+    conn = MultiplexedConnection('127.0.0.1', 9994)
+    
+    try:
+        responses = await asyncio.gather(
+            conn.request(create_request(MessageType.PING, "a", n=1), timeout=5),
+            conn.request(create_request(MessageType.PING, "b", n=2), timeout=5)
+        )
+        
+        assert [r["result"]["echo"] for r in responses] == [1, 2]
+        assert connections == 1
+        assert conn.in_flight == 0
+    
+    finally:
+        await conn.close()
+        server.close()
+        await server.wait_closed()
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Tests del rate limiter token bucket por dominio.
+"""
+import pytest
+import asyncio
+import time
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.rate_limiter import RateLimiter, parse_override
+
+
+def test_sync_api_allows_burst_then_limits():
+    limiter = RateLimiter(max_requests=3, window_seconds=60)
+    url = 'https://example.com/page'
+    
+    for _ in range(3):
+        assert limiter.can_request(url)
+        limiter.record_request(url)
+    
+    assert not limiter.can_request(url)
+    # Un token cada 20s
+    assert 19 < limiter.wait_time(url) <= 20
+    # Otro dominio tiene su propio bucket
+    assert limiter.can_request('https://other.com/')
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_at_the_allowed_rate():
+    limiter = RateLimiter(max_requests=2, window_seconds=0.2)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    
+    # Ráfaga de 2 y después uno cada 0.1s
+    granted = await asyncio.gather(*(limiter.acquire('https://example.com/') for _ in range(6)))
+    
+    assert all(granted)
+    elapsed = loop.time() - start
+    assert 0.35 <= elapsed < 0.6
+    assert limiter.stats()['waited'] == 4
+
+
+@pytest.mark.asyncio
+async def test_acquire_rejects_when_wait_exceeds_max_wait():
+    limiter = RateLimiter(max_requests=1, window_seconds=60)
+    
+    assert await limiter.acquire('https://example.com/', max_wait=0)
+    assert not await limiter.acquire('https://example.com/', max_wait=5)
+    # El rechazo no consume: la espera sigue siendo la de un solo token
+    assert limiter.wait_time('https://example.com/') <= 60
+    assert limiter.stats()['rejected'] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_returns_its_token():
+    limiter = RateLimiter(max_requests=1, window_seconds=10)
+    await limiter.acquire('https://example.com/')
+    
+    waiter = asyncio.create_task(limiter.acquire('https://example.com/'))
+    await asyncio.sleep(0.01)
+    assert limiter.wait_time('https://example.com/') > 10
+    
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.wait_time('https://example.com/') <= 10
+
+
+def test_per_domain_overrides():
+    limiter = RateLimiter(max_requests=1, window_seconds=60,
+                          overrides={'API.example.com': (100, 1)})
+    
+    for _ in range(50):
+        assert limiter.can_request('https://api.example.com/v1')
+        limiter.record_request('https://api.example.com/v1')
+    
+    limiter.set_limit('slow.com', 1, 3600)
+    limiter.record_request('https://slow.com/')
+    assert limiter.wait_time('https://slow.com/') > 3000
+    
+    assert parse_override('example.com=30/60') == ('example.com', (30, 60.0))
+    with pytest.raises(ValueError):
+        parse_override('example.com')
+
+
+def test_idle_domains_are_evicted():
+    limiter = RateLimiter(max_requests=5, window_seconds=0.05, idle_seconds=0)
+    
+    for i in range(100):
+        limiter.record_request(f'https://site{i}.com/')
+    
+    time.sleep(0.06)
+    limiter.can_request('https://new.com/')
+    
+    # Solo queda el bucket recién creado: los demás ya se habían llenado
+    assert limiter.stats()['domains'] == 1
+    assert limiter.stats()['evicted_domains'] >= 99
@@ -22,6 +22,160 @@ async def test_async_client_context_manager():
     assert client.session.closed
 
 
+@pytest.mark.asyncio
+async def test_async_client_shared_session():
+    from scraper.async_http import create_session, close_session
+    
+    session = create_session(limit=20, limit_per_host=5, dns_ttl=60)
+    try:
+        for _ in range(3):
+            async with AsyncHTTPClient(session=session) as client:
+                assert client.session is session
+            
+            # La sesión compartida sobrevive al cliente
+            assert not session.closed
+        
+        assert session.connector.limit == 20
+        assert session.connector.limit_per_host == 5
+    finally:
+        await close_session(session)
+    
+    assert session.closed
+
+
+async def _start_page_server(routes):
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    
+    app = web.Application()
+    for path, handler in routes.items():
+        app.router.add_get(path, handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+@pytest.mark.asyncio
+async def test_fetch_streaming_size_cap():
+    from aiohttp import web
+    from scraper.async_http import ResponseTooLarge, UnsupportedContentType, HTML_CONTENT_TYPES
+    
+    body = "<html><body>" + "<p>texto</p>" * 5000 + "</body></html>"
+    
+    async def with_length(request):
+        return web.Response(text=body, content_type='text/html')
+    
+    async def chunked(request):
+        # Sin Content-Length: el tope se aplica leyendo
+        response = web.StreamResponse(headers={'Content-Type': 'text/html'})
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        for _ in range(50):
+            await response.write(body.encode())
+        return response
+    
+    async def image(request):
+        return web.Response(body=b'\x89PNG', content_type='image/png')
+    
+    server = await _start_page_server({'/len': with_length, '/chunked': chunked, '/img': image})
+    try:
+        async with AsyncHTTPClient(max_bytes=len(body) + 1, content_types=HTML_CONTENT_TYPES) as client:
+            html, status, meta = await client.fetch(str(server.make_url('/len')))
+            assert html == body
+            assert meta['bytes_read'] == len(body)
+            
+            with pytest.raises(ResponseTooLarge):
+                await client.fetch(str(server.make_url('/chunked')))
+            
+            with pytest.raises(UnsupportedContentType):
+                await client.fetch(str(server.make_url('/img')))
+        
+        async with AsyncHTTPClient(max_bytes=100) as client:
+            with pytest.raises(ResponseTooLarge):
+                await client.fetch(str(server.make_url('/len')))
+    finally:
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_fetch_feeds_incremental_parser():
+    from aiohttp import web
+    from scraper.html_parser import SinglePassExtractor
+    
+    body = (
+        '<html><head><meta charset="iso-8859-1"><title>Página</title></head><body>'
+        + '<p>Canción <a href="/x">ñandú</a></p>' * 3000 + '</body></html>'
+    )
+    
+    async def latin1(request):
+        # Charset solo en el <meta>, no en el header
+        return web.Response(body=body.encode('iso-8859-1'), headers={'Content-Type': 'text/html'})
+    
+    server = await _start_page_server({'/': latin1})
+    try:
+        url = str(server.make_url('/'))
+        parser = SinglePassExtractor.parser(url)
+        
+        async with AsyncHTTPClient() as client:
+            html, status, meta = await client.fetch(url, parser=parser, keep_body=False)
+        
+        assert html == ""
+        assert meta['charset'] == 'iso-8859-1'
+        assert parser.close() == parse_html(body, url)
+    finally:
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_fetch_records_phase_timing_and_connection_reuse():
+    import asyncio
+    from aiohttp import web
+    from scraper.async_http import create_session, close_session
+    from common.timing_stats import TimingStats
+    
+    async def slow_first_byte(request):
+        await asyncio.sleep(0.2)
+        response = web.StreamResponse(headers={'Content-Type': 'text/html'})
+        await response.prepare(request)
+        await response.write(b'<html>')
+        await asyncio.sleep(0.1)
+        await response.write(b'</html>')
+        return response
+    
+    async def redirect(request):
+        raise web.HTTPFound('/slow')
+    
+    server = await _start_page_server({'/slow': slow_first_byte, '/redirect': redirect})
+    stats = TimingStats()
+    session = create_session()
+    host = server.make_url('/').raw_authority
+    try:
+        async with AsyncHTTPClient(session=session, timing_stats=stats) as client:
+            _, _, first = await client.fetch(str(server.make_url('/slow')))
+            _, _, second = await client.fetch(str(server.make_url('/redirect')))
+    finally:
+        await close_session(session)
+        await server.close()
+    
+    timing = first['timing']
+    assert timing['traced'] is True
+    assert timing['reused_connection'] is False
+    assert timing['ttfb_ms'] >= 190
+    assert timing['download_ms'] >= 90
+    assert timing['total_ms'] >= timing['ttfb_ms'] + timing['download_ms']
+    assert timing['connect_ms'] > 0
+    
+    # Keep-alive: el segundo fetch no abre conexión nueva
+    assert second['timing']['reused_connection'] is True
+    assert second['timing']['connect_ms'] == 0
+    assert second['timing']['redirects'] == 1
+    
+    domain = stats.stats()['by_domain'][host]
+    assert domain['requests'] == 2
+    assert domain['reused_pct'] == 50.0
+    assert domain['ttfb_p95_ms'] >= 190
+
+
 @pytest.mark.asyncio
 async def test_fetch_simple():
     async with AsyncHTTPClient(timeout=10) as client:
@@ -67,6 +221,75 @@ async def test_fetch_multiple():
             assert status == 200
 
 
+@pytest.mark.asyncio
+async def test_fetch_error_pages_keep_their_status():
+    from aiohttp import web
+    from scraper.async_http import HTML_CONTENT_TYPES
+    
+    async def not_found(request):
+        return web.Response(status=404, text='Not Found', content_type='text/plain')
+    
+    async def server_error(request):
+        return web.json_response({'error': 'x' * 5000}, status=500)
+    
+    server = await _start_page_server({'/404': not_found, '/500': server_error})
+    try:
+        async with AsyncHTTPClient(max_bytes=1000, content_types=HTML_CONTENT_TYPES) as client:
+            # Ni 415 por el tipo ni 413 por el tamaño: el status real del origen
+            text, status, _ = await client.fetch(str(server.make_url('/404')))
+            assert (text, status) == ('Not Found', 404)
+            
+            text, status, meta = await client.fetch(str(server.make_url('/500')))
+            assert status == 500
+            assert len(text) == meta['bytes_read'] == 1000
+            
+            data, status, meta = await client.fetch_bytes(str(server.make_url('/500')))
+            assert status == 500
+            assert len(data) == meta['bytes_read'] == 1000
+    finally:
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_fetch_multiple_uses_fixed_workers():
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    
+    active = peak = 0
+    
+    async def page(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        return web.Response(text=f"<html>{request.match_info['n']}</html>", content_type='text/html')
+    
+    app = web.Application()
+    app.router.add_get('/{n}', page)
+    server = TestServer(app)
+    await server.start_server()
+    urls = [str(server.make_url(f'/{n}')) for n in range(30)] + ['http://127.0.0.1:1/down']
+    
+    try:
+        async with AsyncHTTPClient(timeout=5) as client:
+            fetching = asyncio.create_task(client.fetch_multiple(urls, concurrency=4))
+            await asyncio.sleep(0.01)
+            # 4 workers, no una task por URL
+            workers = [task for task in asyncio.all_tasks()
+                       if task.get_coro().__qualname__ == 'AsyncHTTPClient.fetch_multiple.<locals>.worker']
+            assert len(workers) == 4
+            results = await fetching
+    finally:
+        await server.close()
+    
+    assert list(results) == urls
+    assert peak <= 4
+    assert results[urls[7]][0] == '<html>7</html>'
+    # Una URL caída queda como error y no corta las demás
+    assert results[urls[-1]][0] is None and 'error' in results[urls[-1]][2]
+
+
 @pytest.mark.asyncio
 async def test_fetch_url_helper():
     html, status = await fetch_url('http://example.com')
@@ -195,6 +418,92 @@ def test_parse_text_stats():
     assert stats['word_count'] > 0
 
 
+EDGE_CASES_HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <title> Edge <!--c--> Cases </title>
+    <meta name="description" content="">
+    <meta name="description" content="ignored">
+    <meta name="keywords" content="a, b">
+    <meta property="og:title" content="First">
+    <meta property="og:title" content="Second">
+    <meta name="twitter:card" content="summary">
+    <script>var s = "<a href='/hidden'>no</a>";</script>
+    <style>p { color: red; }</style>
+    <link rel="Canonical" href="/wrong">
+    <link rel="alternate canonical" href="/canonical">
+</head>
+<body>
+    <h1>Main <b>title</b><script>x()</script></h1>
+    <template><p>template</p><a href="/tpl">tpl</a></template>
+    <ruby>漢<rt>kan</rt><rp>(</rp></ruby>
+    <a href>empty</a> <a>AT&amp;T</a> <a href=" #top">top</a>
+    <a href="javascript:void(0)">js</a> <a href="HTTPS://GitHub.com/Org">gh</a>
+    <a href="http://[::1">broken</a>
+    <img src="data:image/png;base64,AAAA"><img><img src=" /logo.png ">
+    <p>unclosed <p>paragraphs<ul><li>item</ul><ol></ol>&nbsp;nbsp&nbsp;
+    <table><tr><td>cell<div>nested</table>
+    <noscript>noscript</noscript><textarea> text </textarea>
+</body>
+</html>trailing"""
+
+
+@pytest.mark.parametrize("html", [
+    EDGE_CASES_HTML,
+    "<body><h2>x</h2><h1> fall <i>back</i> </h1><h1>second</h1></body>",
+    "plain text & more",
+    ""
+])
+def test_single_pass_matches_soup(html):
+    url = 'https://example.com/base/page.html'
+    
+    assert parse_html(html, url, engine='single_pass') == parse_html(html, url, engine='soup')
+
+
+def test_single_pass_incremental_feed():
+    from scraper.html_parser import SinglePassExtractor
+    
+    url = 'https://example.com/'
+    parser = SinglePassExtractor.parser(url)
+    for i in range(0, len(EDGE_CASES_HTML), 7):
+        parser.feed(EDGE_CASES_HTML[i:i + 7])
+    
+    assert parser.close() == parse_html(EDGE_CASES_HTML, url, engine='soup')
+
+
+def _big_html():
+    return "<html><head><title>Big</title></head><body>" + "".join(
+        f'<div class="c"><h2>S{i}</h2><p>Lorem ipsum {i} &amp; más <b>texto</b> '
+        f'<a href="/p{i % 300}">link</a> <a href="https://twitter.com/u{i}">tw</a></p>'
+        f'<img src="/img{i}.jpg"><ul><li>a</li><li>b</li></ul></div>'
+        for i in range(3000)
+    ) + "</body></html>"
+
+
+def test_single_pass_matches_soup_on_big_page():
+    html = _big_html()
+    
+    assert parse_html(html, 'https://example.com', engine='single_pass') == \
+        parse_html(html, 'https://example.com', engine='soup')
+
+
+@pytest.mark.slow
+def test_single_pass_benchmark(capsys):
+    import time
+    
+    html = _big_html()
+    timings = {}
+    for engine in ('soup', 'single_pass'):
+        start = time.perf_counter()
+        parse_html(html, 'https://example.com', engine=engine)
+        timings[engine] = time.perf_counter() - start
+    
+    # Reporte en la salida de pytest (no queda capturado); sin asserts de tiempo
+    with capsys.disabled():
+        print(f"\n{len(html) // 1024} KB - soup: {timings['soup'] * 1000:.0f} ms, "
+              f"single_pass: {timings['single_pass'] * 1000:.0f} ms")
+
+
 # ==================== TESTS DE METADATA EXTRACTOR ====================
 
 def test_extract_basic_metadata():
@@ -324,5 +633,32 @@ async def test_parallel_scraping():
     assert len(parsed_results) == len(urls)
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["thread", "process"])
+async def test_parse_executor_offloads_parsing(kind):
+    from api.parse_executor import ParseExecutor
+    
+    html = "<html><head><title>Offload</title></head><body>" + "<p>texto</p>" * 500 + "</body></html>"
+    executor = ParseExecutor(kind, workers=2)
+    
+    try:
+        results = await asyncio.gather(*[
+            executor.parse(html, f'https://example.com/{i}') for i in range(4)
+        ])
+        
+        scraping_data, metadata, seo = results[0]
+        assert scraping_data['title'] == 'Offload'
+        assert scraping_data['text_stats']['paragraph_count'] == 500
+        assert 'technical' in metadata
+        assert 'score' in seo
+        
+        stats = executor.stats()
+        assert stats['completed'] == 4
+        assert stats['pending'] == 0
+        assert stats['max_pending'] >= 1
+    finally:
+        executor.shutdown()
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
\ No newline at end of file
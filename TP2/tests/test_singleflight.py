@@ -0,0 +1,141 @@
+"""
+Tests de coalescing de scrapes concurrentes.
+"""
+import pytest
+import asyncio
+import json
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from common.singleflight import SingleFlight
+from common.url_utils import normalize_url
+
+
+def test_normalize_url():
+    assert normalize_url('HTTP://Example.COM:80') == 'http://example.com/'
+    assert normalize_url('https://example.com:443/a?b=1#frag') == 'https://example.com/a?b=1'
+    assert normalize_url('https://example.com:8443/a') == 'https://example.com:8443/a'
+    assert normalize_url('https://example.com/a?b=1') != normalize_url('https://example.com/a?b=2')
+
+
+@pytest.mark.asyncio
+async def test_singleflight_runs_work_once():
+    flight = SingleFlight()
+    calls = 0
+    
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return 'result'
+    
+    results = await asyncio.gather(*[flight.do('key', work) for _ in range(50)])
+    
+    assert calls == 1
+    assert all(result == 'result' for result, _ in results)
+    assert sum(shared for _, shared in results) == 49
+    
+    stats = flight.stats()
+    assert stats['leaders'] == 1
+    assert stats['coalesced'] == 49
+    assert stats['in_flight'] == 0
+    
+    # Terminado el vuelo, la siguiente llamada vuelve a ejecutar
+    await flight.do('key', work)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_singleflight_survives_leader_cancellation():
+    flight = SingleFlight()
+    
+    async def work():
+        await asyncio.sleep(0.1)
+        return 42
+    
+    leader = asyncio.create_task(flight.do('key', work))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do('key', work))
+    await asyncio.sleep(0)
+    
+    leader.cancel()
+    
+    assert await follower == (42, True)
+
+
+@pytest.mark.asyncio
+async def test_scrape_handler_coalesces_thundering_herd():
+    from aiohttp import web
+    from aiohttp.test_utils import make_mocked_request
+    from api.handlers import ScrapingHandler
+    from common.cache import get_cache
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    handler = ScrapingHandler(app)
+    calls = 0
+    
+    async def fake_pipeline(url, key, previous=None, on_state=None, on_links=None):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        return {"url": url, "status": "success"}, 200
+    
+    handler._scrape_pipeline = fake_pipeline
+    get_cache().remove('https://herd.example.com/')
+    
+    url = 'https://herd.example.com/?'
+    responses = await asyncio.gather(*[
+        handler.scrape(make_mocked_request('GET', f'/scrape?url={url}&refresh=true', app=app))
+        for _ in range(50)
+    ])
+    
+    assert calls == 1
+    assert all(response.status == 200 for response in responses)
+    assert sum(json.loads(response.text).get('coalesced', False) for response in responses) == 49
+    assert handler.inflight.stats()['coalesced'] == 49
+
+
+@pytest.mark.asyncio
+async def test_coalesced_requests_do_not_spend_tokens_while_leader_waits():
+    from aiohttp import web
+    from aiohttp.test_utils import make_mocked_request
+    from api.handlers import ScrapingHandler
+    from common import rate_limiter as rate_limiter_module
+    
+    previous_limiter = rate_limiter_module._global_limiter
+    limiter = rate_limiter_module.configure_rate_limiter(max_requests=2, window_seconds=1)
+    
+    app = web.Application()
+    app['processing_host'] = '127.0.0.1'
+    app['processing_port'] = 1
+    app['rate_limit_max_wait'] = 5
+    handler = ScrapingHandler(app)
+    calls = 0
+    
+    async def fake_pipeline(url, key, previous=None, on_state=None, on_links=None):
+        nonlocal calls
+        calls += 1
+        return {"url": url, "status": "success"}, 200
+    
+    handler._scrape_pipeline = fake_pipeline
+    url = 'https://drained.example.com/'
+    
+    try:
+        # Bucket vacío: el primero espera ~0.5s su token
+        assert await limiter.acquire(url) and await limiter.acquire(url)
+        responses = await asyncio.gather(*[
+            handler.scrape(make_mocked_request('GET', f'/scrape?url={url}&refresh=true', app=app))
+            for _ in range(20)
+        ])
+    finally:
+        rate_limiter_module._global_limiter = previous_limiter
+    
+    assert [response.status for response in responses] == [200] * 20
+    assert calls == 1
+    # Los 2 de la ráfaga + el del único scrape real
+    assert limiter.stats()['granted'] == 3
+    assert handler.inflight.stats()['coalesced'] == 19